@@ -0,0 +1,46 @@
+"""Helpers shared by the stub GAMMA programs used for offline benchmarking"""
+
+import os
+import sys
+
+
+def read_par(par_file):
+    """Read a GAMMA parameter file into a dict of strings"""
+    params = {}
+    with open(par_file) as f:
+        for line in f:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                params[key.strip()] = value.strip()
+    return params
+
+
+def write_par(par_file, params, header='Gamma DIFF&GEO DEM/MAP parameter file'):
+    """Write a dict to a GAMMA parameter file"""
+    with open(par_file, 'w') as f:
+        f.write('{}\n'.format(header))
+        for key, value in params.items():
+            f.write('{}: {}\n'.format(key, value))
+
+
+def write_raster(raster_file, width, lines, bytes_per_pixel=4, fill=b'\0'):
+    """Write a correctly sized raster, a line at a time"""
+    line = fill * (width * bytes_per_pixel // len(fill))
+    with open(raster_file, 'wb') as f:
+        for _ in range(lines):
+            f.write(line)
+
+
+def copy_file(src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            chunk = fsrc.read(4 * 1024 * 1024)
+            if not chunk:
+                break
+            fdst.write(chunk)
+
+
+def usage(argv, count):
+    if len(argv) < count + 1:
+        sys.stderr.write('ERROR: {} requires {} arguments\n'.format(os.path.basename(argv[0]), count))
+        sys.exit(1)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Benchmark the python-side stages of geocode_sentinel against synthetic granules and stub GAMMA programs"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import synthetic
+
+import hyp3_geocode
+from hyp3_geocode import metrics, sentinel
+from hyp3_geocode.safe import extract_safe
+
+STUB_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+OUTFILE = 'S1A_IW_RT30_20200101T000000_G_gpn'
+
+# The console scripts, and the module of each one's main()
+CONSOLE_SCRIPTS = {
+    'geocode_sentinel.py': 'hyp3_geocode.sentinel',
+    'geocode_sentinel_batch.py': 'hyp3_geocode.batch',
+    'hyp3_geocode': 'hyp3_geocode.__main__',
+}
+STARTUP_RUNS = 5
+
+
+@contextmanager
+def profiled(results, name, nbytes=None):
+    """Record the stage metrics and peak python memory of a benchmark"""
+    metrics.reset()
+    tracemalloc.start()
+    try:
+        with metrics.stage(name):
+            yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # The benchmark's own record comes last, after those of any stages it ran
+        *stages, record = metrics.records()
+        if stages:
+            record['stages'] = stages
+        record['peak_traced_memory'] = peak
+        if nbytes is not None:
+            record['bytes'] = nbytes
+            record['throughput'] = nbytes / record['wall_time'] if record['wall_time'] else None
+        results[name] = record
+        print('{:>32}: {:8.3f} s'.format(name, record['wall_time']))
+
+
+def bench_extraction(results, config):
+    zip_file = synthetic.make_safe('.', mode=config['mode'], measurement_bytes=config['measurement_mb'] * 1024 ** 2)
+    with profiled(results, 'extraction', nbytes=os.path.getsize(zip_file)):
+        safe_dir = extract_safe(zip_file, 'extracted')
+    shutil.rmtree(safe_dir)
+    os.remove(zip_file)
+
+
+def bench_blank_bad_data(results, config):
+    width, lines = config['mli_width'], config['mli_lines']
+    mli = synthetic.make_mli('bench.mgrd', width, lines)
+    with profiled(results, 'blank_bad_data', nbytes=os.path.getsize(mli)):
+        sentinel.blank_bad_data(mli, width, lines, left=20, right=20)
+    os.remove(mli)
+    os.remove('{}.par'.format(mli))
+
+
+def bench_create_dem_par(results, config):
+    area_map = '{}_area_map'.format(OUTFILE)
+    with profiled(results, 'create_dem_par'):
+        sentinel.create_dem_par(area_map, 'float', config['pixel_size'], 36.15, 33.85, -116.85, -120.15, 30.0)
+
+
+def bench_move_products(results, config):
+    tif_bytes = config['mli_width'] * config['mli_lines'] * 4
+    names = ['{}_{}.tif'.format(OUTFILE, pol) for pol in synthetic.POLARIZATION_MODES[config['mode']]]
+    for name in names:
+        with open(name, 'wb') as f:
+            f.truncate(tif_bytes)
+    for name in ('{}.png', '{}_large.png', '{}.kmz', '{}.png.aux.xml', '{}_12345_log.txt'):
+        with open(name.format(OUTFILE), 'wb') as f:
+            f.write(b'\0' * 1024 * 1024)
+
+    with profiled(results, 'move_products', nbytes=tif_bytes * len(names)):
+        sentinel.move_products()
+
+
+def bench_create_xml_files(results, config):
+    synthetic.make_browse_png(os.path.join('PRODUCT', '{}.png'.format(OUTFILE)))
+    synthetic.make_browse_png(os.path.join('PRODUCT', '{}_large.png'.format(OUTFILE)), width=4096, height=3200)
+    if len(synthetic.POLARIZATION_MODES[config['mode']]) > 1:
+        synthetic.make_browse_png(os.path.join('PRODUCT', '{}_rgb.png'.format(OUTFILE)), rgb=True)
+        synthetic.make_browse_png(os.path.join('PRODUCT', '{}_rgb_large.png'.format(OUTFILE)), width=4096,
+                                  height=3200, rgb=True)
+
+    infile = '{}.SAFE'.format(synthetic.granule_name(config['mode']))
+    with profiled(results, 'create_xml_files'):
+        sentinel.create_xml_files(infile, OUTFILE, 0.0, 'GRD', False, config['pixel_size'])
+
+
+def bench_process_pol(results, config):
+    """Run a polarization chain through the stub GAMMA programs, with a synthetic MLI in place of the ingest"""
+    from hyp3lib import ingest_S1_granule as ingest_module
+
+    width, lines, pixel_size = config['mli_width'], config['mli_lines'], config['pixel_size']
+    # An area map about the size of the MLI, so the lookup table and geocoded image are too
+    lat_span = lines * pixel_size / 111320.0
+    lon_span = width * pixel_size / (111320.0 * math.cos(math.radians(35.0)))
+    sentinel.create_dem_par('{}_area_map'.format(OUTFILE), 'float', pixel_size, 35.0 + lat_span / 2,
+                            35.0 - lat_span / 2, -118.0 + lon_span / 2, -118.0 - lon_span / 2, pixel_size)
+    mli = synthetic.make_mli('bench.mgrd', width, lines)
+
+    def ingest_S1_granule(infile, pol, look_fact, mgrd, orbit_file=None):
+        shutil.copy(mli, mgrd)
+        shutil.copy('{}.par'.format(mli), '{}.par'.format(mgrd))
+
+    original = ingest_module.ingest_S1_granule
+    ingest_module.ingest_S1_granule = ingest_S1_granule
+    try:
+        with profiled(results, 'process_pol', nbytes=os.path.getsize(mli)):
+            sentinel.process_pol('vv', 'GRD', '{}.SAFE'.format(synthetic.granule_name(config['mode'])), OUTFILE,
+                                 pixel_size, 0, gamma0_flag=True)
+    finally:
+        ingest_module.ingest_S1_granule = original
+    for name in (mli, '{}.par'.format(mli), '{}_area_map.par'.format(OUTFILE), '{}_vv.tif'.format(OUTFILE)):
+        os.remove(name)
+
+
+def bench_startup(results, config):
+    """Time importing each console script and running it with --version, in a fresh interpreter"""
+    for script, module in CONSOLE_SCRIPTS.items():
+        code = 'import sys; sys.argv = [{!r}, "--version"]; from {} import main; main()'.format(script, module)
+        times = []
+        for _ in range(STARTUP_RUNS):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        name = 'startup_{}'.format(script)
+        # The fastest run is the least disturbed by everything else on the machine
+        results[name] = {'stage': name, 'wall_time': min(times), 'runs': times}
+        print('{:>32}: {:8.3f} s'.format(name, min(times)))
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'extraction': bench_extraction,
+    'blank_bad_data': bench_blank_bad_data,
+    'create_dem_par': bench_create_dem_par,
+    'move_products': bench_move_products,
+    'create_xml_files': bench_create_xml_files,
+    'process_pol': bench_process_pol,
+}
+
+
+def find_regressions(results, baseline, tolerance):
+    """Benchmarks that took more than `tolerance` longer than in `baseline`"""
+    regressions = []
+    for name, record in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['wall_time']:
+            continue
+        ratio = record['wall_time'] / previous['wall_time']
+        if ratio > 1 + tolerance:
+            regressions.append('{}: {:.3f} s vs {:.3f} s in baseline ({:+.0%})'.format(
+                name, record['wall_time'], previous['wall_time'], ratio - 1))
+    return regressions
+
+
+def over_budget(results, budget):
+    """Console scripts that took longer than `budget` seconds to start"""
+    return [
+        '{}: {:.3f} s vs a budget of {:.3f} s'.format(name, record['wall_time'], budget)
+        for name, record in results.items() if name.startswith('startup_') and record['wall_time'] > budget
+    ]
+
+
+def run_benchmarks(config, names=None, workdir=None):
+    """Run the benchmarks in a scratch directory, with the stub GAMMA programs first on the PATH"""
+    path = os.environ.get('PATH', '')
+    os.environ['PATH'] = os.pathsep.join([STUB_BIN, path])
+    back = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix='hyp3_geocode_bench_', dir=workdir)
+    results = {}
+    try:
+        os.chdir(scratch)
+        for name in names or BENCHMARKS:
+            BENCHMARKS[name](results, config)
+    finally:
+        os.chdir(back)
+        shutil.rmtree(scratch)
+        os.environ['PATH'] = path
+    return results
+
+
+def main():
+    """Main entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run: {} (default all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('-m', '--mode', choices=synthetic.POLARIZATION_MODES, default='DV',
+                        help='Polarization mode of the synthetic granule')
+    parser.add_argument('--measurement-mb', type=int, default=256,
+                        help='Size of each synthetic measurement TIFF in MB')
+    parser.add_argument('--mli-width', type=int, default=8000, help='Width of the synthetic MLI')
+    parser.add_argument('--mli-lines', type=int, default=6000, help='Lines of the synthetic MLI')
+    parser.add_argument('-s', '--pixel-size', type=float, default=30.0, help='Output pixel size')
+    parser.add_argument('-w', '--workdir', help='Directory to create the scratch directory in')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='File to save the results to')
+    parser.add_argument('-b', '--baseline', help='Results of a previous run to check for regressions against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='Allowed slow down relative to the baseline (default 0.2, i.e., 20%%)')
+    parser.add_argument('--startup-budget', type=float, default=0.5,
+                        help='Longest each console script may take to start, in seconds (default 0.5)')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('Unknown benchmark {}'.format(name))
+
+    config = {
+        'mode': args.mode,
+        'measurement_mb': args.measurement_mb,
+        'mli_width': args.mli_width,
+        'mli_lines': args.mli_lines,
+        'pixel_size': args.pixel_size,
+    }
+    results = run_benchmarks(config, names=args.benchmarks, workdir=args.workdir)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'hyp3_geocode': getattr(hyp3_geocode, '__version__', None),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'config': config,
+            'results': results,
+        }, f, indent=2)
+    print('Results saved to {}'.format(args.output))
+
+    failed = False
+    slow_starts = over_budget(results, args.startup_budget)
+    if slow_starts:
+        print('Startup over budget:\n  ' + '\n  '.join(slow_starts))
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print('Throughput regressions:\n  ' + '\n  '.join(regressions))
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Synthetic Sentinel-1 granules and rasters for offline benchmarking"""
+
+import os
+import struct
+import zipfile
+import zlib
+
+import numpy as np
+
+POLARIZATION_MODES = {
+    'SV': ['vv'],
+    'DV': ['vv', 'vh'],
+    'SH': ['hh'],
+    'DH': ['hh', 'hv'],
+}
+
+ANNOTATION = '''<?xml version="1.0" encoding="UTF-8"?>
+<product>
+  <adsHeader><polarisation>{pol}</polarisation></adsHeader>
+  <geolocationGrid><geolocationGridPointList count="4">
+{points}
+  </geolocationGridPointList></geolocationGrid>
+</product>
+'''
+
+GRID_POINT = '''    <geolocationGridPoint>
+      <azimuthTime>2020-01-01T00:00:00.000000</azimuthTime>
+      <slantRangeTime>5.3e-03</slantRangeTime>
+      <line>{line}</line>
+      <pixel>{pixel}</pixel>
+      <latitude>{lat}</latitude>
+      <longitude>{lon}</longitude>
+      <height>0</height>
+    </geolocationGridPoint>'''
+
+
+def granule_name(mode='DV', granule_type='GRD'):
+    product = 'GRDH' if granule_type == 'GRD' else 'SLC_'
+    return 'S1A_IW_{}_1S{}_20200101T000000_20200101T000025_030000_037000_ABCD'.format(product, mode)
+
+
+def _annotation(pol, lat=(34.0, 36.0), lon=(-120.0, -117.0)):
+    corners = [(0, 0, lat[0], lon[0]), (0, 9999, lat[0], lon[1]), (9999, 0, lat[1], lon[0]),
+               (9999, 9999, lat[1], lon[1])]
+    points = '\n'.join(GRID_POINT.format(line=line, pixel=pixel, lat=la, lon=lo) for line, pixel, la, lo in corners)
+    return ANNOTATION.format(pol=pol.upper(), points=points)
+
+
+def safe_members(mode='DV', granule_type='GRD', measurement_bytes=1024 * 1024, seed=0):
+    """Yield (name, content) of the members of a synthetic SAFE
+
+    Measurements are incompressible random bytes, so zip and extraction costs match real GeoTIFFs.
+    """
+    rng = np.random.default_rng(seed)
+    granule = granule_name(mode, granule_type)
+    safe_dir = '{}.SAFE'.format(granule)
+    yield '{}/manifest.safe'.format(safe_dir), b'<xfdu:XFDU/>\n'
+    yield '{}/preview/quick-look.png'.format(safe_dir), rng.bytes(64 * 1024)
+    yield '{}/preview/map-overlay.kml'.format(safe_dir), b'<kml/>\n'
+    yield '{}/support/s1-level-1-product.xsd'.format(safe_dir), b'<xsd/>\n' * 1024
+
+    for pol in POLARIZATION_MODES[mode]:
+        name = 's1a-iw-{}-{}-20200101t000000-20200101t000025-030000-037000-001'.format(granule_type.lower(), pol)
+        annotation = _annotation(pol).encode('utf-8')
+        yield '{}/annotation/{}.xml'.format(safe_dir, name), annotation
+        yield '{}/annotation/calibration/calibration-{}.xml'.format(safe_dir, name), b'<calibration/>\n' * 4096
+        yield '{}/annotation/calibration/noise-{}.xml'.format(safe_dir, name), b'<noise/>\n' * 4096
+        yield '{}/measurement/{}.tiff'.format(safe_dir, name), rng.bytes(measurement_bytes)
+
+
+def make_safe(dest, mode='DV', granule_type='GRD', measurement_bytes=1024 * 1024, as_zip=True):
+    """Write a synthetic SAFE directory, or zip, to `dest` and return its path"""
+    granule = granule_name(mode, granule_type)
+    members = safe_members(mode, granule_type, measurement_bytes)
+    if as_zip:
+        zip_file = os.path.join(dest, '{}.zip'.format(granule))
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_STORED) as zf:
+            for name, content in members:
+                zf.writestr(name, content)
+        return zip_file
+
+    for name, content in members:
+        path = os.path.join(dest, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+    return os.path.join(dest, '{}.SAFE'.format(granule))
+
+
+def make_mli(mli_file, width, lines, border=200, seed=0):
+    """Write a big-endian float32 MLI with ragged zero borders, and its parameter file"""
+    rng = np.random.default_rng(seed)
+    raster = np.memmap(mli_file, dtype='>f4', mode='w+', shape=(lines, width))
+    for start in range(0, lines, 1024):
+        block = rng.random((min(1024, lines - start), width), dtype=np.float32) + 0.01
+        left = rng.integers(0, border, block.shape[0])
+        right = width - rng.integers(0, border, block.shape[0])
+        columns = np.arange(width)
+        block[(columns < left[:, np.newaxis]) | (columns >= right[:, np.newaxis])] = 0
+        raster[start:start + block.shape[0]] = block
+    raster.flush()
+    del raster
+
+    with open('{}.par'.format(mli_file), 'w') as f:
+        f.write('Gamma Interferometric SAR Processor (ISP) - Image Parameter File\n\n')
+        f.write('title:     S1A-IW-GRD-VV\n')
+        f.write('image_format:               FLOAT\n')
+        f.write('range_samples:              {}\n'.format(width))
+        f.write('azimuth_lines:              {}\n'.format(lines))
+    return mli_file
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def make_browse_png(png_file, width=2048, height=1600, rgb=False, seed=0):
+    """Write a browse PNG like the ones `makeAsfBrowse` creates"""
+    rng = np.random.default_rng(seed)
+    shape = (height, width, 3) if rgb else (height, width)
+    pixels = rng.integers(0, 256, shape, dtype=np.uint8).reshape(height, -1)
+    # Each scanline starts with its filter type (0, none)
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels])
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2 if rgb else 0, 0, 0, 0)
+    with open(png_file, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', header))
+        f.write(_png_chunk(b'IDAT', zlib.compress(scanlines.tobytes())))
+        f.write(_png_chunk(b'IEND', b''))
+    return png_file
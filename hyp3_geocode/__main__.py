@@ -2,34 +2,29 @@
 geocode processing for HyP3
 """
 
+import argparse
 import os
 import shutil
 from datetime import datetime
 
-from hyp3lib import GranuleError
-from hyp3lib.metadata import add_esa_citation
-from hyp3proclib import (
-    add_browse,
-    build_output_name,
-    clip_tiffs_to_roi,
-    execute,
-    extra_arg_is,
-    failure,
-    find_browses,
-    get_extra_arg,
-    process,
-    record_metrics,
-    success,
-    unzip,
-    upload_product,
-    zip_dir
-)
-from hyp3proclib.db import get_db_connection
-from hyp3proclib.file_system import cleanup_workdir
-from hyp3proclib.logger import log
-from hyp3proclib.proc_base import Processor
-
 import hyp3_geocode
+from hyp3_geocode import metrics
+from hyp3_geocode.db import ConnectionPool
+from hyp3_geocode.granule_cache import GranuleCache
+from hyp3_geocode.product_cache import ProductCache, product_key, product_parameters
+
+# NOTE: hyp3proclib (with its database and upload clients) and hyp3lib are imported by the functions that use them,
+#  so the worker starts up, e.g., for --version, without loading them
+
+
+class _ProclibLog:
+    """hyp3proclib's logger, imported on first use"""
+    def __getattr__(self, name):
+        from hyp3proclib.logger import log as proclib_log
+        return getattr(proclib_log, name)
+
+
+log = _ProclibLog()
 
 
 def find_png(dir_):
@@ -92,7 +87,61 @@ def find_product(dir_):
     return None
 
 
+def connect_hyp3_db():
+    from hyp3proclib.db import get_db_connection
+
+    return get_db_connection('hyp3-db')
+
+
+# Created before the workers are forked, so the pool's size bounds the connections of the whole node
+_db_pool = None
+
+
+def init_db_pool():
+    """Create the pool of hyp3 database connections, of `GEOCODE_DB_POOL_SIZE` (default 2) connections"""
+    global _db_pool
+    _db_pool = ConnectionPool(connect_hyp3_db, max_size=int(os.environ.get('GEOCODE_DB_POOL_SIZE', 2)))
+
+
+def db_connection():
+    """Check out a connection to the hyp3 database from the node's pool"""
+    if _db_pool is None:
+        init_db_pool()
+    return _db_pool.connection()
+
+
+def subscription_roi(cfg, conn):
+    """Lat/lon bounds (west, south, east, north) of the job's subscription area, or None if it doesn't have one"""
+    from hyp3proclib.db import query_database
+
+    if not cfg.get('sub_id'):
+        return None
+    rows = query_database(
+        conn,
+        'SELECT ST_XMin(location::geometry), ST_YMin(location::geometry), '
+        'ST_XMax(location::geometry), ST_YMax(location::geometry) FROM subscriptions WHERE id = %(sub_id)s',
+        {'sub_id': cfg['sub_id']}
+    )
+    if not rows or None in rows[0]:
+        return None
+    return [float(bound) for bound in rows[0]]
+
+
+def granule_cache():
+    """The node's cache of granule zips in `GEOCODE_GRANULE_CACHE`, if it's set
+
+    `GEOCODE_GRANULE_CACHE_GB` bounds its size (default unbounded).
+    """
+    cache_dir = os.environ.get('GEOCODE_GRANULE_CACHE')
+    if not cache_dir:
+        return None
+    max_gb = os.environ.get('GEOCODE_GRANULE_CACHE_GB')
+    return GranuleCache(cache_dir, max_bytes=None if not max_gb else int(float(max_gb) * 1024 ** 3))
+
+
 def download(cfg, granule):
+    from hyp3proclib import execute, unzip
+
     if granule.startswith('S1'):
         if 'GRD' in granule:
             typ = "GRD"
@@ -103,8 +152,23 @@ def download(cfg, granule):
     else:
         typ = "l0"
 
+    command = "get_asf.py --{typ} --dir={dir} {granule}".format(typ=typ, dir=cfg['workdir'], granule=granule)
+    cache = granule_cache()
+    if cache is not None and granule.startswith('S1'):
+        # Concurrent jobs for the same granule wait for one download, and later ones link the cached zip. The zip is
+        #  only cached once it's been extracted, and a cached zip that fails to extract is evicted
+        zip_file = os.path.join(cfg['workdir'], granule + '.zip')
+        with cache.lookup(granule, zip_file) as hit:
+            with metrics.stage('download', granule_cache='hit' if hit else 'miss'):
+                if not hit:
+                    log.info('Downloading {granule} with get_asf.py'.format(granule=granule))
+                    execute(cfg, command)
+            unzip_safe(cfg, granule, zip_file)
+        return granule
+
     log.info('Downloading {granule} with get_asf.py'.format(granule=granule))
-    execute(cfg, "get_asf.py --{typ} --dir={dir} {granule}".format(typ=typ, dir=cfg['workdir'], granule=granule))
+    with metrics.stage('download'):
+        execute(cfg, command)
 
     if 'GRD' in granule or 'SLC' in granule:
         zip_file = os.path.join(cfg['workdir'], granule + '.zip')
@@ -116,34 +180,109 @@ def download(cfg, granule):
             log.info('Nothing found for {granule}'.format(granule=granule))
             return granule
 
+    if granule.startswith('S1'):
+        unzip_safe(cfg, granule, zip_file)
+        return granule
+
     if not os.path.isfile(zip_file):
         raise Exception('Could not find expected download file: ' + zip_file)
 
     log.info('Download complete')
     log.info('Unzipping ' + zip_file)
+    with metrics.stage('unzip'):
+        unzip(zip_file, cfg['workdir'])
+    log.info('Unzip completed.')
 
-    unzip(zip_file, cfg['workdir'])
+    return granule
 
-    if granule.startswith('S1'):
-        safe_file = os.path.join(cfg['workdir'], '{granule}.SAFE'.format(granule=granule))
-        if not os.path.isdir(safe_file):
-            raise Exception('Failed to unzip, SAFE directory not found: {safe_file}'.format(safe_file=safe_file))
+
+def unzip_safe(cfg, granule, zip_file):
+    """Extract the parts of a downloaded Sentinel-1 granule zip that are processed into the work directory"""
+    from hyp3_geocode.safe import extract_safe
+
+    if not os.path.isfile(zip_file):
+        raise Exception('Could not find expected download file: ' + zip_file)
+
+    log.info('Download complete')
+    log.info('Unzipping ' + zip_file)
+
+    # Only the manifest, annotations, and measurements of the processed polarizations are needed
+    with metrics.stage('unzip'):
+        extract_safe(zip_file, cfg['workdir'])
+    safe_file = os.path.join(cfg['workdir'], '{granule}.SAFE'.format(granule=granule))
+    if not os.path.isdir(safe_file):
+        raise Exception('Failed to unzip, SAFE directory not found: {safe_file}'.format(safe_file=safe_file))
 
     log.info('Unzip completed.')
 
-    return granule
+
+def product_cache():
+    """The node's cache of unclipped products in `GEOCODE_PRODUCT_CACHE`, if it's set
+
+    `GEOCODE_PRODUCT_CACHE_GB` bounds its size (default unbounded).
+    """
+    cache_dir = os.environ.get('GEOCODE_PRODUCT_CACHE')
+    if not cache_dir:
+        return None
+    max_gb = os.environ.get('GEOCODE_PRODUCT_CACHE_GB')
+    return ProductCache(cache_dir, max_bytes=None if not max_gb else int(float(max_gb) * 1024 ** 3))
+
+
+def geocode_granule(cfg, granule, args):
+    """Download a Sentinel-1 granule and run geocode_sentinel.py on it, making PRODUCT in the work directory"""
+    from hyp3proclib import process
+
+    download(cfg, granule)
+
+    # geocode_sentinel.py writes its stage metrics next to its products, even when it fails; they're merged with this
+    #  job's, but aren't shipped in the product
+    metrics_file = os.path.join(cfg['workdir'], metrics.metrics_file_name(args[-1]))
+    try:
+        with metrics.stage('geocode'):
+            process(cfg, 'geocode_sentinel.py', args)
+    finally:
+        if os.path.isfile(metrics_file):
+            metrics.add_records(metrics.read_metrics(metrics_file))
+            os.remove(metrics_file)
+
+    # Neither the granule nor its SAFE are needed to clip and package the products
+    shutil.rmtree(os.path.join(cfg['workdir'], granule + '.SAFE'), ignore_errors=True)
+    granule_zip = os.path.join(cfg['workdir'], granule + '.zip')
+    if os.path.isfile(granule_zip):
+        os.remove(granule_zip)
 
 
 def process_geocode_gamma(cfg, n):
+    from hyp3lib import GranuleError
+    from hyp3lib.metadata import add_esa_citation
+    from hyp3proclib import (
+        add_browse,
+        build_output_name,
+        clip_tiffs_to_roi,
+        extra_arg_is,
+        failure,
+        find_browses,
+        get_extra_arg,
+        record_metrics,
+        success,
+        upload_product
+    )
+    from hyp3proclib.file_system import cleanup_workdir
+
+    from hyp3_geocode.artifacts import ArtifactManifest
+    from hyp3_geocode.packaging import zip_product
+
+    metrics.reset()
+    metrics_recorded = False
     try:
         log.info('Processing GAMMA Geocode "{}" for "{}"'.format(cfg["sub_name"], cfg["username"]))
 
         in_granule = cfg['granule']
 
         cfg['log'] = "Processing started at {}\n\n".format(datetime.now())
-        g = download(cfg, in_granule)
 
         if in_granule.startswith('S1'):
+            g = in_granule
 
             if 'RAW' in g:
                 raise Exception('Sentinel RAW data is not supported: ' + in_granule)
@@ -153,33 +292,88 @@ def process_geocode_gamma(cfg, n):
 
             hi_res = extra_arg_is(cfg, 'resolution', '10m')
             if hi_res:
-                args = ['-s', '10']
+                pixel_size = 10
                 opts_str = '-10m'
             else:
-                args = ['-s', '30']
+                pixel_size = 30
                 opts_str = '-30m'
+            args = ['-s', str(pixel_size)]
 
             args += ['-p', '30']
 
             height = get_extra_arg(cfg, 'height', '0')
             args += ['-t', height]
 
+            cog = extra_arg_is(cfg, 'cog', 'true')
+            if cog:
+                args += ['--cog']
+
+            # Intermediates can go on faster (or smaller) local storage than the work directory
+            if os.environ.get('GEOCODE_INTERMEDIATE_DIR'):
+                args += ['--scratch-dir', os.environ['GEOCODE_INTERMEDIATE_DIR']]
+
+            # NOTE: cached products are of the whole granule, so they can be clipped to any subscription's area
+            cache = product_cache()
+            if cache is None:
+                # Only geocode the subscription area; the products are still clipped to it exactly afterwards
+                try:
+                    with db_connection() as conn:
+                        roi = subscription_roi(cfg, conn)
+                # NOTE: without the subscription area, the whole granule is geocoded as before
+                except Exception:  # noqa: B902
+                    log.warning('Could not look up the subscription area; geocoding the whole granule', exc_info=True)
+                    roi = None
+                if roi is not None:
+                    args += ['--roi'] + [str(bound) for bound in roi]
+
             out_name = build_output_name(g, cfg['workdir'], opts_str + cfg['suffix'])
             log.info('Output name: {out_name}'.format(out_name=out_name))
 
             args += [g + '.SAFE', out_name]
 
-            process(cfg, 'geocode_sentinel.py', args)
+            if cache is None:
+                geocode_granule(cfg, g, args)
+            else:
+                # NOTE: cached products are renamed after this job's output name
+                parameters = product_parameters(g, pixel_size, height, post=30, cog=cog)
+                with cache.lookup(product_key(parameters), os.path.join(cfg['workdir'], 'PRODUCT'),
+                                  os.path.basename(out_name), parameters=parameters) as hit:
+                    if not hit:
+                        geocode_granule(cfg, g, args)
+                metrics.add_records([{'stage': 'product_cache', 'hit': hit}])
+                if hit:
+                    # The cached product's stage metrics are of the run that made it, not this job
+                    cached_metrics = os.path.join(cfg['workdir'], 'PRODUCT',
+                                                  '{}_metrics.json'.format(os.path.basename(out_name)))
+                    if os.path.isfile(cached_metrics):
+                        os.remove(cached_metrics)
 
         else:
+            download(cfg, in_granule)
             raise Exception('Unrecognized: '+in_granule)
 
-        product = find_product(cfg['workdir'])
+        # geocode_sentinel.py creates PRODUCT in the work directory; only search for it if it's somewhere else
+        product = os.path.join(cfg['workdir'], 'PRODUCT')
         if not os.path.isdir(product):
+            product = find_product(cfg['workdir'])
+        if product is None or not os.path.isdir(product):
             log.info('PRODUCT directory not found: {product}'.format(product=product))
             log.error('Processing failed')
             raise Exception("Processing failed: PRODUCT directory not found")
 
+        # Merge the per-stage metrics of geocode_sentinel.py, but don't ship them in the product
+        metrics_file = os.path.join(product, '{}_metrics.json'.format(os.path.basename(out_name)))
+        if os.path.isfile(metrics_file):
+            metrics.add_records(metrics.read_metrics(metrics_file))
+            os.remove(metrics_file)
+
+        # The artifact manifest lists the products, so the product directory doesn't need to be searched
+        manifest_file = os.path.join(product, '{}_artifacts.json'.format(os.path.basename(out_name)))
+        manifest = None
+        if os.path.isfile(manifest_file):
+            manifest = ArtifactManifest.read(manifest_file)
+            os.remove(manifest_file)
+
         out_path = os.path.join(cfg['workdir'], out_name)
         log.info('Output path: ' + out_path)
 
@@ -190,54 +384,153 @@ def process_geocode_gamma(cfg, n):
             os.unlink(zip_file)
         cfg['out_path'] = out_path
 
-        with get_db_connection('hyp3-db') as conn:
-            clip_tiffs_to_roi(cfg, conn, product)
+        # NOTE: a database connection is only checked out for the calls that need one, not the file operations
+        with db_connection() as conn:
+            with metrics.stage('clip'):
+                clip_tiffs_to_roi(cfg, conn, product)
 
-            log.debug('Renaming '+product+' to '+out_path)
-            os.rename(product, out_path)
+        log.debug('Renaming '+product+' to '+out_path)
+        os.rename(product, out_path)
 
+        if manifest is not None and manifest.browse() is not None:
+            browse_path = os.path.join(out_path, manifest.browse())
+            log.info('Browse image: ' + browse_path)
+        else:
             browse_path = find_png(out_path)
-            cfg['attachment'] = browse_path
-            add_browse(cfg, 'LOW-RES', browse_path)
+        cfg['attachment'] = browse_path
+        add_browse(cfg, 'LOW-RES', browse_path)
 
-            find_browses(cfg, out_path)
+        find_browses(cfg, out_path)
 
-            try:
-                add_esa_citation(in_granule, out_path)
-            except GranuleError:
-                log.debug('Could not add ESA citation', exc_info=True)
+        try:
+            add_esa_citation(in_granule, out_path)
+        except GranuleError:
+            log.debug('Could not add ESA citation', exc_info=True)
 
-            zip_dir(out_path, zip_file)
+        with metrics.stage('zip'):
+            zip_product(out_path, zip_file)
 
-            cfg['final_product_size'] = [os.stat(zip_file).st_size, ]
-            cfg['original_product_size'] = 0
+        cfg['final_product_size'] = [os.stat(zip_file).st_size, ]
+        cfg['original_product_size'] = 0
 
-            record_metrics(cfg, conn)
-            if 'lag' in cfg and 'email_text' in cfg:
-                cfg['email_text'] += "\nYou are receiving this product {} after it was acquired.".format(cfg['lag'])
+        if 'lag' in cfg and 'email_text' in cfg:
+            cfg['email_text'] += "\nYou are receiving this product {} after it was acquired.".format(cfg['lag'])
+
+        # upload_product records the product in the database as part of the upload
+        with db_connection() as conn:
+            with metrics.stage('upload'):
+                upload_product(zip_file, cfg, conn, browse_path=browse_path)
 
-            upload_product(zip_file, cfg, conn, browse_path=browse_path)
+        # NOTE: recorded after the upload so the upload stage is included
+        cfg['stage_metrics'] = metrics.records()
+        with db_connection() as conn:
+            record_metrics(cfg, conn)
+            metrics_recorded = True
             success(conn, cfg)
 
+        succeeded = True
+
     except Exception as e:
         log.exception('Processing failed')
+
+        # The stage metrics of failed jobs are recorded too, up to the stage that failed
+        if not metrics_recorded:
+            cfg['stage_metrics'] = metrics.records()
+            try:
+                with db_connection() as conn:
+                    record_metrics(cfg, conn)
+            except Exception:  # noqa: B902
+                log.warning('Could not record the stage metrics', exc_info=True)
+
         log.info('Notifying user')
 
         failure(cfg, str(e))
+        succeeded = False
 
     cleanup_workdir(cfg)
 
     log.info('Done')
+    return succeeded
+
+
+def job_config(job):
+    """The `cfg` of a job claimed from the intake table, with the job and user fields hyp3proclib's Processor sets
+
+    Args:
+        job: the job's row of `GEOCODE_INTAKE_TABLE`, which has the columns of hyp3's `local_queue`
+    """
+    from hyp3proclib.db import query_database
+
+    cfg = {
+        'proc_name': 'geocode_gamma',
+        'id': job['id'],
+        'granule': job['granule'],
+        'sub_id': job.get('sub_id', job.get('subscription_id')),
+        'user_id': job.get('user_id'),
+        'extra_arguments': job.get('extra_arguments') or '',
+        'priority': job.get('priority'),
+        'sub_name': None,
+        'suffix': '',
+    }
+    with db_connection() as conn:
+        rows = query_database(conn, 'SELECT username, email FROM users WHERE id = %(user_id)s',
+                              {'user_id': cfg['user_id']})
+        if rows:
+            cfg['username'], cfg['email'] = rows[0]
+        if cfg['sub_id']:
+            rows = query_database(conn, 'SELECT name FROM subscriptions WHERE id = %(sub_id)s',
+                                  {'sub_id': cfg['sub_id']})
+            if rows:
+                cfg['sub_name'] = rows[0][0]
+    cfg.setdefault('username', None)
+    cfg.setdefault('email', None)
+    return cfg
+
+
+def intake_jobs(admission, max_jobs):
+    """Claim jobs from `GEOCODE_INTAKE_TABLE` in batches, instead of polling for one at a time"""
+    import threading
+
+    from hyp3_geocode.intake import Intake, JobQueue, listen
+    from hyp3_geocode.worker import run_intake
+
+    queue = JobQueue(connect_hyp3_db, 'geocode_gamma', table=os.environ['GEOCODE_INTAKE_TABLE'])
+    intake = Intake(queue, batch_size=int(os.environ.get('GEOCODE_INTAKE_BATCH', 0)) or max_jobs)
+
+    # Wake up as soon as jobs are queued, rather than at the next claim
+    channel = os.environ.get('GEOCODE_INTAKE_CHANNEL')
+    if channel:
+        listener = threading.Thread(target=listen, args=(connect_hyp3_db, channel, intake, admission.shutdown))
+        listener.daemon = True
+        listener.start()
+
+    run_intake(intake, admission, max_jobs, 'geocode_gamma', process_geocode_gamma,
+               workdir=os.environ.get('GEOCODE_SCRATCH_DIR', '.'), configure=job_config)
 
 
 def main():
     """
     Main entrypoint for hyp3_geocode
     """
-    processor = Processor(
-        'geocode_gamma', process_geocode_gamma, sleep_time=3, sci_version=hyp3_geocode.__version__
+    # The rest of the arguments (and --help) are handled by hyp3proclib's Processor
+    parser = argparse.ArgumentParser(prog='hyp3_geocode', add_help=False)
+    parser.add_argument('--version', action='version', version='%(prog)s {}'.format(hyp3_geocode.__version__))
+    parser.parse_known_args()
+
+    from hyp3_geocode.worker import Admission, JobBudget, run_workers
+
+    init_db_pool()
+    admission = Admission(JobBudget.from_environment(), scratch_dir=os.environ.get('GEOCODE_SCRATCH_DIR', '.'))
+    max_jobs = int(os.environ.get('GEOCODE_MAX_JOBS', 0)) or admission.max_jobs()
+
+    if os.environ.get('GEOCODE_INTAKE_TABLE'):
+        intake_jobs(admission, max_jobs)
+        return
+
+    run_workers(
+        admission, max_jobs, 'geocode_gamma', process_geocode_gamma, sleep_time=3,
+        sci_version=hyp3_geocode.__version__
     )
-    processor.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+"""Typed manifest of the products geocode_sentinel creates"""
+
+import json
+import os
+
+POLARIZATIONS = ('vv', 'vh', 'hh', 'hv')
+
+
+class Artifact:
+    """A product file
+
+    Args:
+        role: what the file is; one of 'geotiff', 'browse', 'rgb_browse', 'kmz', 'metadata', 'aux', 'log',
+            or 'other'
+        path: path of the file, relative to the product directory
+        pol: the polarization of the file, if it has one
+        resolution: the pixel size (e.g., '30m') of rasters, or 'low' or 'medium' for browse images
+    """
+    def __init__(self, role, path, pol=None, resolution=None):
+        self.role = role
+        self.path = path
+        self.pol = pol
+        self.resolution = resolution
+
+    def to_dict(self):
+        return {'role': self.role, 'path': self.path, 'pol': self.pol, 'resolution': self.resolution}
+
+    def __eq__(self, other):
+        return isinstance(other, Artifact) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return 'Artifact({role!r}, {path!r}, pol={pol!r}, resolution={resolution!r})'.format(**self.to_dict())
+
+
+def _polarization(name):
+    stem = name.split('.')[0].lower()
+    for pol in POLARIZATIONS:
+        if stem.endswith('_{}'.format(pol)):
+            return pol
+    return None
+
+
+def classify(name, pixel_size=None):
+    """The `Artifact` for the product file `name`"""
+    resolution = None if pixel_size is None else '{}m'.format(int(pixel_size))
+    if name.endswith('.png.aux.xml'):
+        return Artifact('aux', name)
+    if name.endswith('.xml'):
+        return Artifact('metadata', name, pol=_polarization(name))
+    if name.endswith('.tif'):
+        return Artifact('geotiff', name, pol=_polarization(name), resolution=resolution)
+    if name.endswith('.png'):
+        role = 'rgb_browse' if '_rgb' in name else 'browse'
+        return Artifact(role, name, resolution='medium' if '_large' in name else 'low')
+    if name.endswith('.kmz'):
+        return Artifact('kmz', name)
+    if name.endswith('_log.txt'):
+        return Artifact('log', name)
+    return Artifact('other', name)
+
+
+class ArtifactManifest:
+    """The artifacts in a product directory"""
+    def __init__(self, artifacts=()):
+        self.artifacts = list(artifacts)
+
+    @classmethod
+    def from_directory(cls, product_dir, pixel_size=None, exclude=()):
+        """Classify the files in `product_dir` (in one listing, without walking any subdirectories)"""
+        names = sorted(
+            entry.name for entry in os.scandir(product_dir) if entry.is_file() and entry.name not in exclude
+        )
+        return cls(classify(name, pixel_size) for name in names)
+
+    @classmethod
+    def read(cls, manifest_file):
+        with open(manifest_file) as f:
+            return cls(Artifact(**artifact) for artifact in json.load(f)['artifacts'])
+
+    def write(self, manifest_file):
+        with open(manifest_file, 'w') as f:
+            json.dump({'artifacts': [artifact.to_dict() for artifact in self.artifacts]}, f, indent=2)
+
+    def find(self, role, pol=None, resolution=None):
+        """The artifacts with `role`, and `pol` and `resolution` if given"""
+        return [
+            artifact for artifact in self.artifacts
+            if artifact.role == role
+            and (pol is None or artifact.pol == pol)
+            and (resolution is None or artifact.resolution == resolution)
+        ]
+
+    def browse(self):
+        """The low resolution browse image, preferring the color one; None if there isn't one"""
+        for role in ('rgb_browse', 'browse'):
+            browses = self.find(role, resolution='low')
+            if browses:
+                return browses[0].path
+        return None
+
+
+def manifest_file_name(outfile):
+    """Name of the artifact manifest of `outfile`"""
+    return os.path.join('PRODUCT', '{}_artifacts.json'.format(os.path.basename(outfile)))
@@ -0,0 +1,193 @@
+"""Geocode many Sentinel-1 granules with one pool of processes
+
+Each line of the granule list is an input zip file or SAFE directory, an output name, and any of the per granule
+options below, e.g.:
+
+    S1A_IW_GRDH_1SDV_20200101T000000_20200101T000025_030000_037000_ABCD.zip S1A_IW_RT30_20200101T000000_G_gpn -t 250
+
+Blank lines and lines starting with # are ignored. Each granule is processed in its own directory under the work
+directory.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shlex
+import sys
+import time
+
+import hyp3_geocode
+from hyp3_geocode import metrics, sentinel
+
+
+def item_parser():
+    """Parser for the options of each granule in the list"""
+    parser = argparse.ArgumentParser(prog='granule list entry', add_help=False)
+    parser.add_argument("infile")
+    parser.add_argument("outfile")
+    parser.add_argument("-t", "--terrain_height", type=float, default=0.0)
+    parser.add_argument("-s", "--pixel_size", type=float, default=30.0)
+    parser.add_argument("-p", "--post", type=float)
+    parser.add_argument("-g", "--gamma0", action="store_true")
+    parser.add_argument("-o", "--offset")
+    parser.add_argument("--resume", action="store_true")
+    return parser
+
+
+class BatchItemError(ValueError):
+    """Raised when an entry of a granule list can't be parsed"""
+
+
+def parse_items(lines):
+    """Parse the entries of a granule list into `geocode_sentinel` arguments"""
+    parser = item_parser()
+    items = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(line))
+        except (SystemExit, ValueError):
+            raise BatchItemError('Line {}: could not parse "{}"'.format(number, line))
+        items.append({
+            'infile': os.path.abspath(args.infile),
+            'outfile': os.path.basename(args.outfile),
+            'height': args.terrain_height,
+            'pixel_size': args.pixel_size,
+            'post': args.post,
+            'gamma0_flag': args.gamma0,
+            'offset': None if args.offset is None else os.path.abspath(args.offset),
+            'resume': args.resume,
+        })
+    return items
+
+
+def _log_to(log_file):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%m/%d/%Y %I:%M:%S %p'))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def run_item(item, workdir, lut_cache_dir=None, lut_cache_size=None, scratch_dir=None):
+    """Geocode one granule of the list in its own directory, and summarize how it went"""
+    item_dir = os.path.abspath(os.path.join(workdir, item['outfile']))
+    os.makedirs(item_dir, exist_ok=True)
+    result = {'infile': item['infile'], 'outfile': item['outfile'], 'workdir': item_dir}
+
+    back = os.getcwd()
+    start = time.perf_counter()
+    try:
+        os.chdir(item_dir)
+        _log_to("{}_{}_log.txt".format(item['outfile'], os.getpid()))
+        logging.info("Starting run")
+        metrics.reset()
+        sentinel.geocode_sentinel(
+            item['infile'], item['outfile'], pixel_size=item['pixel_size'], height=item['height'],
+            gamma0_flag=item['gamma0_flag'], post=item['post'], offset=item['offset'],
+            lut_cache_dir=lut_cache_dir, lut_cache_size=lut_cache_size, resume=item['resume'], scratch_dir=scratch_dir
+        )
+        result['status'] = 'succeeded'
+    # NOTE: one granule failing, however it fails, shouldn't stop the batch
+    except (Exception, SystemExit) as e:  # noqa: B902
+        logging.exception('Processing failed')
+        result['status'] = 'failed'
+        result['error'] = str(e) or type(e).__name__
+    finally:
+        os.chdir(back)
+        result['wall_time'] = time.perf_counter() - start
+    return result
+
+
+def _run_item(args):
+    return run_item(*args)
+
+
+def run_batch(items, workdir='.', processes=1, lut_cache_dir=None, lut_cache_size=None, scratch_dir=None):
+    """Geocode each item, up to `processes` at a time, yielding their results as they finish
+
+    Worker processes are reused across items, so heavy imports, compiled templates, and (with `lut_cache_dir`) the
+    geocoding lookup tables are shared instead of being set up again for every granule.
+    """
+    tasks = [(item, workdir, lut_cache_dir, lut_cache_size, scratch_dir) for item in items]
+    if processes < 2:
+        for task in tasks:
+            yield _run_item(task)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(_run_item, tasks):
+            yield result
+
+
+def main():
+    """Main entrypoint"""
+    parser = argparse.ArgumentParser(
+        prog='geocode_sentinel_batch.py',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("granules", nargs='?', default='-',
+                        help="File listing the granules to geocode (default stdin)")
+    parser.add_argument("-n", "--processes", type=int, default=1,
+                        help="Number of granules to process at once (default 1)")
+    parser.add_argument("-w", "--workdir", default='.',
+                        help="Directory to process each granule in a subdirectory of")
+    parser.add_argument("-r", "--report", default='batch_report.json',
+                        help="File to write the summary report to")
+    parser.add_argument("--lut-cache",
+                        help="Directory to share geocoding lookup tables between granules in")
+    parser.add_argument("--lut-cache-size", type=float,
+                        help="Maximum size of the lookup table cache in GB (default unbounded)")
+    parser.add_argument("--scratch-dir",
+                        help="Directory to write intermediate files under (default each granule's directory)")
+    parser.add_argument('--version', action='version',
+                        version='%(prog)s {}'.format(hyp3_geocode.__version__))
+    args = parser.parse_args()
+
+    if args.granules == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.granules) as f:
+            lines = f.readlines()
+    try:
+        items = parse_items(lines)
+    except BatchItemError as e:
+        parser.error(str(e))
+
+    lut_cache_size = None if args.lut_cache_size is None else int(args.lut_cache_size * 1024 ** 3)
+    lut_cache_dir = None if args.lut_cache is None else os.path.abspath(args.lut_cache)
+    scratch_dir = None if args.scratch_dir is None else os.path.abspath(args.scratch_dir)
+
+    start = time.perf_counter()
+    results = []
+    for result in run_batch(items, args.workdir, processes=args.processes, lut_cache_dir=lut_cache_dir,
+                            lut_cache_size=lut_cache_size, scratch_dir=scratch_dir):
+        results.append(result)
+        print('{status:>9} {outfile} ({wall_time:.1f} s)'.format(**result), flush=True)
+
+    failures = [result for result in results if result['status'] != 'succeeded']
+    report = {
+        'succeeded': len(results) - len(failures),
+        'failed': len(failures),
+        'wall_time': time.perf_counter() - start,
+        'items': results,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('{succeeded} succeeded, {failed} failed in {wall_time:.1f} s; report written to {report}'.format(
+        report=args.report, **report))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Browse images of a geocoded power GeoTIFF, from a single read of it"""
+
+import logging
+import math
+
+import numpy as np
+from osgeo import gdal, osr
+
+from hyp3_geocode.cog import browse_band
+
+# Amplitudes are histogrammed in log-spaced bins, so the 2-sigma cutoffs can be found without keeping the whole scene
+HISTOGRAM_RANGE = (-6.0, 4.0)
+HISTOGRAM_BINS = 100000
+
+
+class AmplitudeStatistics:
+    """Running histogram of (non-zero) amplitudes, for the cutoffs of `byteSigmaScale`"""
+    def __init__(self):
+        self.edges = np.logspace(*HISTOGRAM_RANGE, HISTOGRAM_BINS + 1)
+        self.counts = np.zeros(HISTOGRAM_BINS)
+        self.sums = np.zeros(HISTOGRAM_BINS)
+        self.squares = np.zeros(HISTOGRAM_BINS)
+
+    def update(self, values):
+        values = values.astype(np.float64)
+        bins = np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, HISTOGRAM_BINS - 1)
+        self.counts += np.bincount(bins, minlength=HISTOGRAM_BINS)
+        self.sums += np.bincount(bins, weights=values, minlength=HISTOGRAM_BINS)
+        self.squares += np.bincount(bins, weights=values * values, minlength=HISTOGRAM_BINS)
+
+    def two_sigma_cutoffs(self):
+        """Mean +/- 2 standard deviations of the amplitudes, after clipping them at their 99th percentile"""
+        total = self.counts.sum()
+        if not total:
+            return 0.0, 0.0
+        cumulative = np.cumsum(self.counts)
+        top_bin = int(np.searchsorted(cumulative, 0.99 * total))
+        below = slice(0, top_bin)
+        top = self.sums[top_bin] / self.counts[top_bin]
+
+        clipped = total - cumulative[top_bin - 1] if top_bin else total
+        mean = (self.sums[below].sum() + clipped * top) / total
+        variance = (self.squares[below].sum() + clipped * top * top) / total - mean * mean
+        stddev = math.sqrt(max(variance, 0.0))
+        return mean - 2 * stddev, mean + 2 * stddev
+
+
+def _cell_means(amplitude, factor):
+    """Mean of the non-zero amplitudes in each `factor` x `factor` cell (0 where there are none)"""
+    rows, cols = amplitude.shape
+    padded = np.zeros((-(-rows // factor) * factor, -(-cols // factor) * factor), dtype=np.float64)
+    padded[:rows, :cols] = amplitude
+    shape = (padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    sums = padded.reshape(shape).sum(axis=(1, 3))
+    counts = (padded > 0).reshape(shape).sum(axis=(1, 3))
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+
+def sigma_browse(power_tif, browse_tif, width=2048, block_rows=None):
+    """Write a 2-sigma scaled byte amplitude GeoTIFF of `power_tif` at (just over) browse resolution
+
+    This replaces `createAmp`, `byteSigmaScale`, and most of the resampling in `makeAsfBrowse` with one windowed read
+    of the power GeoTIFF: the amplitude is histogrammed for the 2-sigma cutoffs, and averaged over integer cells down
+    to at least `width` columns, as it's read. Like `byteSigmaScale`, pixels with data are scaled to 1-255 and 0 is
+    no data. If the GeoTIFF has overviews, the coarsest one at least `width` columns wide is read instead.
+
+    Args:
+        power_tif: the geocoded power GeoTIFF
+        browse_tif: the byte GeoTIFF to create, to pass to `makeAsfBrowse`
+        width: the browse image width
+        block_rows: number of lines to read at a time (default about 256, rounded to a whole number of cells)
+    """
+    gdal.UseExceptions()
+    power = gdal.Open(power_tif)
+    # Cloud-optimized GeoTIFFs have overviews, so read the coarsest one that's wide enough
+    band = browse_band(power.GetRasterBand(1), width)
+    rows, cols = band.YSize, band.XSize
+    factor = max(1, cols // width)
+    if block_rows is None:
+        block_rows = max(1, 256 // factor) * factor
+    elif block_rows % factor:
+        raise ValueError('block_rows must be a multiple of the {} line cell size'.format(factor))
+
+    logging.info('Making a {}x{} browse of {} in blocks of {} lines'.format(
+        -(-cols // factor), -(-rows // factor), power_tif, block_rows))
+
+    statistics = AmplitudeStatistics()
+    cells = []
+    for yoff in range(0, rows, block_rows):
+        block = min(block_rows, rows - yoff)
+        amplitude = np.sqrt(np.clip(np.nan_to_num(band.ReadAsArray(0, yoff, cols, block)), 0, None))
+        statistics.update(amplitude[amplitude > 0])
+        cells.append(_cell_means(amplitude, factor))
+    means = np.concatenate(cells)
+
+    lo, hi = statistics.two_sigma_cutoffs()
+    logging.info('2-sigma cutoffs are {} {}'.format(lo, hi))
+    scale = 254.0 / (hi - lo) if hi > lo else 0.0
+    scaled = np.clip(np.round(1 + (means - lo) * scale), 1, 255).astype(np.uint8)
+    scaled[means == 0] = 0
+
+    geotransform = power.GetGeoTransform()
+    x_factor = factor * power.RasterXSize / cols
+    y_factor = factor * power.RasterYSize / rows
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(power.GetProjectionRef())
+    out_raster = gdal.GetDriverByName('GTiff').Create(browse_tif, scaled.shape[1], scaled.shape[0], 1, gdal.GDT_Byte)
+    out_raster.SetGeoTransform((geotransform[0], geotransform[1] * x_factor, 0,
+                                geotransform[3], 0, geotransform[5] * y_factor))
+    out_raster.SetProjection(srs.ExportToWkt())
+    out_band = out_raster.GetRasterBand(1)
+    out_band.WriteArray(scaled)
+    out_band.SetNoDataValue(0)
+
+    power = None  # How to close because gdal is weird
+    out_raster = None
@@ -0,0 +1,66 @@
+"""File helpers shared by the node-local caches"""
+
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+
+# ioctl to share the blocks of one file with another (a reflink) on Btrfs, XFS, etc.
+_FICLONE = 0x40049409
+
+
+@contextmanager
+def locked(lock_file, blocking=True):
+    """Hold an exclusive lock on `lock_file`, yielding whether it was acquired (always, if `blocking`)"""
+    with open(lock_file, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _reflink(src, dst):
+    with open(src, 'rb') as source, open(dst, 'wb') as destination:
+        fcntl.ioctl(destination.fileno(), _FICLONE, source.fileno())
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src, dst, hard_link=True):
+    """Put `src` at `dst` as a hard link, or a reflink, and only copy it if neither is supported
+
+    Hard linked files share their data, so they must be replaced, not modified in place; pass `hard_link=False` for
+    files that may be (reflinks are copied on write).
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if hard_link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    try:
+        _reflink(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def tree_size(path):
+    """Bytes in the file, or the files under the directory, `path`"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def copy_tree(src, dst, hard_link=True):
+    """Copy the directory `src` to `dst` (which mustn't exist), linking each file with `link_or_copy`"""
+    for root, _, names in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in names:
+            link_or_copy(os.path.join(root, name), os.path.join(target, name), hard_link=hard_link)
@@ -0,0 +1,125 @@
+"""Checkpoint manifests for resuming geocode_sentinel"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+import hyp3_geocode
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of the whole content of a file
+
+    Stages like `blank_bad_data` rewrite their files in place without changing their size, so no part of a file can
+    be left out.
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _file_states(paths):
+    return {path: {'size': os.path.getsize(path), 'digest': file_digest(path)} for path in paths}
+
+
+def _is_unchanged(path, state):
+    return os.path.isfile(path) and os.path.getsize(path) == state['size'] and file_digest(path) == state['digest']
+
+
+class Stage:
+    """A checkpointed stage; `done` is True when it's being skipped"""
+    def __init__(self, name, done, outputs):
+        self.name = name
+        self.done = done
+        self.outputs = outputs
+
+
+class Checkpoints:
+    """Manifest of the inputs, parameters, and outputs of each completed stage of a run
+
+    Args:
+        manifest_file: the JSON manifest to record stages in (nothing is recorded if None)
+        resume: skip stages whose recorded outputs are still valid; otherwise, start a new manifest
+    """
+    def __init__(self, manifest_file, resume=False):
+        self.manifest_file = None if manifest_file is None else os.path.abspath(manifest_file)
+        self.resume = resume
+        if self.manifest_file is not None and not resume and os.path.exists(self.manifest_file):
+            os.remove(self.manifest_file)
+
+    @contextmanager
+    def _locked(self):
+        with open('{}.lock'.format(self.manifest_file), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file) as f:
+            return json.load(f)
+
+    def _record(self, name, record):
+        with self._locked():
+            manifest = self._read()
+            manifest[name] = record
+            with open(self.manifest_file + '.tmp', 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            os.replace(self.manifest_file + '.tmp', self.manifest_file)
+
+    @staticmethod
+    def _params(params):
+        return json.loads(json.dumps(dict(params or {}, version=getattr(hyp3_geocode, '__version__', None))))
+
+    def valid(self, name, params=None):
+        """Whether stage `name` was completed with the same parameters and its outputs are still valid
+
+        Inputs that no longer exist (e.g., consumed intermediates) don't invalidate a stage, but changed ones do.
+        """
+        if not self.resume or self.manifest_file is None:
+            return False
+        with self._locked():
+            record = self._read().get(name)
+        if record is None or record['params'] != self._params(params):
+            return False
+        for path, state in record['inputs'].items():
+            if os.path.exists(path) and not _is_unchanged(path, state):
+                return False
+        return all(_is_unchanged(path, state) for path, state in record['outputs'].items())
+
+    @contextmanager
+    def stage(self, name, inputs=(), outputs=(), params=None):
+        """Yield a `Stage` that's `done` if it can be skipped; otherwise, record it when the body completes
+
+        Args:
+            name: the stage name, unique within the run
+            inputs: the files the stage reads
+            outputs: the files the stage writes (or set `Stage.outputs` in the body)
+            params: the parameters the stage depends on
+        """
+        if self.manifest_file is None:
+            yield Stage(name, False, list(outputs))
+            return
+
+        input_states = _file_states(path for path in inputs if os.path.isfile(path))
+        done = self.valid(name, params)
+        if done:
+            logging.info('Skipping stage {}; its outputs are still valid'.format(name))
+
+        stage = Stage(name, done, list(outputs))
+        yield stage
+
+        if not done:
+            self._record(name, {
+                'inputs': input_states,
+                'params': self._params(params),
+                'outputs': _file_states(stage.outputs),
+            })
@@ -0,0 +1,46 @@
+"""Cloud-optimized GeoTIFFs: tiled, compressed, and with internal overviews"""
+
+import logging
+import os
+
+from osgeo import gdal
+
+OVERVIEW_LEVELS = (2, 4, 8, 16, 32, 64)
+
+
+def make_cog(tif, cog_tif, compress='DEFLATE', blocksize=512, nodata=0):
+    """Rewrite `tif` as a cloud-optimized GeoTIFF, with averaged overviews down to about one tile
+
+    Uses GDAL's COG driver, which writes the tiles and overviews in one pass, when it's available (GDAL >= 3.1);
+    otherwise, the overviews are built on a tiled copy and then copied into the COG layout.
+    """
+    gdal.UseExceptions()
+    if gdal.GetDriverByName('COG') is not None:
+        gdal.Translate(cog_tif, tif, format='COG', noData=nodata, creationOptions=[
+            'COMPRESS={}'.format(compress), 'BLOCKSIZE={}'.format(blocksize), 'PREDICTOR=YES',
+            'OVERVIEWS=IGNORE_EXISTING', 'RESAMPLING=AVERAGE', 'BIGTIFF=IF_SAFER',
+        ])
+        return
+
+    logging.info('GDAL {} has no COG driver; building the overviews separately'.format(gdal.__version__))
+    tiled_tif = '{}.tiled.tif'.format(os.path.splitext(cog_tif)[0])
+    gdal.Translate(tiled_tif, tif, noData=nodata, creationOptions=['TILED=YES', 'BIGTIFF=IF_SAFER'])
+    tiled = gdal.Open(tiled_tif, gdal.GA_Update)
+    size = max(tiled.RasterXSize, tiled.RasterYSize)
+    tiled.BuildOverviews('AVERAGE', [level for level in OVERVIEW_LEVELS if size // level >= blocksize // 2])
+    tiled = None  # How to close because gdal is weird
+    gdal.Translate(cog_tif, tiled_tif, creationOptions=[
+        'TILED=YES', 'BLOCKXSIZE={}'.format(blocksize), 'BLOCKYSIZE={}'.format(blocksize),
+        'COMPRESS={}'.format(compress), 'COPY_SRC_OVERVIEWS=YES', 'BIGTIFF=IF_SAFER',
+    ])
+    os.remove(tiled_tif)
+
+
+def browse_band(band, width):
+    """The coarsest overview of `band` that's still at least `width` columns wide (or `band` itself)"""
+    best = band
+    for i in range(band.GetOverviewCount()):
+        overview = band.GetOverview(i)
+        if width <= overview.XSize < best.XSize:
+            best = overview
+    return best
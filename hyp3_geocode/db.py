@@ -0,0 +1,129 @@
+"""A bounded pool of database connections, shared by the worker processes of a node"""
+
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out in time"""
+
+
+class ConnectionPool:
+    """Keep at most `max_size` database connections open at once, across the processes forked after creating it
+
+    Connections are only checked out for the database calls that need them. A returned connection is kept for up to
+    `max_idle_time` seconds, so back to back calls (e.g., clipping, uploading, and recording a job) reuse it, and is
+    then closed in the background, so it isn't held open through the next job's processing. Idle connections count
+    against `max_size` until they're closed, or until the process that holds them exits (if it's a
+    `multiprocessing` process, however its target returns).
+
+    Args:
+        connect: function returning a new DB-API connection (which can be closed from another thread)
+        max_size: the most connections open at once
+        max_idle_time: seconds to keep an idle connection open for
+        timeout: seconds to wait for a connection before raising `PoolTimeout` (default wait forever)
+    """
+    def __init__(self, connect, max_size=2, max_idle_time=10.0, timeout=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.timeout = timeout
+        self._slots = multiprocessing.BoundedSemaphore(max_size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = []
+        self._reaper = None
+
+    def _after_fork(self):
+        if os.getpid() == self._pid:
+            return
+        # NOTE: connections opened before a fork share their socket (and slot) with the parent, which closes them, so
+        #  the child never uses or closes them; its lock may have been copied while held
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = []
+        self._reaper = None
+        # The reaper dies with the process, so give back the slots of its idle connections when it exits
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def _reap(self):
+        with self._lock:
+            self._reaper = None
+            now = time.monotonic()
+            expired = [(conn, returned) for conn, returned in self._idle if now - returned >= self.max_idle_time]
+            self._idle = [idle for idle in self._idle if idle not in expired]
+            if self._idle:
+                self._schedule(min(returned for _, returned in self._idle) + self.max_idle_time - now)
+        for conn, _ in expired:
+            logging.debug('Closing an idle database connection')
+            self._discard(conn)
+
+    def _schedule(self, delay):
+        self._reaper = threading.Timer(max(delay, 0), self._reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _checkout(self):
+        self._after_fork()
+        with self._lock:
+            now = time.monotonic()
+            while self._idle:
+                conn, returned = self._idle.pop()
+                if now - returned < self.max_idle_time and not getattr(conn, 'closed', False):
+                    return conn
+                self._discard(conn)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout('No database connection available after {} s'.format(self.timeout))
+        connected = False
+        try:
+            conn = self.connect()
+            connected = True
+        finally:
+            if not connected:
+                self._slots.release()
+        return conn
+
+    def _return(self, conn):
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            if self._reaper is None:
+                self._schedule(self.max_idle_time)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, committing when done (or closing it, and so rolling back, on errors)"""
+        conn = self._checkout()
+        done = False
+        try:
+            yield conn
+            conn.commit()
+            done = True
+        finally:
+            if done:
+                self._return(conn)
+            else:
+                logging.debug('Discarding a database connection after an error')
+                self._discard(conn)
+
+    def close(self):
+        """Close this process's idle connections"""
+        self._after_fork()
+        with self._lock:
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,120 @@
+"""Node-local cache of downloaded granules, so popular scenes are only downloaded once"""
+
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from hyp3_geocode.cache import link_or_copy, locked
+
+
+class GranuleCache:
+    """Directory of granule zips keyed by granule name, shared between processes
+
+    Each granule is cached as `{granule}.zip`, and hard linked (or reflinked) into place instead of copied. Granule
+    names end with a unique product identifier, so a reprocessed granule has a new name and the name alone is enough
+    of a key; a cached zip that turns out to be corrupt is evicted when extracting it fails. Hits and misses are
+    counted for the whole node in `stats.json`.
+
+    Args:
+        cache_dir: the cache directory, created if needed
+        max_bytes: evict the least recently used granules to keep the cache under this size (unbounded if None)
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _zip(self, granule):
+        return os.path.join(self.cache_dir, '{}.zip'.format(granule))
+
+    def _lock_file(self, granule):
+        return os.path.join(self.cache_dir, '{}.lock'.format(granule))
+
+    def _count(self, counter):
+        stats_file = os.path.join(self.cache_dir, 'stats.json')
+        with locked(os.path.join(self.cache_dir, 'stats.lock')):
+            stats = self.stats()
+            stats[counter] += 1
+            with open('{}.part'.format(stats_file), 'w') as f:
+                json.dump(stats, f)
+            os.replace('{}.part'.format(stats_file), stats_file)
+
+    def stats(self):
+        """The node's hit and miss counts"""
+        try:
+            with open(os.path.join(self.cache_dir, 'stats.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'hits': 0, 'misses': 0}
+
+    def cached(self, granule):
+        """Whether `granule` is cached"""
+        return os.path.isfile(self._zip(granule))
+
+    def fetch(self, granule, zip_file):
+        """Put the cached zip of `granule` at `zip_file`, returning whether it was found"""
+        if not self.cached(granule):
+            return False
+        link_or_copy(self._zip(granule), zip_file)
+        os.utime(self._zip(granule))
+        return True
+
+    def store(self, granule, zip_file):
+        """Add the downloaded `zip_file` of `granule` to the cache"""
+        staging = '{}.tmp{}'.format(self._zip(granule), os.getpid())
+        link_or_copy(zip_file, staging)
+        os.replace(staging, self._zip(granule))
+        self.evict(keep=granule)
+
+    def _remove(self, granule):
+        if os.path.exists(self._zip(granule)):
+            os.remove(self._zip(granule))
+
+    def evict(self, keep=None):
+        """Remove the least recently used granules until the cache fits in `max_bytes`"""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.zip'):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, name[:-len('.zip')]))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, granule in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if granule == keep:
+                continue
+            # NOTE: granules being downloaded or linked by another process are skipped
+            with locked(self._lock_file(granule), blocking=False) as acquired:
+                if not acquired:
+                    continue
+                logging.info('Evicting granule {} from {}'.format(granule, self.cache_dir))
+                self._remove(granule)
+                total -= size
+
+    @contextmanager
+    def lookup(self, granule, zip_file):
+        """Hold the lock on `granule`, yielding whether its cached zip was put at `zip_file`
+
+        If it wasn't, the caller downloads it to `zip_file` and it's cached on exiting the context, so concurrent
+        jobs for the same granule wait for one download instead of each downloading it. The caller should extract the
+        zip inside the context too: it's only cached if that succeeds, and a cached zip is evicted if it doesn't.
+        """
+        with locked(self._lock_file(granule)):
+            hit = self.fetch(granule, zip_file)
+            self._count('hits' if hit else 'misses')
+            if hit:
+                logging.info('Using cached granule {} from {}'.format(granule, self.cache_dir))
+            try:
+                yield hit
+            except Exception:  # noqa: B902
+                if hit:
+                    logging.warning('Evicting cached granule {} from {}, which failed'.format(granule, self.cache_dir))
+                    self._remove(granule)
+                raise
+            if not hit and os.path.isfile(zip_file):
+                self.store(granule, zip_file)
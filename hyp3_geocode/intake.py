@@ -0,0 +1,183 @@
+"""Claim queued jobs a batch at a time, backing off while the queue is empty and waking up when notified"""
+
+import collections
+import logging
+import select
+import threading
+
+
+class JobQueue:
+    """Jobs queued in a database table, claimed a batch at a time in one transaction
+
+    Args:
+        connect: function returning a new DB-API connection (e.g., to Postgres with psycopg2, or to SQLite)
+        processor: name of the processor whose jobs are claimed
+        table: the job table; it needs `id`, `status`, `processor`, and `priority` columns
+        dialect: 'postgres' or 'sqlite'
+        queued, claimed: the `status` of queued and of claimed jobs
+        done, failed: the `status` of finished jobs that succeeded and that failed
+    """
+    def __init__(self, connect, processor, table='local_queue', dialect='postgres', queued='QUEUED',
+                 claimed='PROCESSING', done='COMPLETE', failed='FAILED'):
+        if dialect not in ('postgres', 'sqlite'):
+            raise ValueError('Unsupported dialect: {}'.format(dialect))
+        self.connect = connect
+        self.processor = processor
+        self.table = table
+        self.dialect = dialect
+        self.queued = queued
+        self.claimed = claimed
+        self.done = done
+        self.failed = failed
+
+    def _claim_postgres(self, cursor, limit):
+        # NOTE: SKIP LOCKED lets several nodes claim at once without blocking on (or double claiming) the same jobs
+        cursor.execute(
+            'UPDATE {table} SET status = %(claimed)s WHERE id IN ('
+            'SELECT id FROM {table} WHERE status = %(queued)s AND processor = %(processor)s '
+            'ORDER BY priority DESC, id LIMIT %(limit)s FOR UPDATE SKIP LOCKED'
+            ') RETURNING *'.format(table=self.table),
+            {'claimed': self.claimed, 'queued': self.queued, 'processor': self.processor, 'limit': limit}
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        # NOTE: RETURNING doesn't keep the order of the subquery, so put the highest priority jobs first again
+        columns = [column[0] for column in cursor.description]
+        priority, id_ = columns.index('priority'), columns.index('id')
+        return sorted(rows, key=lambda row: (-row[priority], row[id_]))
+
+    def _claim_sqlite(self, cursor, limit):
+        # SQLite locks the whole database for writing, so claiming is serialized by BEGIN IMMEDIATE
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(
+            'SELECT id FROM {table} WHERE status = :queued AND processor = :processor '
+            'ORDER BY priority DESC, id LIMIT :limit'.format(table=self.table),
+            {'queued': self.queued, 'processor': self.processor, 'limit': limit}
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return []
+        placeholders = ', '.join('?' * len(ids))
+        cursor.execute('UPDATE {} SET status = ? WHERE id IN ({})'.format(self.table, placeholders),
+                       [self.claimed] + ids)
+        cursor.execute('SELECT * FROM {} WHERE id IN ({}) ORDER BY priority DESC, id'.format(
+            self.table, placeholders), ids)
+        return cursor.fetchall()
+
+    def claim(self, limit):
+        """Claim up to `limit` queued jobs, highest priority first, as dicts of their columns"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            if self.dialect == 'postgres':
+                rows = self._claim_postgres(cursor, limit)
+            else:
+                rows = self._claim_sqlite(cursor, limit)
+            columns = [column[0] for column in cursor.description] if rows else []
+            conn.commit()
+        finally:
+            # NOTE: closing without committing rolls back the claim
+            conn.close()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _set_status(self, ids, status):
+        if not ids:
+            return
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            if self.dialect == 'postgres':
+                cursor.execute('UPDATE {} SET status = %(status)s WHERE id = ANY(%(ids)s)'.format(self.table),
+                               {'status': status, 'ids': list(ids)})
+            else:
+                placeholders = ', '.join('?' * len(ids))
+                cursor.execute('UPDATE {} SET status = ? WHERE id IN ({})'.format(self.table, placeholders),
+                               [status] + list(ids))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def requeue(self, ids):
+        """Put claimed, but never started (or interrupted), jobs back in the queue"""
+        self._set_status(ids, self.queued)
+
+    def finish(self, job_id, succeeded):
+        """Mark a claimed job as done, or as failed"""
+        self._set_status([job_id], self.done if succeeded else self.failed)
+
+
+class Intake:
+    """A local prefetch queue of jobs claimed from a `JobQueue`
+
+    When the prefetch queue runs dry, a batch of jobs is claimed at once. While there are none, the time between
+    claims grows from `min_wait` to `max_wait` seconds, and `notify` (e.g., on a Postgres NOTIFY) claims again
+    straight away.
+
+    Args:
+        queue: the `JobQueue` to claim jobs from
+        batch_size: the most jobs to claim at once
+        min_wait, max_wait: the shortest and longest time to wait between claims while the queue is empty
+        backoff: how much longer to wait after each empty claim
+    """
+    def __init__(self, queue, batch_size=4, min_wait=1.0, max_wait=60.0, backoff=2.0):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.wait = min_wait
+        self.prefetched = collections.deque()
+        self.claims = 0
+        self._wakeup = threading.Event()
+
+    def notify(self):
+        """New jobs were queued: claim again now"""
+        self._wakeup.set()
+
+    def next_job(self, stop=None):
+        """The next job, waiting for one to be queued; None if `stop` (a `threading.Event`-like) is set first"""
+        while stop is None or not stop.is_set():
+            if self.prefetched:
+                return self.prefetched.popleft()
+
+            self._wakeup.clear()
+            jobs = self.queue.claim(self.batch_size)
+            self.claims += 1
+            if jobs:
+                logging.debug('Claimed {} jobs'.format(len(jobs)))
+                self.prefetched.extend(jobs)
+                self.wait = self.min_wait
+                continue
+
+            if self._wakeup.wait(self.wait):
+                logging.debug('Notified of new jobs')
+                self.wait = self.min_wait
+            else:
+                self.wait = min(self.max_wait, self.wait * self.backoff)
+        return None
+
+    def close(self):
+        """Give back any prefetched jobs, e.g., when shutting down"""
+        ids = [job['id'] for job in self.prefetched]
+        self.prefetched.clear()
+        self.queue.requeue(ids)
+
+
+def listen(connect, channel, intake, stop, timeout=5.0):
+    """Notify `intake` whenever a Postgres NOTIFY is sent on `channel`, until `stop` is set
+
+    Meant to be run in a thread, with a psycopg2 `connect`.
+    """
+    conn = connect()
+    try:
+        conn.autocommit = True
+        conn.cursor().execute('LISTEN {}'.format(channel))
+        while not stop.is_set():
+            if select.select([conn], [], [], timeout)[0]:
+                conn.poll()
+                if conn.notifies:
+                    del conn.notifies[:]
+                    intake.notify()
+    finally:
+        conn.close()
@@ -0,0 +1,149 @@
+"""Cache of GAMMA geocoding lookup tables"""
+
+import hashlib
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+from hyp3lib.execute import execute
+
+import hyp3_geocode
+from hyp3_geocode.cache import link_or_copy, locked, tree_size
+
+LOOKUP_TABLE_FILES = ('par', 'utm_to_rdc')
+
+# The MLI parameters that determine its geometry: its timing, size, spacing, slant ranges, and orbit. The rest
+#  (e.g., the title, sensor, and gains) differ between polarizations of the same scene.
+_GEOMETRY_MLI_PARAMETERS = (
+    'date', 'start_time', 'center_time', 'end_time', 'azimuth_line_time', 'range_samples', 'azimuth_lines',
+    'range_looks', 'azimuth_looks', 'image_geometry', 'range_pixel_spacing', 'azimuth_pixel_spacing',
+    'near_range_slc', 'center_range_slc', 'far_range_slc', 'first_slant_range_polynomial',
+    'center_slant_range_polynomial', 'last_slant_range_polynomial', 'azimuth_deskew', 'radar_frequency', 'prf',
+    'doppler_polynomial', 'sar_to_earth_center', 'earth_radius_below_sensor', 'earth_semi_major_axis',
+    'earth_semi_minor_axis', 'number_of_state_vectors', 'time_of_first_state_vector', 'state_vector_interval',
+)
+_STATE_VECTOR_PREFIXES = ('state_vector_position_', 'state_vector_velocity_')
+
+
+def _is_geometry_parameter(key):
+    return key in _GEOMETRY_MLI_PARAMETERS or key.startswith(_STATE_VECTOR_PREFIXES)
+
+
+def _digest_par(hasher, par_file, include=None):
+    with open(par_file) as f:
+        for line in f:
+            key = line.split(':', 1)[0].strip().lower()
+            if include is not None and not include(key):
+                continue
+            hasher.update(line.strip().encode('utf-8'))
+            hasher.update(b'\n')
+
+
+def lookup_table_key(mli_par, area_map_par, height, offset=None):
+    """Digest of everything `gec_map` uses to build a lookup table"""
+    hasher = hashlib.sha256()
+    hasher.update('hyp3_geocode {}\n'.format(getattr(hyp3_geocode, '__version__', None)).encode('utf-8'))
+    _digest_par(hasher, mli_par, include=_is_geometry_parameter)
+    _digest_par(hasher, area_map_par)
+    hasher.update('height {}\n'.format(float(height)).encode('utf-8'))
+    if offset is None or offset == '-':
+        hasher.update(b'offset -\n')
+    else:
+        with open(offset, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class LookupTableCache:
+    """Directory of lookup tables keyed by `lookup_table_key`, shared between processes
+
+    Args:
+        cache_dir: the cache directory, created if needed
+        max_bytes: evict the least recently used lookup tables to keep the cache under this size (unbounded if None)
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _lock_file(self, key):
+        return os.path.join(self.cache_dir, '{}.lock'.format(key))
+
+    def fetch(self, key, small_map):
+        """Put the cached lookup table for `key` at `small_map`, returning whether it was found"""
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            return False
+        for ext in LOOKUP_TABLE_FILES:
+            link_or_copy(os.path.join(entry, 'small_map.{}'.format(ext)), '{}.{}'.format(small_map, ext))
+        os.utime(entry)
+        return True
+
+    def store(self, key, small_map):
+        """Add the lookup table at `small_map` to the cache under `key`"""
+        entry = self._entry(key)
+        staging = '{}.tmp{}'.format(entry, os.getpid())
+        if os.path.isdir(staging):
+            shutil.rmtree(staging)
+        os.mkdir(staging)
+        for ext in LOOKUP_TABLE_FILES:
+            link_or_copy('{}.{}'.format(small_map, ext), os.path.join(staging, 'small_map.{}'.format(ext)))
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(staging, entry)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Remove the least recently used lookup tables until the cache fits in `max_bytes`"""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry(key)
+            if os.path.isdir(entry) and '.tmp' not in key:
+                entries.append((os.path.getmtime(entry), tree_size(entry), key))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            with locked(self._lock_file(key), blocking=False) as acquired:
+                if not acquired:
+                    continue
+                logging.info('Evicting lookup table {} from {}'.format(key, self.cache_dir))
+                shutil.rmtree(self._entry(key))
+                total -= size
+
+    @contextmanager
+    def lookup(self, key, small_map):
+        """Hold the lock on `key`, yielding whether its lookup table was put at `small_map`
+
+        If it wasn't, the caller creates it and it's cached on exiting the context.
+        """
+        with locked(self._lock_file(key)):
+            hit = self.fetch(key, small_map)
+            if hit:
+                logging.info('Using cached lookup table {} from {}'.format(key, self.cache_dir))
+            yield hit
+            if not hit:
+                self.store(key, small_map)
+
+
+def gec_map(mli_par, offset, area_map, height, small_map, cache=None):
+    """Create the geocoding lookup table `small_map`, reusing a cached one when possible"""
+    cmd = f"gec_map {mli_par} {offset or '-'} {area_map} {height} {small_map}.par {small_map}.utm_to_rdc"
+    if cache is None:
+        execute(cmd, uselogging=True)
+        return
+
+    key = lookup_table_key(mli_par, area_map, height, offset=offset)
+    with cache.lookup(key, small_map) as hit:
+        if not hit:
+            execute(cmd, uselogging=True)
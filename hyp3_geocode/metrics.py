@@ -0,0 +1,140 @@
+"""Per-stage timing and resource metrics"""
+
+import json
+import logging
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+_records = []
+# Peak RSS of each stage in progress, outermost first
+_peaks = []
+
+
+def _io_counters():
+    """Bytes read and written by this process and its reaped children"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f)
+        return int(counters['read_bytes']), int(counters['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        return sum(u.ru_inblock for u in usage) * 512, sum(u.ru_oublock for u in usage) * 512
+
+
+def _peak_rss():
+    """Peak RSS of this process, in bytes, since it was last reset by `_reset_peak_rss` (None if unknown)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of this process to its current RSS, returning whether it could be"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _update_peaks():
+    # The peak RSS is reset at the start of every stage, so fold it into the stages in progress first
+    peak = _peak_rss()
+    if peak is not None:
+        _peaks[:] = [max(stage_peak, peak) for stage_peak in _peaks]
+
+
+def _peak_growth(start, end):
+    # ru_maxrss is the peak over the whole lifetime (in kilobytes), so it's only the stage's peak if it grew
+    return end * 1024 if end > start else None
+
+
+def _snapshot():
+    return {
+        'wall': time.perf_counter(),
+        'cpu': time.process_time(),
+        'self': resource.getrusage(resource.RUSAGE_SELF),
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN),
+        'io': _io_counters(),
+    }
+
+
+@contextmanager
+def stage(name, **labels):
+    """Record the wall time, CPU time, child process usage, peak RSS, and I/O of a processing stage
+
+    `peak_rss` is the peak RSS of this process during the stage and `children_peak_rss` that of the largest child
+    process it ran. Only lifetime peaks are known for child processes, so `children_peak_rss` is None if no child
+    process used more memory than in earlier stages (as is `peak_rss` where the peak can't be reset).
+
+    Args:
+        name: the stage name (e.g., 'geocode_back')
+        **labels: extra fields to record (e.g., pol='vv')
+    """
+    _update_peaks()
+    reset = _reset_peak_rss() and _peak_rss() is not None
+    _peaks.append(0)
+    start = _snapshot()
+    try:
+        yield
+    finally:
+        end = _snapshot()
+        _update_peaks()
+        peak_rss = _peaks.pop()
+        if not reset:
+            peak_rss = _peak_growth(start['self'].ru_maxrss, end['self'].ru_maxrss)
+        record = dict(
+            labels,
+            stage=name,
+            wall_time=end['wall'] - start['wall'],
+            cpu_time=end['cpu'] - start['cpu'],
+            children_user_time=end['children'].ru_utime - start['children'].ru_utime,
+            children_system_time=end['children'].ru_stime - start['children'].ru_stime,
+            peak_rss=peak_rss,
+            children_peak_rss=_peak_growth(start['children'].ru_maxrss, end['children'].ru_maxrss),
+            read_bytes=end['io'][0] - start['io'][0],
+            write_bytes=end['io'][1] - start['io'][1],
+        )
+        _records.append(record)
+        logging.debug('Stage metrics: {}'.format(record))
+
+
+def records():
+    """The stage metrics recorded so far in this process"""
+    return list(_records)
+
+
+def add_records(new_records):
+    """Add stage metrics recorded elsewhere (e.g., in a worker process)"""
+    _records.extend(new_records)
+
+
+def reset():
+    """Forget all recorded stage metrics"""
+    del _records[:]
+
+
+def write_metrics(metrics_file):
+    """Write the recorded stage metrics to a JSON sidecar file"""
+    os.makedirs(os.path.dirname(metrics_file) or '.', exist_ok=True)
+    with open(metrics_file, 'w') as f:
+        json.dump({'stages': records()}, f, indent=2)
+
+
+def read_metrics(metrics_file):
+    """Read the stage metrics from a JSON sidecar file"""
+    with open(metrics_file) as f:
+        return json.load(f)['stages']
+
+
+def metrics_file_name(outfile):
+    """Name of the stage metrics sidecar of `outfile`"""
+    return os.path.join('PRODUCT', '{}_metrics.json'.format(os.path.basename(outfile)))
@@ -0,0 +1,214 @@
+"""Package products into zip archives, compressing members in parallel"""
+
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# These formats are already compressed, so deflating them again costs time for next to nothing
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.kmz', '.zip', '.gz'}
+
+# Sizes and offsets from this on are recorded in ZIP64 extra fields, with the 32 bit field set to _ZIP64_MARKER
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_MARKER = 0xFFFFFFFF
+_ZIP_STORED = 0
+_ZIP_DEFLATED = 8
+_UTF8_FLAG = 0x800
+
+
+def tiff_is_compressed(tiff_file):
+    """Whether the first image of a (Big)TIFF is compressed"""
+    with open(tiff_file, 'rb') as f:
+        header = f.read(16)
+        if len(header) < 8 or header[:2] not in (b'II', b'MM'):
+            return False
+        endian = '<' if header[:2] == b'II' else '>'
+        version, = struct.unpack(endian + 'H', header[2:4])
+        if version == 42:
+            offset, = struct.unpack(endian + 'I', header[4:8])
+            count_format, entry_format, entry_size = 'H', 'HHII', 12
+        elif version == 43 and len(header) == 16:
+            offset, = struct.unpack(endian + 'Q', header[8:16])
+            count_format, entry_format, entry_size = 'Q', 'HHQQ', 20
+        else:
+            return False
+
+        f.seek(offset)
+        count_bytes = f.read(struct.calcsize(count_format))
+        if len(count_bytes) < struct.calcsize(count_format):
+            return False
+        count, = struct.unpack(endian + count_format, count_bytes)
+        entries = f.read(count * entry_size)
+
+    for i in range(len(entries) // entry_size):
+        tag, type_, _, value = struct.unpack(endian + entry_format, entries[i * entry_size:(i + 1) * entry_size])
+        if tag == 259:  # Compression
+            if type_ == 3:  # SHORT values are left-justified in the value field
+                value = value >> (8 * (struct.calcsize(entry_format[-1]) - 2)) if endian == '>' else value & 0xFFFF
+            return value != 1
+    return False
+
+
+def should_store(path):
+    """Whether to store `path` as is, rather than deflate it"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return True
+    if extension in ('.tif', '.tiff'):
+        return tiff_is_compressed(path)
+    return False
+
+
+def _deflate(data, level, last):
+    # Each chunk is deflated independently and ends on a byte boundary, so the chunks concatenate into one stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _deflate_bound(file_size, chunk_size):
+    """Upper bound of the compressed size of a file deflated a chunk at a time by `_deflate`"""
+    # zlib's conservative deflateBound (which holds for any level) for each chunk, plus the empty stored block a sync
+    #  flush adds
+    chunks = file_size // chunk_size + 1
+    return file_size + (file_size >> 3) + (file_size >> 8) + (file_size >> 9) + chunks * (4 + 5)
+
+
+def _field(value):
+    return _ZIP64_MARKER if value >= _ZIP64_LIMIT else value
+
+
+def _dos_time(path):
+    year, month, day, hour, minute, second = time.localtime(os.path.getmtime(path))[:6]
+    year = min(max(year, 1980), 2107)
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class _Member:
+    def __init__(self, name, method, mtime, offset):
+        self.name = name
+        self.method = method
+        self.mtime = mtime
+        self.offset = offset
+        self.crc = 0
+        self.compressed_size = 0
+        self.file_size = 0
+
+
+def _local_header(member, zip64):
+    name = member.name.encode('utf-8')
+    extra = struct.pack('<HHQQ', 0x0001, 16, member.file_size, member.compressed_size) if zip64 else b''
+    sizes = (_ZIP64_MARKER, _ZIP64_MARKER) if zip64 else (member.compressed_size, member.file_size)
+    return struct.pack(
+        '<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, _UTF8_FLAG, member.method, member.mtime[0],
+        member.mtime[1], member.crc, sizes[0], sizes[1], len(name), len(extra)
+    ) + name + extra
+
+
+def _central_header(member):
+    name = member.name.encode('utf-8')
+    zip64_fields = [value for value in (member.file_size, member.compressed_size, member.offset)
+                    if value >= _ZIP64_LIMIT]
+    extra = b''
+    if zip64_fields:
+        extra = struct.pack('<HH', 0x0001, 8 * len(zip64_fields))
+        extra += struct.pack('<' + 'Q' * len(zip64_fields), *zip64_fields)
+    version = 45 if zip64_fields else 20
+    return struct.pack(
+        '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, _UTF8_FLAG, member.method,
+        member.mtime[0], member.mtime[1], member.crc, _field(member.compressed_size), _field(member.file_size),
+        len(name), len(extra), 0, 0, 0, 0o100644 << 16, _field(member.offset)
+    ) + name + extra
+
+
+def _end_records(count, directory_offset, directory_size):
+    records = b''
+    if count >= 0xFFFF or directory_offset >= _ZIP64_LIMIT or directory_size >= _ZIP64_LIMIT:
+        zip64_end_offset = directory_offset + directory_size
+        records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, directory_size,
+                               directory_offset)
+        records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+    return records + struct.pack(
+        '<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF), _field(directory_size),
+        _field(directory_offset), 0
+    )
+
+
+def _write_member(out, path, member, pool, jobs, level, chunk_size):
+    file_size = os.path.getsize(path)
+    # Reserve room for 64 bit sizes in the local header if they could be needed, before the member is written
+    compressed_bound = file_size if member.method == _ZIP_STORED else _deflate_bound(file_size, chunk_size)
+    zip64 = max(file_size, compressed_bound) >= _ZIP64_LIMIT
+    out.write(_local_header(member, zip64))
+
+    pending = deque()
+    with open(path, 'rb') as f:
+        remaining = file_size
+        while True:
+            data = f.read(chunk_size)
+            remaining -= len(data)
+            member.crc = zlib.crc32(data, member.crc)
+            member.file_size += len(data)
+            if member.method == _ZIP_STORED:
+                out.write(data)
+                member.compressed_size += len(data)
+            else:
+                pending.append(pool.submit(_deflate, data, level, remaining <= 0 or not data))
+                # Bound the compressed chunks held in memory
+                while len(pending) > 2 * jobs:
+                    compressed = pending.popleft().result()
+                    out.write(compressed)
+                    member.compressed_size += len(compressed)
+            if remaining <= 0 or not data:
+                break
+
+    while pending:
+        compressed = pending.popleft().result()
+        out.write(compressed)
+        member.compressed_size += len(compressed)
+
+    end = out.tell()
+    out.seek(member.offset)
+    out.write(_local_header(member, zip64))
+    out.seek(end)
+
+
+def zip_product(path, zip_file, jobs=None, level=6, chunk_size=CHUNK_SIZE):
+    """Zip the directory `path` into `zip_file`, deflating members in parallel
+
+    Members are named relative to the parent of `path`, so the archive unpacks into a directory of the same name.
+    Already compressed formats (PNG, KMZ, compressed TIFFs, etc.) are stored as is, and the archive is streamed
+    straight to disk, a chunk at a time.
+
+    Args:
+        path: the directory to zip
+        zip_file: the archive to create
+        jobs: number of threads to deflate chunks with (default one per CPU)
+        level: the zlib compression level
+        chunk_size: size of the independently deflated chunks
+    """
+    jobs = jobs or os.cpu_count() or 1
+    root = os.path.dirname(os.path.abspath(path))
+
+    files = []
+    for subdir, dirs, names in os.walk(path):
+        dirs.sort()
+        files.extend(os.path.join(subdir, name) for name in sorted(names))
+
+    members = []
+    with open(zip_file, 'wb') as out, ThreadPoolExecutor(jobs) as pool:
+        for file in files:
+            name = os.path.relpath(os.path.abspath(file), root).replace(os.sep, '/')
+            method = _ZIP_STORED if should_store(file) else _ZIP_DEFLATED
+            member = _Member(name, method, _dos_time(file), out.tell())
+            _write_member(out, file, member, pool, jobs, level, chunk_size)
+            members.append(member)
+
+        directory_offset = out.tell()
+        for member in members:
+            out.write(_central_header(member))
+        directory_size = out.tell() - directory_offset
+        out.write(_end_records(len(members), directory_offset, directory_size))
@@ -0,0 +1,156 @@
+"""Reading and writing GAMMA parameter (.par) files"""
+
+import os
+from collections import OrderedDict
+
+DEM_PAR_HEADER = 'Gamma DIFF&GEO DEM/MAP parameter file'
+
+# Parsed parameter files, keyed by path and modification time
+_CACHE_SIZE = 128
+_cache = OrderedDict()
+
+
+class ParameterError(KeyError):
+    """Raised when a parameter isn't in a parameter file"""
+
+
+class Parameters:
+    """The parameters of a GAMMA parameter file, in order
+
+    Values are kept as the text after the `:`, and converted when they're read; numbers drop their units
+    (e.g., `corner_north:  4354590.000  m`).
+
+    Args:
+        header: the first line of the file (e.g., 'Gamma DIFF&GEO DEM/MAP parameter file')
+        values: (key, value text) pairs
+        path: the file the parameters were read from, if any
+    """
+    def __init__(self, header='', values=(), path=None):
+        self.header = header
+        self.values = OrderedDict(values)
+        self.path = path
+
+    @classmethod
+    def parse(cls, text, path=None):
+        header = ''
+        values = []
+        for number, line in enumerate(text.splitlines()):
+            if ':' not in line:
+                if number == 0:
+                    header = line.strip()
+                continue
+            key, value = line.split(':', 1)
+            values.append((key.strip(), value.strip()))
+        return cls(header, values, path=path)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __getitem__(self, key):
+        try:
+            return self.values[key]
+        except KeyError:
+            raise ParameterError('Parameter {} not found in {}'.format(key, self.path or 'parameters'))
+
+    def text(self, key):
+        """The first word of a value (e.g., 'GROUND_RANGE')"""
+        words = self[key].split()
+        return words[0] if words else ''
+
+    def numbers(self, key):
+        """All the numbers of a value (e.g., the 3 components of a state vector)"""
+        numbers = []
+        for word in self[key].split():
+            try:
+                numbers.append(float(word))
+            except ValueError:
+                # A unit
+                continue
+        return numbers
+
+    def number(self, key):
+        """The (first) number of a value"""
+        numbers = self.numbers(key)
+        if not numbers:
+            raise ValueError('Parameter {} of {} is not a number: {}'.format(key, self.path or 'parameters', self[key]))
+        return numbers[0]
+
+    def integer(self, key):
+        return int(self.number(key))
+
+    def dumps(self):
+        lines = [self.header] if self.header else []
+        lines.extend('{}: {}'.format(key, value) for key, value in self.values.items())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the parameter file (replacing it all at once, so a cached copy is never half written)"""
+        part = '{}.part'.format(path)
+        with open(part, 'w') as f:
+            f.write(self.dumps())
+        os.replace(part, path)
+
+
+def read_par(path):
+    """Read a parameter file, parsing it only once while it's unchanged
+
+    The returned `Parameters` are shared with later reads of the unchanged file, so they shouldn't be modified.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    params = _cache.get(key)
+    if params is not None:
+        _cache.move_to_end(key)
+        return params
+
+    with open(path) as f:
+        params = Parameters.parse(f.read(), path=path)
+    _cache[key] = params
+    while len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+    return params
+
+
+def utm_dem_par(title, data_format, width, nlines, corner_north, corner_east, pixel_size, zone, false_northing):
+    """The parameters `create_dem_par` writes for a WGS84 UTM DEM or area map
+
+    Args:
+        title: the title (GAMMA uses the name the file was created for)
+        data_format: 'REAL*4' or 'INTEGER*2'
+        width, nlines: the number of columns and lines
+        corner_north, corner_east: the coordinates of the upper left corner, in meters
+        pixel_size: the pixel size in meters (north and east)
+        zone: the UTM zone
+        false_northing: 0 in the northern hemisphere, 10000000 in the southern
+    """
+    return Parameters(DEM_PAR_HEADER, [
+        ('title', title),
+        ('DEM_projection', 'UTM'),
+        ('data_format', data_format),
+        ('DEM_hgt_offset', '{:.5f}'.format(0.0)),
+        ('DEM_scale', '{:.5f}'.format(1.0)),
+        ('width', '{:d}'.format(int(width))),
+        ('nlines', '{:d}'.format(int(nlines))),
+        ('corner_north', '{:.3f}  m'.format(corner_north)),
+        ('corner_east', '{:.3f}  m'.format(corner_east)),
+        ('post_north', '{:.7f}  m'.format(-1.0 * pixel_size)),
+        ('post_east', '{:.7f}  m'.format(pixel_size)),
+        ('ellipsoid_name', 'WGS 84'),
+        ('ellipsoid_ra', '{:.3f}   m'.format(6378137.0)),
+        ('ellipsoid_reciprocal_flattening', '{:.7f}'.format(298.257223563)),
+        ('datum_name', 'WGS 1984'),
+        ('datum_shift_dx', '{:.3f}   m'.format(0.0)),
+        ('datum_shift_dy', '{:.3f}   m'.format(0.0)),
+        ('datum_shift_dz', '{:.3f}   m'.format(0.0)),
+        ('datum_scale_m', '{:.5e}'.format(0.0)),
+        ('datum_rotation_alpha', '{:.5e}   arc-sec'.format(0.0)),
+        ('datum_rotation_beta', '{:.5e}   arc-sec'.format(0.0)),
+        ('datum_rotation_gamma', '{:.5e}   arc-sec'.format(0.0)),
+        ('projection_name', 'UTM'),
+        ('projection_zone', '{:d}'.format(int(zone))),
+        ('false_easting', '{:.3f}   m'.format(500000.0)),
+        ('false_northing', '{:.3f}   m'.format(float(false_northing))),
+        ('projection_k0', '{:.7f}'.format(0.9996)),
+        ('center_longitude', '{:.7f}   decimal degrees'.format(6.0 * int(zone) - 183.0)),
+        ('center_latitude', '{:.7f}   decimal degrees'.format(0.0)),
+    ])
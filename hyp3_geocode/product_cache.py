@@ -0,0 +1,167 @@
+"""Node-local cache of unclipped products, so identical geocode requests only run GAMMA once"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+import hyp3_geocode
+from hyp3_geocode.artifacts import ArtifactManifest
+from hyp3_geocode.cache import copy_tree, locked, tree_size
+
+ENTRY_FILE = 'entry.json'
+
+
+def product_parameters(granule, pixel_size, height, gamma0=False, **options):
+    """The canonical parameters of a geocode request, which determine its (unclipped) products
+
+    The output name isn't one of them: cached products are renamed for each request (see `rename_product`).
+
+    Args:
+        granule: the granule name
+        pixel_size: the product pixel size in meters
+        height: the terrain height
+        gamma0: whether the products are gamma0 (not sigma0)
+        **options: any other options the products depend on (e.g., post=30, cog=True)
+    """
+    return {
+        'granule': granule,
+        'pixel_size': float(pixel_size),
+        'height': float(height),
+        'gamma0': bool(gamma0),
+        'options': options,
+        'version': hyp3_geocode.__version__,
+    }
+
+
+def product_key(parameters):
+    """Digest of the canonical JSON of `product_parameters`"""
+    canonical = json.dumps(parameters, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def rename_product(product_dir, old_name, new_name):
+    """Rename the files of a product named `old_name` (and the paths in its artifact manifest) to `new_name`"""
+    if old_name == new_name:
+        return
+    for entry in os.scandir(product_dir):
+        if entry.name.startswith(old_name):
+            os.rename(entry.path, os.path.join(product_dir, new_name + entry.name[len(old_name):]))
+
+    manifest_file = os.path.join(product_dir, '{}_artifacts.json'.format(new_name))
+    if os.path.isfile(manifest_file):
+        manifest = ArtifactManifest.read(manifest_file)
+        for artifact in manifest.artifacts:
+            if artifact.path.startswith(old_name):
+                artifact.path = new_name + artifact.path[len(old_name):]
+        manifest.write(manifest_file)
+
+
+class ProductCache:
+    """Directory of PRODUCT directories keyed by `product_key`, shared between processes
+
+    Entries are copied in and out (as reflinks where the file system supports them) rather than hard linked, since
+    products are clipped and renamed in place after they're fetched. Entries made by other versions of hyp3_geocode
+    never match, and are removed the next time a product is stored.
+
+    Args:
+        cache_dir: the cache directory, created if needed
+        max_bytes: evict the least recently used products to keep the cache under this size (unbounded if None)
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _lock_file(self, key):
+        return os.path.join(self.cache_dir, '{}.lock'.format(key))
+
+    def _entries(self):
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry(key)
+            if os.path.isdir(entry) and '.tmp' not in key:
+                yield key, entry
+
+    def fetch(self, key, product_dir, name):
+        """Copy the cached product for `key` to `product_dir`, named `name`, returning whether it was found"""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, ENTRY_FILE)) as f:
+                cached_name = json.load(f)['name']
+        except (OSError, ValueError, KeyError):
+            return False
+        if os.path.isdir(product_dir):
+            shutil.rmtree(product_dir)
+        copy_tree(os.path.join(entry, 'PRODUCT'), product_dir, hard_link=False)
+        rename_product(product_dir, cached_name, name)
+        os.utime(entry)
+        return True
+
+    def store(self, key, product_dir, name, parameters=None):
+        """Add a copy of the product at `product_dir`, named `name`, to the cache under `key`"""
+        entry = self._entry(key)
+        staging = '{}.tmp{}'.format(entry, os.getpid())
+        if os.path.isdir(staging):
+            shutil.rmtree(staging)
+        copy_tree(product_dir, os.path.join(staging, 'PRODUCT'), hard_link=False)
+        with open(os.path.join(staging, ENTRY_FILE), 'w') as f:
+            json.dump({'version': hyp3_geocode.__version__, 'name': name, 'parameters': parameters}, f, indent=2)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(staging, entry)
+        self.invalidate()
+        self.evict(keep=key)
+
+    def _remove(self, key, reason):
+        with locked(self._lock_file(key), blocking=False) as acquired:
+            if not acquired:
+                return False
+            logging.info('Removing {} product {} from {}'.format(reason, key, self.cache_dir))
+            shutil.rmtree(self._entry(key))
+            return True
+
+    def invalidate(self):
+        """Remove the products made by other versions of hyp3_geocode"""
+        for key, entry in list(self._entries()):
+            try:
+                with open(os.path.join(entry, ENTRY_FILE)) as f:
+                    version = json.load(f).get('version')
+            except (OSError, ValueError):
+                version = None
+            if version != hyp3_geocode.__version__:
+                self._remove(key, 'outdated')
+
+    def evict(self, keep=None):
+        """Remove the least recently used products until the cache fits in `max_bytes`"""
+        if self.max_bytes is None:
+            return
+        entries = [(os.path.getmtime(entry), tree_size(entry), key) for key, entry in self._entries()]
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            if self._remove(key, 'least recently used'):
+                total -= size
+
+    @contextmanager
+    def lookup(self, key, product_dir, name, parameters=None):
+        """Hold the lock on `key`, yielding whether its product was copied to `product_dir`, named `name`
+
+        If it wasn't, the caller makes it and it's cached on exiting the context, so concurrent identical requests
+        wait for one run instead of each running GAMMA.
+        """
+        with locked(self._lock_file(key)):
+            hit = self.fetch(key, product_dir, name)
+            if hit:
+                logging.info('Using cached product {} from {}'.format(key, self.cache_dir))
+            yield hit
+            if not hit and os.path.isdir(product_dir):
+                self.store(key, product_dir, name, parameters=parameters)
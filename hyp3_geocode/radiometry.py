@@ -0,0 +1,96 @@
+"""Radiometric normalization of MLI images"""
+
+import os
+
+import numpy as np
+from hyp3lib.execute import execute
+
+from hyp3_geocode.par import read_par
+
+
+def edge_blank_mask(valid, left=15, right=15):
+    """Mask of the bad data at the edges of each line of a block, given where the block has (non-zero) data"""
+    x = valid.shape[1]
+    columns = np.arange(x)
+
+    # Black out the start of the line
+    has_data = valid.any(axis=1)
+    first = np.where(has_data, valid.argmax(axis=1) + left, 0)
+    blank = columns < first[:, np.newaxis]
+
+    # Black out the end of the line, searching what's left after blanking the start
+    # (column 0 is never considered the end of the line)
+    remaining = valid & ~blank
+    remaining[:, 0] = False
+    has_end = remaining.any(axis=1)
+    last = x - 1 - remaining[:, ::-1].argmax(axis=1)
+    end = last - right
+    # NOTE: a negative start index counts back from the end of the line, like a python slice
+    end = np.where(end < 0, np.maximum(end + x, 0), end)
+    blank |= has_end[:, np.newaxis] & (columns >= end[:, np.newaxis])
+    return blank
+
+
+def incidence_angles(mli_par):
+    """Ellipsoid incidence angle of each range sample of an MLI, in radians, assuming a locally spherical earth"""
+    params = read_par(mli_par)
+    samples = np.arange(params.integer('range_samples'), dtype=np.float64)
+    near_range = params.number('near_range_slc')
+    spacing = params.number('range_pixel_spacing')
+    sensor = params.number('sar_to_earth_center')
+    earth = params.number('earth_radius_below_sensor')
+
+    if 'image_geometry' in params and params.text('image_geometry') == 'GROUND_RANGE':
+        near_angle = np.arccos((sensor ** 2 + earth ** 2 - near_range ** 2) / (2 * sensor * earth))
+        earth_angle = near_angle + samples * spacing / earth
+        slant_range = np.sqrt(sensor ** 2 + earth ** 2 - 2 * sensor * earth * np.cos(earth_angle))
+    else:
+        slant_range = near_range + samples * spacing
+        earth_angle = np.arccos((sensor ** 2 + earth ** 2 - slant_range ** 2) / (2 * sensor * earth))
+
+    look_angle = np.arcsin(earth * np.sin(earth_angle) / slant_range)
+    return look_angle + earth_angle
+
+
+def sigma0_to_gamma0(mli, mli_par, blank_edges=False, left=20, right=20, block_rows=1024):
+    """Convert a sigma-0 MLI to gamma-0, optionally blanking the bad data at its edges, in one pass and in place
+
+    This is meant to apply the same ellipsoid normalization as `radcal_gamma0`, but without any intermediate files.
+    It's only checked against `radcal_MLI` output by `geocode_sentinel.py --verify-fused-gamma0`.
+    """
+    params = read_par(mli_par)
+    x, y = params.integer('range_samples'), params.integer('azimuth_lines')
+    scale = (1.0 / np.cos(incidence_angles(mli_par))).astype(np.float32)
+
+    raster = np.memmap(mli, dtype='>f4', mode='r+', shape=(y, x))
+    for start in range(0, y, block_rows):
+        block = raster[start:start + block_rows]
+        data = block.astype(np.float32)
+        gamma0 = data * scale
+        if blank_edges:
+            gamma0[edge_blank_mask(data != 0, left, right)] = 0
+        block[:] = gamma0
+
+    raster.flush()
+    del raster
+
+
+def radcal_gamma0(mli, mli_par, out):
+    """Convert a sigma-0 MLI to gamma-0 with GAMMA's radcal_MLI"""
+    execute(f"radcal_MLI {mli} {mli_par} - {mli}.sigma - 0 0 -1", uselogging=True)
+    execute(f"radcal_MLI {mli}.sigma {mli_par} - {out} - 0 0 2", uselogging=True)
+    os.remove(f"{mli}.sigma")
+
+
+def max_relative_difference(raster, reference, x, y, block_rows=1024):
+    """Largest relative difference of a float32 raster from a reference, where the raster has data"""
+    raster = np.memmap(raster, dtype='>f4', mode='r', shape=(y, x))
+    reference = np.memmap(reference, dtype='>f4', mode='r', shape=(y, x))
+    largest = 0.0
+    for start in range(0, y, block_rows):
+        data = raster[start:start + block_rows].astype(np.float64)
+        expected = reference[start:start + block_rows].astype(np.float64)
+        has_data = (data != 0) & (expected != 0)
+        if has_data.any():
+            largest = max(largest, float(np.max(np.abs(data[has_data] - expected[has_data]) / expected[has_data])))
+    return largest
@@ -0,0 +1,71 @@
+"""Memory-bounded RGB decomposition of a dual-pol geocoded product"""
+
+import logging
+
+import numpy as np
+from hyp3lib.rtc2color import calculate_color_channel, cleanup_threshold
+from osgeo import gdal, osr
+
+BANDS = ((1, 'red'), (2, 'green'), (3, 'blue'))
+
+
+def _read_block(band, yoff, rows, cols, clean_threshold, amp):
+    data = np.nan_to_num(band.ReadAsArray(0, yoff, cols, rows))
+    data[data < clean_threshold] = 0.0
+    if amp:  # to power
+        data *= data
+    return data
+
+
+def rgb_decomposition(copol_tif, crosspol_tif, threshold, out_tif, amp=False, cleanup=False, block_rows=256):
+    """RGB decomposition of a dual-pol product, like `rtc2color`, computed `block_rows` lines at a time
+
+    Peak memory depends on the width of the rasters and `block_rows`, not on the size of the scene.
+
+    Args:
+        copol_tif: the co-pol GeoTIFF
+        crosspol_tif: the cross-pol GeoTIFF
+        threshold: decomposition threshold value in dB
+        out_tif: the output color GeoTIFF file name
+        amp: input GeoTIFFs are in amplitude and not power
+        cleanup: cleanup artifacts using a -48 dB power threshold
+        block_rows: number of lines to decompose at a time
+    """
+    gdal.UseExceptions()
+
+    copol_handle = gdal.Open(copol_tif)
+    crosspol_handle = gdal.Open(crosspol_tif)
+
+    rows = min(copol_handle.RasterYSize, crosspol_handle.RasterYSize)
+    cols = min(copol_handle.RasterXSize, crosspol_handle.RasterXSize)
+
+    geotransform = copol_handle.GetGeoTransform()
+    out_raster_srs = osr.SpatialReference()
+    out_raster_srs.ImportFromWkt(copol_handle.GetProjectionRef())
+
+    driver = gdal.GetDriverByName('GTiff')
+    out_raster = driver.Create(out_tif, cols, rows, 3, gdal.GDT_Byte, ['COMPRESS=LZW'])
+    out_raster.SetGeoTransform((geotransform[0], geotransform[1], 0, geotransform[3], 0, geotransform[5]))
+    out_raster.SetProjection(out_raster_srs.ExportToWkt())
+
+    logging.info('Calculating color decomposition of {} and {} in blocks of {} lines'.format(
+        copol_tif, crosspol_tif, block_rows))
+
+    clean_threshold = cleanup_threshold(amp, cleanup)
+    copol_band = copol_handle.GetRasterBand(1)
+    crosspol_band = crosspol_handle.GetRasterBand(1)
+    for yoff in range(0, rows, block_rows):
+        block = min(block_rows, rows - yoff)
+        copol_data = _read_block(copol_band, yoff, block, cols, clean_threshold, amp)
+        crosspol_data = _read_block(crosspol_band, yoff, block, cols, clean_threshold, amp)
+
+        # Scale the results to fit inside RGB 1-255 (ints), with 0 for no/bad data
+        for band_number, color in BANDS:
+            band_data = calculate_color_channel(
+                copol_data, crosspol_data, threshold=threshold, scale_factor=254.0, color=color
+            )
+            out_raster.GetRasterBand(band_number).WriteArray(band_data, 0, yoff)
+
+    copol_handle = None  # How to close because gdal is weird
+    crosspol_handle = None
+    out_raster = None
@@ -0,0 +1,93 @@
+"""Selective extraction of Sentinel-1 SAFE granules"""
+
+import logging
+import os
+import re
+import shutil
+import zipfile
+
+CO_POLARIZATIONS = {'vv': 'vh', 'hh': 'hv'}
+
+_MANIFEST = re.compile(r'^[^/]+\.SAFE/manifest\.safe$')
+_MEASUREMENT = re.compile(r'^[^/]+\.SAFE/measurement/[^/]*-(vv|vh|hh|hv)-[^/]*\.tiff$')
+_ANNOTATION = re.compile(r'^[^/]+\.SAFE/annotation/(calibration/)?[^/]*-(vv|vh|hh|hv)-[^/]*\.xml$')
+
+
+def processed_polarizations(available):
+    """The polarizations `geocode_sentinel` processes, given those available in a granule"""
+    pols = []
+    for pol, cross_pol in CO_POLARIZATIONS.items():
+        if pol in available:
+            pols.append(pol)
+            if cross_pol in available:
+                pols.append(cross_pol)
+    return pols
+
+
+def _member_polarization(name):
+    for pattern in (_MEASUREMENT, _ANNOTATION):
+        match = pattern.match(name)
+        if match:
+            return match.groups()[-1]
+    return None
+
+
+def safe_members(names, polarizations=None):
+    """Select the manifest, annotation and calibration XML, and measurement TIFFs needed to process a granule
+
+    Args:
+        names: all the member names of the SAFE zip
+        polarizations: the polarizations to select (default: those `geocode_sentinel` would process)
+
+    Returns:
+        members: the selected member names
+    """
+    if polarizations is None:
+        available = {match.group(1) for match in map(_MEASUREMENT.match, names) if match}
+        polarizations = processed_polarizations(available)
+
+    members = []
+    for name in names:
+        if _MANIFEST.match(name):
+            members.append(name)
+        elif _member_polarization(name) in polarizations:
+            members.append(name)
+    return members
+
+
+def _is_extracted(info, path):
+    return os.path.isfile(path) and os.path.getsize(path) == info.file_size
+
+
+def extract_safe(zip_file, dest='.', polarizations=None):
+    """Extract only the parts of a SAFE zip needed for processing, skipping anything already extracted
+
+    Args:
+        zip_file: the granule zip file
+        dest: the directory to extract the SAFE into
+        polarizations: the polarizations to extract (default: those `geocode_sentinel` would process)
+
+    Returns:
+        safe_dir: the extracted SAFE directory
+    """
+    with zipfile.ZipFile(zip_file) as zf:
+        names = zf.namelist()
+        safe_name = names[0].split('/')[0]
+        safe_dir = os.path.normpath(os.path.join(dest, safe_name))
+
+        infos = [zf.getinfo(name) for name in safe_members(names, polarizations)]
+        todo = [info for info in infos if not _is_extracted(info, os.path.join(dest, info.filename))]
+        if not todo:
+            logging.info('{} is already extracted'.format(safe_dir))
+            return safe_dir
+
+        logging.info('Extracting {} of {} files from {}'.format(len(todo), len(names), zip_file))
+        for info in todo:
+            path = os.path.join(dest, info.filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # NOTE: Extract to a temporary name so an interrupted extraction is never mistaken for a complete one
+            with zf.open(info) as src, open(path + '.part', 'wb') as dst:
+                shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
+            os.replace(path + '.part', path)
+
+    return safe_dir
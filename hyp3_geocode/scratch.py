@@ -0,0 +1,83 @@
+"""Scratch space for intermediate files, deleted as soon as they're no longer needed"""
+
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+
+def disk_usage(path):
+    """Bytes of disk used by the files under `path`"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_blocks * 512
+            except OSError:
+                # Deleted while walking
+                continue
+    return total
+
+
+class ScratchDir:
+    """A directory for the intermediate files of a run, kept apart from its products
+
+    Args:
+        path: the scratch directory (e.g., on local NVMe or tmpfs); created if it doesn't exist
+        keep: keep intermediates when they're released, instead of deleting them
+    """
+    def __init__(self, path='.', keep=False):
+        self.root = path
+        self.keep = keep
+        self.peak = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name):
+        """Path of the intermediate file `name`"""
+        return os.path.join(self.root, name)
+
+    def sample(self):
+        """Measure the current disk usage, updating the peak"""
+        usage = disk_usage(self.root)
+        self.peak = max(self.peak, usage)
+        return usage
+
+    def release(self, *paths):
+        """Delete intermediate files (or directories) once their last consumer has finished"""
+        # Intermediates pile up until they're released, so measure just before they're deleted
+        self.sample()
+        if self.keep:
+            return
+        for path in paths:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+            else:
+                continue
+            logging.debug('Removed intermediate {}'.format(path))
+
+    @contextmanager
+    def monitor(self, interval=1.0):
+        """Sample the disk usage every `interval` seconds in the background, e.g., while other processes write to it"""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.sample()
+
+        thread = threading.Thread(target=run, name='scratch-monitor', daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+            self.sample()
+
+    def remove(self):
+        """Delete the scratch directory and everything left in it (unless keeping intermediates)"""
+        self.sample()
+        if not self.keep and os.path.abspath(self.root) != os.path.abspath('.'):
+            shutil.rmtree(self.root, ignore_errors=True)
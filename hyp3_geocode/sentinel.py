@@ -2,33 +2,75 @@
 
 import argparse
 import datetime
+import fnmatch
 import glob
 import logging
 import math
+import multiprocessing
 import os
 import shutil
-import zipfile
 
-import numpy as np
-from hyp3lib.asf_geometry import geometry_geo2proj
-from hyp3lib.byteSigmaScale import byteSigmaScale
-from hyp3lib.createAmp import createAmp
+from hyp3lib import OrbitDownloadError
 from hyp3lib.execute import execute
-from hyp3lib.getParameter import getParameter
-from hyp3lib.getSubSwath import get_bounding_box_file
-from hyp3lib.ingest_S1_granule import ingest_S1_granule
-from hyp3lib.makeAsfBrowse import makeAsfBrowse
-from hyp3lib.make_arc_thumb import pngtothumb
 
 import hyp3_geocode
+from hyp3_geocode import metrics
+from hyp3_geocode.artifacts import ArtifactManifest, classify, manifest_file_name
+from hyp3_geocode.checkpoint import Checkpoints
+from hyp3_geocode.lookup_table import LookupTableCache, gec_map
+from hyp3_geocode.par import read_par, utm_dem_par
+from hyp3_geocode.safe import extract_safe
+from hyp3_geocode.scratch import ScratchDir
+from hyp3_geocode.templates import get_template, render
 
+# NOTE: numpy, GDAL, and the hyp3lib modules that use them are imported by the stages that need them, so starting up
+#  (e.g., for --help, or each granule of a batch) doesn't pay for them
+
+
+def _project_bounds(epsg, lat_max, lat_min, lon_max, lon_min):
+    """Projected extent (y_min, y_max, x_min, x_max) of a lat/lon box, the same way as `geometry_geo2proj`"""
+    from osgeo import osr
+
+    in_srs = osr.SpatialReference()
+    in_srs.ImportFromEPSG(4326)
+    out_srs = osr.SpatialReference()
+    out_srs.ImportFromEPSG(epsg)
+    transform = osr.CoordinateTransformation(in_srs, out_srs)
+    corners = [transform.TransformPoint(lon, lat)[:2] for lon in (lon_max, lon_min) for lat in (lat_min, lat_max)]
+    xs, ys = zip(*corners)
+    return min(ys), max(ys), min(xs), max(xs)
+
+
+def create_dem_par(basename, data_type, pixel_size, lat_max, lat_min, lon_max, lon_min, post, roi=None):
+    """Write the parameter file of an area map covering the granule bounds (intersected with `roi`)
+
+    This writes the same UTM DEM/MAP parameters as GAMMA's create_dem_par, without running it.
+
+    Args:
+        roi: optional (lat_max, lat_min, lon_max, lon_min) region of interest. The area map stays on the same UTM
+            zone and grid as the granule's, so products only covering the region line up with full ones.
+    """
+    from hyp3lib.asf_geometry import geometry_geo2proj
 
-def create_dem_par(basename, data_type, pixel_size, lat_max, lat_min, lon_max, lon_min, post):
-    dem_par_in = "{}_dem_par.in".format(basename)
     zone, false_north, y_min, y_max, x_min, x_max = geometry_geo2proj(lat_max, lat_min, lon_max, lon_min)
 
     logging.debug("Original Output Coordinates: {} {} {} {}".format(y_min, y_max, x_min, x_max))
 
+    if roi is not None:
+        epsg = int("{}{:02d}".format(326 if (lat_min + lat_max) / 2 > 0 else 327, int(zone)))
+        roi_y_min, roi_y_max, roi_x_min, roi_x_max = _project_bounds(epsg, *roi)
+        if roi_x_min >= x_max or roi_x_max <= x_min or roi_y_min >= y_max or roi_y_max <= y_min:
+            raise ValueError("The region of interest {} doesn't intersect the granule".format(roi))
+        if post is None:
+            # Keep the pixels on the grid of the whole granule
+            x_min += max(0, math.floor((roi_x_min - x_min) / pixel_size)) * pixel_size
+            y_max -= max(0, math.floor((y_max - roi_y_max) / pixel_size)) * pixel_size
+            x_max, y_min = min(x_max, roi_x_max), max(y_min, roi_y_min)
+        else:
+            y_min, y_max = max(y_min, roi_y_min), min(y_max, roi_y_max)
+            x_min, x_max = max(x_min, roi_x_min), min(x_max, roi_x_max)
+        logging.debug("Region of Interest Output Coordinates: {} {} {} {}".format(y_min, y_max, x_min, x_max))
+
     if post is not None:
         shift = 0
         x_max = math.ceil(x_max / post) * post + shift
@@ -37,111 +79,246 @@ def create_dem_par(basename, data_type, pixel_size, lat_max, lat_min, lon_max, l
         y_min = math.floor(y_min / post) * post - shift
         logging.debug("Snapped Output Coordinates: {} {} {} {}".format(y_min, y_max, x_min, x_max))
 
-    with open(dem_par_in, "w") as f:
-        f.write("UTM\n")
-        f.write("WGS84\n")
-        f.write("1\n")
-        f.write("{}\n".format(zone))
-        f.write("{}\n".format(false_north))
-        f.write("{}\n".format(basename))
-        if "float" in data_type:
-            f.write("REAL*4\n")
-        elif "int16" in data_type:
-            f.write("INTEGER*2\n")
-        f.write("0.0\n")
-        f.write("1.0\n")
-
-        xsize = np.floor(abs((x_max - x_min) / pixel_size))
-        ysize = np.floor(abs((y_max - y_min) / pixel_size))
-
-        f.write("{}\n".format(int(xsize)))
-        f.write("{}\n".format(int(ysize)))
-        f.write("{} {}\n".format(-1.0 * pixel_size, pixel_size))
-        f.write("{} {}\n".format(y_max, x_min))
-
-    return dem_par_in
-
-
-def blank_bad_data(raw_file, x, y, left=15, right=15):
-    # Read in the data
-    data = np.fromfile(raw_file, dtype=np.float32)
-    data = np.reshape(data, (y, x))
-    data = data.byteswap()
-
-    # For each line in the file
-    for i in range(y):
-        # Black out the start of the line
-        for j in range(x):
-            if data[i, j] != 0:
-                data[i, :j + left] = 0
-                break
-        # Black out the end of the line
-        for j in range(x - 1, 0, -1):
-            if data[i, j] != 0:
-                data[i, j - right:] = 0
-                break
-
-    # Write out the data
-    data = data.byteswap()
-    data.tofile(raw_file)
+    data_format = "INTEGER*2" if "int16" in data_type else "REAL*4"
+    xsize = math.floor(abs((x_max - x_min) / pixel_size))
+    ysize = math.floor(abs((y_max - y_min) / pixel_size))
+
+    dem_par = "{}.par".format(basename)
+    utm_dem_par(basename, data_format, xsize, ysize, y_max, x_min, pixel_size, zone, false_north).write(dem_par)
+    return dem_par
+
+
+def blank_bad_data(raw_file, x, y, left=15, right=15, block_rows=1024):
+    """Blank out the bad data at the edges of each line of a big-endian float32 raster, in place"""
+    import numpy as np
+
+    from hyp3_geocode.radiometry import edge_blank_mask
+
+    # Work on the raw words so that zeroing is byte-exact (e.g., -0.0 is rewritten as 0.0)
+    raw = np.memmap(raw_file, dtype='>u4', mode='r+', shape=(y, x))
+
+    for start in range(0, y, block_rows):
+        block = raw[start:start + block_rows]
+        blank = edge_blank_mask(block.view('>f4') != 0, left, right)
+
+        changed = (blank & (block != 0)).any(axis=1)
+        if changed.any():
+            rows = np.flatnonzero(changed)
+            block[rows] = np.where(blank[rows], 0, block[rows])
+
+    raw.flush()
+    del raw
 
 
 def process_pol(pol, type_, infile, outfile, pixel_size, height, make_tab_flag=True, gamma0_flag=False,
-                offset=None):
+                offset=None, orbit_file=None, lut_cache=None, checkpoints=None, fused_gamma0=False,
+                verify_tolerance=None, cog=False, scratch=None):
+    from hyp3lib.ingest_S1_granule import ingest_S1_granule
+
+    from hyp3_geocode.cog import make_cog
+    from hyp3_geocode.radiometry import max_relative_difference, radcal_gamma0, sigma0_to_gamma0
+
     logging.info("Processing the {pol} polarization".format(pol=pol))
     # FIXME: make_tab_flag isn't used... should it be doing something?
     logging.debug('Unused option make_tab_flag was {make_tab_flag}'.format(make_tab_flag=make_tab_flag))
 
-    mgrd = "{outfile}.{pol}.mgrd".format(outfile=outfile, pol=pol)
-    utm = "{outfile}.{pol}.utm".format(outfile=outfile, pol=pol)
-    area_map = "{outfile}_area_map.par".format(outfile=outfile)
-    small_map = "{outfile}_small_map".format(outfile=outfile)
+    if checkpoints is None:
+        checkpoints = Checkpoints(None)
+    if scratch is None:
+        scratch = ScratchDir(keep=True)
+
+    name = os.path.basename(outfile)
+    mgrd = scratch.path("{name}.{pol}.mgrd".format(name=name, pol=pol))
+    utm = scratch.path("{name}.{pol}.utm".format(name=name, pol=pol))
+    area_map = scratch.path("{name}_area_map.par".format(name=name))
+    small_map = scratch.path("{name}_{pol}_small_map".format(name=name, pol=pol))
 
-    look_fact = np.floor((pixel_size / 10.0) + 0.5)
+    look_fact = float(math.floor((pixel_size / 10.0) + 0.5))
     if look_fact < 1:
         look_fact = 1
 
-    # Ingest the granule into gamma format
-    ingest_S1_granule(infile, pol, look_fact, mgrd)
-
-    if gamma0_flag:
-        # Convert sigma-0 to gamma-0
-        execute(f"radcal_MLI {mgrd} {mgrd}.par - {mgrd}.sigma - 0 0 -1", uselogging=True)
-        execute(f"radcal_MLI {mgrd}.sigma {mgrd}.par - {mgrd}.gamma - 0 0 2", uselogging=True)
-        shutil.move("{mgrd}.gamma".format(mgrd=mgrd), mgrd)
-
-    # Blank out the bad data at the left and right edges
-    dsx = int(getParameter("{mgrd}.par".format(mgrd=mgrd), "range_samples", uselogging=True))
-    dsy = int(getParameter("{mgrd}.par".format(mgrd=mgrd), "azimuth_lines", uselogging=True))
-
-    if "GRD" in type_:
-        blank_bad_data(mgrd, dsx, dsy, left=20, right=20)
-
-    # Create geocoding look up table
     if offset is None:
         offset = '-'
-    execute(f"gec_map {mgrd}.par {offset} {area_map} {height} {small_map}.par {small_map}.utm_to_rdc", uselogging=True)
-
-    # Gecode the granule
-    out_size = getParameter("{small_map}.par".format(small_map=small_map), "width", uselogging=True)
-    execute(f"geocode_back {mgrd} {dsx} {small_map}.utm_to_rdc {utm} {out_size}", uselogging=True)
-
-    # Create the geotiff file
+    mli_params = {'type': type_, 'look_fact': float(look_fact), 'gamma0': gamma0_flag, 'fused': fused_gamma0}
+    # NOTE: intermediates are released once the next stage has consumed them, so a later stage that's still valid
+    #  means the earlier ones are done, even though their outputs are gone. So the later stages also depend on
+    #  everything the earlier ones do: the area map (which has the pixel size and region of interest), the offset
+    #  file, and every earlier stage's parameters.
+    chain_inputs = [area_map] + ([] if offset == '-' else [offset])
+    chain_params = dict(mli_params, granule=os.path.basename(infile.rstrip('/')), pixel_size=pixel_size,
+                        height=height, offset=offset)
     tiffile = "{outfile}_{pol}.tif".format(outfile=outfile, pol=pol)
-    execute(f"data2geotiff {small_map}.par {utm} 2 {tiffile}", uselogging=True)
+    geotiff_params = dict(chain_params, cog=cog)
+    if checkpoints.valid(f"data2geotiff.{pol}", params=geotiff_params):
+        logging.info("Skipping the {pol} polarization; its GeoTIFF is still valid".format(pol=pol))
+        scratch.release(mgrd, f"{mgrd}.par", f"{small_map}.par", f"{small_map}.utm_to_rdc", utm)
+        return
+
+    if not checkpoints.valid(f"geocode_back.{pol}", params=chain_params):
+        # NOTE: radcal and blanking modify the MLI in place, so they're checkpointed together with the ingest
+        measurements = sorted(glob.glob("{}/*/*{}*.tiff".format(infile, pol)))
+        with checkpoints.stage(f"mli.{pol}", inputs=measurements, outputs=[mgrd, f"{mgrd}.par"],
+                               params=mli_params) as stage:
+            if not stage.done:
+                # Ingest the granule into gamma format
+                with metrics.stage('ingest', pol=pol):
+                    ingest_S1_granule(infile, pol, look_fact, mgrd, orbit_file=orbit_file)
+
+                if gamma0_flag and not fused_gamma0:
+                    # Convert sigma-0 to gamma-0
+                    with metrics.stage('radcal', pol=pol):
+                        radcal_gamma0(mgrd, f"{mgrd}.par", f"{mgrd}.gamma")
+                        shutil.move("{mgrd}.gamma".format(mgrd=mgrd), mgrd)
+
+            mli_par = read_par(f"{mgrd}.par")
+            dsx = mli_par.integer("range_samples")
+            dsy = mli_par.integer("azimuth_lines")
+
+            if not stage.done and gamma0_flag and fused_gamma0:
+                if verify_tolerance is not None:
+                    radcal_gamma0(mgrd, f"{mgrd}.par", f"{mgrd}.radcal")
+
+                # Convert sigma-0 to gamma-0 and blank out the bad data at the left and right edges in one pass
+                with metrics.stage('gamma0', pol=pol):
+                    sigma0_to_gamma0(mgrd, f"{mgrd}.par", blank_edges="GRD" in type_, left=20, right=20)
+
+                if verify_tolerance is not None:
+                    difference = max_relative_difference(mgrd, f"{mgrd}.radcal", dsx, dsy)
+                    os.remove(f"{mgrd}.radcal")
+                    logging.info(f"Fused gamma-0 differs from radcal_MLI by up to {difference:.3%}")
+                    if difference > verify_tolerance:
+                        raise Exception(f"Fused gamma-0 differs from radcal_MLI by more than {verify_tolerance:.3%}")
+
+            elif not stage.done and "GRD" in type_:
+                # Blank out the bad data at the left and right edges
+                with metrics.stage('blank', pol=pol):
+                    blank_bad_data(mgrd, dsx, dsy, left=20, right=20)
+
+        # Create geocoding look up table
+        with checkpoints.stage(f"gec_map.{pol}", inputs=[f"{mgrd}.par"] + chain_inputs,
+                               outputs=[f"{small_map}.par", f"{small_map}.utm_to_rdc"],
+                               params={'height': height, 'offset': offset}) as stage:
+            if not stage.done:
+                with metrics.stage('gec_map', pol=pol):
+                    gec_map(f"{mgrd}.par", offset, area_map, height, small_map, cache=lut_cache)
+
+        # Gecode the granule
+        out_size = read_par(f"{small_map}.par").integer("width")
+        with checkpoints.stage(f"geocode_back.{pol}", inputs=[mgrd, f"{small_map}.utm_to_rdc"] + chain_inputs,
+                               outputs=[utm], params=chain_params) as stage:
+            if not stage.done:
+                with metrics.stage('geocode_back', pol=pol):
+                    execute(f"geocode_back {mgrd} {dsx} {small_map}.utm_to_rdc {utm} {out_size}", uselogging=True)
+        scratch.release(mgrd, f"{mgrd}.par", f"{small_map}.utm_to_rdc")
 
+    # Create the geotiff file
+    with checkpoints.stage(f"data2geotiff.{pol}", inputs=[f"{small_map}.par", utm] + chain_inputs, outputs=[tiffile],
+                           params=geotiff_params) as stage:
+        if not stage.done:
+            with metrics.stage('data2geotiff', pol=pol):
+                if cog:
+                    stripfile = scratch.path("{name}_{pol}_strips.tif".format(name=name, pol=pol))
+                    execute(f"data2geotiff {small_map}.par {utm} 2 {stripfile}", uselogging=True)
+                    make_cog(stripfile, tiffile)
+                    os.remove(stripfile)
+                else:
+                    execute(f"data2geotiff {small_map}.par {utm} 2 {tiffile}", uselogging=True)
+    scratch.release(f"{small_map}.par", utm)
+
+
+def _process_pol_job(log_file, log_level, args, kwargs):
+    """Run a polarization chain in a worker process, logging to its own file"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_file, mode='w')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%m/%d/%Y %I:%M:%S %p'))
+    root.addHandler(handler)
+    root.setLevel(log_level)
+
+    metrics.reset()
+    process_pol(*args, **kwargs)
+    return metrics.records()
+
+
+def _merge_logs(log_files):
+    """Append the polarization chain logs, in order, to the run's log handlers"""
+    root = logging.getLogger()
+    for log_file in log_files:
+        if not os.path.exists(log_file):
+            continue
+        with open(log_file) as f:
+            text = f.read()
+        for handler in root.handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.acquire()
+                try:
+                    handler.stream.write(text)
+                    handler.flush()
+                finally:
+                    handler.release()
+        os.remove(log_file)
+
+
+def process_pols(chains, type_, infile, outfile, pixel_size, height, gamma0_flag=False, offset=None, jobs=1,
+                 lut_cache=None, checkpoints=None, fused_gamma0=False, verify_tolerance=None, cog=False,
+                 scratch=None):
+    """Process each (polarization, make_tab_flag) chain, running up to `jobs` of them at once"""
+    if jobs < 2 or len(chains) < 2 or "GRD" not in type_:
+        if jobs > 1 and "GRD" not in type_:
+            # NOTE: SLC ingest mosaics the bursts in a shared, date named, directory
+            logging.info("Polarizations of {} granules are processed sequentially".format(type_))
+        for pol, make_tab_flag in chains:
+            process_pol(pol, type_, infile, outfile, pixel_size, height, make_tab_flag=make_tab_flag,
+                        gamma0_flag=gamma0_flag, offset=offset, lut_cache=lut_cache, checkpoints=checkpoints,
+                        fused_gamma0=fused_gamma0, verify_tolerance=verify_tolerance, cog=cog, scratch=scratch)
+        return
+
+    from hyp3lib.get_orb import downloadSentinelOrbitFile
+
+    # Fetch the orbit once up front so the chains aren't racing to download the same file
+    try:
+        logging.info('Trying to get orbit file information from file {}'.format(infile))
+        orbit_file, _ = downloadSentinelOrbitFile(infile)
+    except OrbitDownloadError:
+        logging.warning('Unable to fetch precision state vectors... continuing')
+        orbit_file = None
+
+    log_files = ["{outfile}.{pol}.log".format(outfile=outfile, pol=pol) for pol, _ in chains]
+    logging.info("Processing {} polarizations with {} jobs".format(len(chains), jobs))
+    try:
+        with multiprocessing.Pool(min(jobs, len(chains))) as pool:
+            pending = [
+                pool.apply_async(_process_pol_job, (
+                    log_file, logging.getLogger().level,
+                    (pol, type_, infile, outfile, pixel_size, height),
+                    dict(make_tab_flag=make_tab_flag, gamma0_flag=gamma0_flag, offset=offset, orbit_file=orbit_file,
+                         lut_cache=lut_cache, checkpoints=checkpoints, fused_gamma0=fused_gamma0,
+                         verify_tolerance=verify_tolerance, cog=cog, scratch=scratch)
+                ))
+                for (pol, make_tab_flag), log_file in zip(chains, log_files)
+            ]
+            # Fail fast: the first chain to fail raises here, and leaving the pool terminates the others
+            while pending:
+                pending[0].wait(1)
+                for result in [r for r in pending if r.ready()]:
+                    pending.remove(result)
+                    metrics.add_records(result.get())
+    finally:
+        _merge_logs(log_files)
+
+
+def create_xml_files(infile, outfile, height, type_, gamma0_flag, pixel_size, artifacts=None):
+    """Create XML metadata files for the GeoTIFFs and browse images in PRODUCT (or `artifacts`, if given)
+
+    Returns:
+        xml_files: the names of the metadata files created in PRODUCT
+    """
+    from hyp3lib.make_arc_thumb import pngtothumb
 
-def create_xml_files(infile, outfile, height, type_, gamma0_flag, pixel_size):
-    """Create XML metadata files"""
-    cfgdir = os.path.abspath(os.path.join(os.path.dirname(hyp3_geocode.__file__), "etc"))
     back = os.getcwd()
     os.chdir("PRODUCT")
     now = datetime.datetime.now()
-    date = now.strftime("%Y%m%d")
-    time = now.strftime("%H%M%S")
-    dt = now.strftime("%Y-%m-%dT%H:%M:%S")
-    year = now.year
-    encoded_jpg = pngtothumb("{}.png".format(outfile))
     basename = os.path.basename(infile)
     granulename = os.path.splitext(basename)[0]
 
@@ -155,76 +332,96 @@ def create_xml_files(infile, outfile, height, type_, gamma0_flag, pixel_size):
     else:
         power_type = "sigma"
 
-    for myfile in glob.glob("*.tif"):
-        # NOTE: Need to open as bytes so we can write encoded_jpg thumbnail to file
-        with open("{cfgdir}/GeocodingTemplate.xml".format(cfgdir=cfgdir), "rb") as f:
-            with open("{myfile}.xml".format(myfile=myfile), "wb") as g:
-                if "vv" in myfile:
-                    pol = "vv"
-                elif "vh" in myfile:
-                    pol = "vh"
-                elif "hh" in myfile:
-                    pol = "hh"
-                elif "hv" in myfile:
-                    pol = "hv"
-
-                for line in f:
-                    line = line.replace(b"[DATE]", bytes(date, 'utf-8'))
-                    line = line.replace(b"[TIME]", bytes("{}00".format(time), 'utf-8'))
-                    line = line.replace(b"[DATETIME]", bytes(dt, 'utf-8'))
-                    line = line.replace(b"[HEIGHT]", bytes("{}".format(height), 'utf-8'))
-                    line = line.replace(b"[YEARPROCESSED]", bytes("{}".format(year), 'utf-8'))
-                    line = line.replace(b"[YEARACQUIRED]", bytes(infile[17:21], 'utf-8'))
-                    line = line.replace(b"[TYPE]", bytes(type_, 'utf-8'))
-                    line = line.replace(b"[FULL_TYPE]", bytes(full_type, 'utf-8'))
-                    line = line.replace(b"[SPACING]", bytes("{}".format(int(pixel_size)), 'utf-8'))
-                    line = line.replace(b"[THUMBNAIL_BINARY_STRING]", encoded_jpg)
-                    line = line.replace(b"[POL]", bytes(pol, 'utf-8'))
-                    line = line.replace(b"[POWERTYPE]", bytes(power_type, 'utf-8'))
-                    line = line.replace(b"[GRAN_NAME]", bytes(granulename, 'utf-8'))
-                    line = line.replace(b"[FORMAT]", b"power")
-                    g.write(line + b'\n')
-
-    for myfile in glob.glob("*.png"):
+    values = {
+        "DATE": now.strftime("%Y%m%d"),
+        "TIME": "{}00".format(now.strftime("%H%M%S")),
+        "DATETIME": now.strftime("%Y-%m-%dT%H:%M:%S"),
+        "YEARPROCESSED": "{}".format(now.year),
+        "YEARACQUIRED": infile[17:21],
+        "TYPE": type_,
+        "FULL_TYPE": full_type,
+        "GRAN_NAME": granulename,
+        "FORMAT": "power",
+    }
+    values = {key: bytes(value, 'utf-8') for key, value in values.items()}
+
+    # The thumbnail only depends on whether the browse is color or grayscale, so encode each one once
+    thumbnails = {}
+
+    def thumbnail(pngfile):
+        if pngfile not in thumbnails:
+            thumbnails[pngfile] = pngtothumb(pngfile)
+        return thumbnails[pngfile]
+
+    if artifacts is None:
+        tif_files = glob.glob("*.tif")
+        png_files = glob.glob("*.png")
+    else:
+        tif_files = [artifact.path for artifact in artifacts.find('geotiff')]
+        png_files = [artifact.path for role in ('browse', 'rgb_browse') for artifact in artifacts.find(role)]
+
+    xml_files = []
+    tif_template = get_template("GeocodingTemplate.xml")
+    for myfile in tif_files:
+        if "vv" in myfile:
+            pol = "vv"
+        elif "vh" in myfile:
+            pol = "vh"
+        elif "hh" in myfile:
+            pol = "hh"
+        elif "hv" in myfile:
+            pol = "hv"
+
+        tif_values = dict(
+            values,
+            HEIGHT=bytes("{}".format(height), 'utf-8'),
+            SPACING=bytes("{}".format(int(pixel_size)), 'utf-8'),
+            THUMBNAIL_BINARY_STRING=thumbnail("{}.png".format(outfile)),
+            POL=bytes(pol, 'utf-8'),
+            POWERTYPE=bytes(power_type, 'utf-8'),
+        )
+        xml_files.append(("{myfile}.xml".format(myfile=myfile), render(tif_template, tif_values)))
+
+    for myfile in png_files:
         if "rgb" in myfile:
             scale = 'color'
-            encoded_jpg = pngtothumb("{}_rgb.png".format(outfile))
+            encoded_jpg = thumbnail("{}_rgb.png".format(outfile))
         else:
             scale = 'grayscale'
-            encoded_jpg = pngtothumb("{}.png".format(outfile))
+            encoded_jpg = thumbnail("{}.png".format(outfile))
 
         if "large" in myfile:
             res = "medium"
         else:
             res = "low"
 
-        with open("{cfgdir}/GeocodingTemplate_{scale}_png.xml".format(cfgdir=cfgdir, scale=scale), "rb") as f:
-            with open("{myfile}.xml".format(myfile=myfile), "wb") as g:
-                for line in f:
-                    line = line.replace(b"[DATE]", bytes(date, 'utf-8'))
-                    line = line.replace(b"[TIME]", bytes("{}00".format(time), 'utf-8'))
-                    line = line.replace(b"[DATETIME]", bytes(dt, 'utf-8'))
-                    line = line.replace(b"[YEARPROCESSED]", bytes("{}".format(year), 'utf-8'))
-                    line = line.replace(b"[YEARACQUIRED]", bytes(infile[17:21], 'utf-8'))
-                    line = line.replace(b"[TYPE]", bytes(type_, 'utf-8'))
-                    line = line.replace(b"[FULL_TYPE]", bytes(full_type, 'utf-8'))
-                    line = line.replace(b"[THUMBNAIL_BINARY_STRING]", encoded_jpg)
-                    line = line.replace(b"[RES]", bytes(res, 'utf-8'))
-                    line = line.replace(b"[GRAN_NAME]", bytes(granulename, 'utf-8'))
-                    line = line.replace(b"[FORMAT]", b"power")
-                    g.write(line + b'\n')
+        png_template = get_template("GeocodingTemplate_{scale}_png.xml".format(scale=scale))
+        png_values = dict(values, THUMBNAIL_BINARY_STRING=encoded_jpg, RES=bytes(res, 'utf-8'))
+        xml_files.append(("{myfile}.xml".format(myfile=myfile), render(png_template, png_values)))
+
+    for xml_file, content in xml_files:
+        with open(xml_file, "wb") as g:
+            g.write(content)
 
     os.chdir(back)
+    return [xml_file for xml_file, _ in xml_files]
+
+
+def make_products(outfile, pol, cp=None, pixel_size=None):
+    """Make the browse images and move the products to PRODUCT, returning the `ArtifactManifest` of what was moved"""
+    from hyp3lib.makeAsfBrowse import makeAsfBrowse
 
+    from hyp3_geocode.browse import sigma_browse
+    from hyp3_geocode.rgb import rgb_decomposition
 
-def make_products(outfile, pol, cp=None):
-    # Create greyscale geotiff and ASF browse images
+    # Create greyscale ASF browse images
     tiffile = "{out}_{pol}.tif".format(out=outfile, pol=pol)
-    ampfile = createAmp(tiffile, nodata=0)
-    newfile = ampfile.replace(".tif", "_sigma.tif")
-    byteSigmaScale(ampfile, newfile)
-    makeAsfBrowse(newfile, outfile)
-    os.remove(newfile)
+    with metrics.stage('browse', pol=pol):
+        # NOTE: one read of the power GeoTIFF makes a scaled, browse resolution, amplitude image for makeAsfBrowse
+        browsefile = "{out}_{pol}_browse.tif".format(out=outfile, pol=pol)
+        sigma_browse(tiffile, browsefile)
+        makeAsfBrowse(browsefile, outfile)
+        os.remove(browsefile)
 
     # Create color ASF browse images
     if cp is not None:
@@ -233,54 +430,97 @@ def make_products(outfile, pol, cp=None):
         else:
             basename = "{}_hv".format(outfile)
         tiffile2 = "{}.tif".format(basename)
-        ampfile2 = createAmp(tiffile2, nodata=0)
-        outfile2 = ampfile2.replace(".tif", "_rgb.tif")
         threshold = -24
 
-        # Direct call to rtc2color overran the memory (128 GB)
-        #        rtc2color(ampfile,ampfile2, threshold, outfile2, amp=True, cleanup=True)
-        # Trying this instead
-        execute(f"rtc2color.py -amp -cleanup {ampfile} {ampfile2} {threshold} {outfile2}", uselogging=True)
+        with metrics.stage('colour_composite', pol=cp):
+            outfile2 = "{}_rgb.tif".format(basename)
+            # NOTE: A direct call to rtc2color overran the memory (128 GB), so decompose a block of lines at a time
+            rgb_decomposition(tiffile, tiffile2, threshold, outfile2, amp=False, cleanup=True)
 
-        colorname = "{}_rgb".format(outfile)
-        makeAsfBrowse(outfile2, colorname)
-        os.remove(ampfile2)
+        with metrics.stage('browse', pol=cp):
+            colorname = "{}_rgb".format(outfile)
+            makeAsfBrowse(outfile2, colorname)
         os.remove(outfile2)
 
-    os.remove(ampfile)
+    return ArtifactManifest(classify(name, pixel_size) for name in move_products())
+
+
+PRODUCT_PATTERNS = ("*.tif", "*_log.txt", "*.png*", "*.kmz")
 
-    # Move results to the PRODUCT directory
-    if not os.path.isdir("PRODUCT"):
-        os.mkdir("PRODUCT")
-    for tiffile in glob.glob("*.tif"):
-        shutil.move(tiffile, "PRODUCT")
-    for txtfile in glob.glob("*_log.txt"):
-        shutil.move(txtfile, "PRODUCT")
-    for pngfile in glob.glob("*.png*"):
-        shutil.move(pngfile, "PRODUCT")
-    for kmzfile in glob.glob("*.kmz"):
-        shutil.move(kmzfile, "PRODUCT")
+
+def move_products(product_dir="PRODUCT"):
+    """Move results to the PRODUCT directory, in one pass over the working directory, returning their names"""
+    if not os.path.isdir(product_dir):
+        os.mkdir(product_dir)
+    moved = []
+    for entry in os.scandir("."):
+        if entry.name.startswith(".") or not any(fnmatch.fnmatch(entry.name, p) for p in PRODUCT_PATTERNS):
+            continue
+        shutil.move(entry.name, product_dir)
+        moved.append(entry.name)
+    return sorted(moved)
 
 
 def geocode_sentinel(infile, outfile, pixel_size=30.0, height=0, gamma0_flag=False, post=None,
-                     offset=None):
+                     offset=None, jobs=1, lut_cache_dir=None, lut_cache_size=None, resume=False, fused_gamma0=False,
+                     verify_tolerance=None, cog=False, roi=None, scratch_dir=None, keep_intermediates=False):
+    """Geocode a Sentinel-1 granule
+
+    Args:
+        roi: optional (west, south, east, north) bounds to only geocode the part of the granule that's inside
+        scratch_dir: directory to write intermediate files under (default the working directory). They're kept
+            apart from the products, and each one is deleted as soon as the last stage using it has finished.
+        keep_intermediates: keep the intermediate files instead of deleting them
+    """
     if not os.path.exists(infile):
         logging.error("ERROR: Input file {} does not exist".format(infile))
         exit(1)
+
+    # NOTE: the scratch directory name is stable, so an interrupted run can be resumed from its intermediates
+    scratch = ScratchDir(os.path.join(scratch_dir or '.', f"{os.path.basename(outfile)}_scratch"),
+                         keep=keep_intermediates)
+    try:
+        with scratch.monitor():
+            _geocode_sentinel(infile, outfile, pixel_size, height, gamma0_flag, post, offset, jobs, lut_cache_dir,
+                              lut_cache_size, resume, fused_gamma0, verify_tolerance, cog, roi, scratch)
+    finally:
+        # NOTE: completed polarizations are still resumable without their intermediates
+        scratch.remove()
+        logging.info("Peak scratch usage was {:.2f} GB".format(scratch.peak / 1024 ** 3))
+        metrics.add_records([{'stage': 'scratch', 'peak_scratch_bytes': scratch.peak}])
+        metrics.write_metrics(metrics.metrics_file_name(outfile))
+
+
+def _geocode_sentinel(infile, outfile, pixel_size, height, gamma0_flag, post, offset, jobs, lut_cache_dir,
+                      lut_cache_size, resume, fused_gamma0, verify_tolerance, cog, roi, scratch):
+    from hyp3lib.getSubSwath import get_bounding_box_file
+
+    # Only delete the SAFE when it's extracted here
+    safe_dir = None
     if "zip" in infile:
-        zip_ref = zipfile.ZipFile(infile, 'r')
-        zip_ref.extractall(".")
-        zip_ref.close()
-        infile = infile.replace(".zip", ".SAFE")
+        with metrics.stage('unzip'):
+            infile = safe_dir = extract_safe(infile, scratch.root)
 
     type_ = 'GRD' if 'GRD' in infile else 'SLC'
 
+    # Record each completed stage so an interrupted run can pick up where it left off; digesting the files of every
+    #  stage costs a full read of each, so it's only done for resumable runs
+    checkpoints = Checkpoints(f"{outfile}_checkpoints.json" if resume else None, resume=resume)
+
     # Create par file covering the area we want to geocode
     lat_max, lat_min, lon_max, lon_min = get_bounding_box_file(infile)
     logging.debug("Input Coordinates: {} {} {} {}".format(lat_max, lat_min, lon_max, lon_min))
-    area_map = f"{outfile}_area_map"
-    dem_par_in = create_dem_par(area_map, "float", pixel_size, lat_max, lat_min, lon_max, lon_min, post)
-    execute(f"create_dem_par {area_map}.par < {dem_par_in}", uselogging=True)
+    area_map = scratch.path(f"{os.path.basename(outfile)}_area_map")
+    if roi is not None:
+        west, south, east, north = roi
+        roi = (north, south, east, west)
+        logging.info("Geocoding only the region of interest: {} {} {} {}".format(*roi))
+    dem_par_params = {'pixel_size': pixel_size, 'post': post, 'bounds': [lat_max, lat_min, lon_max, lon_min],
+                      'roi': roi}
+    with checkpoints.stage('create_dem_par', outputs=[f"{area_map}.par"], params=dem_par_params) as stage:
+        if not stage.done:
+            with metrics.stage('create_dem_par'):
+                create_dem_par(area_map, "float", pixel_size, lat_max, lat_min, lon_max, lon_min, post, roi=roi)
 
     # Get list of files to process
     vvlist = glob.glob("{}/*/*vv*.tiff".format(infile))
@@ -288,27 +528,71 @@ def geocode_sentinel(infile, outfile, pixel_size=30.0, height=0, gamma0_flag=Fal
     hhlist = glob.glob("{}/*/*hh*.tiff".format(infile))
     hvlist = glob.glob("{}/*/*hv*.tiff".format(infile))
 
+    chains = []
     pol = None
     cross_pol = None
     if vvlist:
         pol = "vv"
-        process_pol(pol, type_, infile, outfile, pixel_size, height, make_tab_flag=True, gamma0_flag=gamma0_flag,
-                    offset=offset)
+        chains.append((pol, True))
         if vhlist:
-            process_pol("vh", type_, infile, outfile, pixel_size, height, make_tab_flag=False, gamma0_flag=gamma0_flag,
-                        offset=offset)
             cross_pol = "vh"
+            chains.append((cross_pol, False))
     if hhlist:
         pol = "hh"
-        process_pol(pol, type_, infile, outfile, pixel_size, height, make_tab_flag=True, gamma0_flag=gamma0_flag,
-                    offset=offset)
+        chains.append((pol, True))
         if hvlist:
-            process_pol("hv", type_, infile, outfile, pixel_size, height, make_tab_flag=False, gamma0_flag=gamma0_flag,
-                        offset=offset)
             cross_pol = "hv"
-
-    make_products(outfile, pol, cp=cross_pol)
-    create_xml_files(infile, outfile, height, type_, gamma0_flag, pixel_size)
+            chains.append((cross_pol, False))
+
+    # NOTE: make_products moves the polarization GeoTIFFs, so their stages can only be resumed before it has run
+    product_params = {'chains': chains, 'pixel_size': pixel_size, 'height': height, 'gamma0': gamma0_flag,
+                      'offset': offset, 'fused': fused_gamma0, 'cog': cog}
+    # Each product is recorded in the artifact manifest as it's made, so PRODUCT is never listed
+    manifest_file = manifest_file_name(outfile)
+    sidecars = [os.path.basename(metrics.metrics_file_name(outfile)), os.path.basename(manifest_file)]
+    with checkpoints.stage('products', inputs=[f"{area_map}.par"], params=product_params) as stage:
+        if stage.done:
+            if os.path.isfile(manifest_file):
+                products = ArtifactManifest.read(manifest_file)
+            else:
+                products = ArtifactManifest.from_directory("PRODUCT", pixel_size, exclude=sidecars)
+            # Pick up this run's log file
+            products.artifacts.extend(classify(name, pixel_size) for name in move_products())
+            products.write(manifest_file)
+        else:
+            # Polarizations share their geometry, so only build each lookup table once per run (or across runs)
+            if lut_cache_dir is None:
+                lut_cache = LookupTableCache(scratch.path(f"{os.path.basename(outfile)}_lut_cache"))
+            else:
+                lut_cache = LookupTableCache(lut_cache_dir, max_bytes=lut_cache_size)
+
+            process_pols(chains, type_, infile, outfile, pixel_size, height, gamma0_flag=gamma0_flag, offset=offset,
+                         jobs=jobs, lut_cache=lut_cache, checkpoints=checkpoints, fused_gamma0=fused_gamma0,
+                         verify_tolerance=verify_tolerance, cog=cog, scratch=scratch)
+
+            if lut_cache_dir is None:
+                shutil.rmtree(lut_cache.cache_dir)
+            if safe_dir is not None:
+                scratch.release(safe_dir)
+
+            products = make_products(outfile, pol, cp=cross_pol, pixel_size=pixel_size)
+            products.write(manifest_file)
+            # The run's log is still being written, so it can't be checked on resume
+            stage.outputs = [os.path.join("PRODUCT", artifact.path) for artifact in products.artifacts
+                             if artifact.role != 'log']
+
+    # NOTE: remade products need their metadata remade, so their metadata isn't missing from the manifest
+    described = [os.path.join("PRODUCT", artifact.path) for artifact in products.artifacts
+                 if artifact.role in ('geotiff', 'browse', 'rgb_browse')]
+    with checkpoints.stage('xml', inputs=described, params={'height': height, 'gamma0': gamma0_flag}) as stage:
+        if not stage.done:
+            with metrics.stage('xml'):
+                xml_files = create_xml_files(os.path.basename(infile), outfile, height, type_, gamma0_flag,
+                                             pixel_size, artifacts=products)
+            recorded = {artifact.path for artifact in products.artifacts}
+            products.artifacts.extend(classify(name, pixel_size) for name in xml_files if name not in recorded)
+            products.write(manifest_file)
+            stage.outputs = [os.path.join("PRODUCT", name) for name in xml_files]
 
 
 def main():
@@ -331,6 +615,29 @@ def main():
                         help="Make output gamma0 instead of sigma0")
     parser.add_argument("-o", "--offset",
                         help="Optional offset file to use during geocoding")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of polarizations to process in parallel (default 1)")
+    parser.add_argument("--lut-cache",
+                        help="Directory to cache geocoding lookup tables in across runs")
+    parser.add_argument("--lut-cache-size", type=float,
+                        help="Maximum size of the lookup table cache in GB (default unbounded)")
+    parser.add_argument("--fused-gamma0", action="store_true",
+                        help="Convert to gamma0 and blank the edges in one pass in python, instead of with radcal_MLI")
+    parser.add_argument("--verify-fused-gamma0", type=float, metavar="TOLERANCE",
+                        help="Also run radcal_MLI, and fail if the fused gamma0 differs by more than this relative "
+                             "tolerance (e.g., 0.01)")
+    parser.add_argument("--cog", action="store_true",
+                        help="Write tiled, compressed, GeoTIFFs with internal overviews (cloud-optimized GeoTIFFs)")
+    parser.add_argument("--roi", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                        help="Only geocode the part of the granule inside these lat/lon bounds")
+    parser.add_argument("--scratch-dir",
+                        help="Directory to write intermediate files under, e.g., on local NVMe or tmpfs "
+                             "(default the working directory)")
+    parser.add_argument("--keep-intermediates", action="store_true",
+                        help="Keep intermediate files instead of deleting them as soon as they're no longer needed")
+    parser.add_argument("--resume", action="store_true",
+                        help="Record checkpoints, and skip stages completed by a previous --resume run whose outputs "
+                             "are still valid")
     parser.add_argument('--version', action='version',
                         version='%(prog)s {}'.format(hyp3_geocode.__version__))
     args = parser.parse_args()
@@ -345,7 +652,11 @@ def main():
 
     geocode_sentinel(
         args.infile, args.outfile, height=args.terrain_height, pixel_size=args.pixel_size,
-        gamma0_flag=args.gamma0, post=args.post, offset=args.offset
+        gamma0_flag=args.gamma0, post=args.post, offset=args.offset, jobs=args.jobs,
+        lut_cache_dir=args.lut_cache,
+        lut_cache_size=None if args.lut_cache_size is None else int(args.lut_cache_size * 1024 ** 3),
+        resume=args.resume, fused_gamma0=args.fused_gamma0, verify_tolerance=args.verify_fused_gamma0, cog=args.cog,
+        roi=args.roi, scratch_dir=args.scratch_dir, keep_intermediates=args.keep_intermediates
     )
 
 
@@ -0,0 +1,36 @@
+"""Compiled XML metadata templates"""
+
+import os
+import re
+from functools import lru_cache
+
+import hyp3_geocode
+
+ETC_DIR = os.path.abspath(os.path.join(os.path.dirname(hyp3_geocode.__file__), 'etc'))
+
+_TOKEN = re.compile(rb'\[([A-Z_]+)\]')
+
+
+@lru_cache(maxsize=None)
+def compile_template(template_file):
+    """Parse a template into alternating literal bytes and token names
+
+    NOTE: Each template line is followed by an extra newline, as metadata files have always been written.
+    """
+    with open(template_file, 'rb') as f:
+        text = b''.join(line + b'\n' for line in f)
+    parts = _TOKEN.split(text)
+    return tuple(part.decode('ascii') if ii % 2 else part for ii, part in enumerate(parts))
+
+
+def render(template, values):
+    """Substitute `values` for the tokens of a compiled template in a single pass, leaving unknown tokens as is"""
+    return b''.join(
+        part if not ii % 2 else values.get(part, '[{}]'.format(part).encode('ascii'))
+        for ii, part in enumerate(template)
+    )
+
+
+def get_template(name):
+    """Compiled template `name` from the `hyp3_geocode.etc` directory"""
+    return compile_template(os.path.join(ETC_DIR, name))
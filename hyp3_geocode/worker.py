@@ -0,0 +1,317 @@
+"""Run several processing jobs at once, admitting each against the node's CPU, memory, and scratch disk"""
+
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import time
+from contextlib import contextmanager
+
+from hyp3proclib.logger import log
+from hyp3proclib.proc_base import Processor
+
+GB = 1024 ** 3
+
+# Worker states
+POLLING, RUNNING, WAITING = 0, 1, 2
+
+
+def available_memory():
+    """Memory available for new jobs without swapping, in bytes"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def total_memory():
+    """Physical memory of the node, in bytes"""
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+class JobBudget:
+    """Resources reserved for each running job
+
+    Args:
+        cpus: number of CPUs
+        memory: memory in bytes
+        disk: scratch disk space in bytes
+    """
+    def __init__(self, cpus=2, memory=8 * GB, disk=50 * GB):
+        self.cpus = cpus
+        self.memory = memory
+        self.disk = disk
+
+    @classmethod
+    def from_environment(cls, environ=None):
+        """Budget from the `GEOCODE_JOB_CPUS`, `GEOCODE_JOB_MEMORY_GB`, and `GEOCODE_JOB_DISK_GB` variables"""
+        environ = os.environ if environ is None else environ
+        default = cls()
+        return cls(
+            cpus=float(environ.get('GEOCODE_JOB_CPUS', default.cpus)),
+            memory=int(float(environ.get('GEOCODE_JOB_MEMORY_GB', default.memory / GB)) * GB),
+            disk=int(float(environ.get('GEOCODE_JOB_DISK_GB', default.disk / GB)) * GB),
+        )
+
+
+class Admission:
+    """Reserve a job's budget out of the node's resources, across worker processes
+
+    While other jobs are running, a job is only admitted if the CPUs and memory they've reserved leave room for its
+    budget, and the memory and scratch disk that are actually free right now cover it.
+
+    Args:
+        budget: the `JobBudget` of each job
+        scratch_dir: the directory jobs work in
+        cpus: CPUs to share between jobs (default all)
+        memory: memory to share between jobs in bytes (default all)
+        poll_time: seconds to wait between admission attempts
+    """
+    def __init__(self, budget, scratch_dir='.', cpus=None, memory=None, poll_time=5):
+        self.budget = budget
+        self.scratch_dir = scratch_dir
+        self.cpus = cpus or os.cpu_count()
+        self.memory = memory or total_memory()
+        self.poll_time = poll_time
+        self.shutdown = multiprocessing.Event()
+        self._lock = multiprocessing.Lock()
+        self._reserved = multiprocessing.Array('d', 2, lock=False)
+
+    def max_jobs(self):
+        """The most jobs the node could run at once"""
+        by_cpu = self.cpus // self.budget.cpus
+        by_memory = self.memory // self.budget.memory if self.budget.memory else by_cpu
+        by_disk = shutil.disk_usage(self.scratch_dir).total // self.budget.disk if self.budget.disk else by_cpu
+        return max(1, int(min(by_cpu, by_memory, by_disk)))
+
+    def _has_room(self, cpus, memory):
+        return (
+            cpus + self.budget.cpus <= self.cpus
+            and memory + self.budget.memory <= self.memory
+            and available_memory() >= self.budget.memory
+            and shutil.disk_usage(self.scratch_dir).free >= self.budget.disk
+        )
+
+    def try_acquire(self):
+        """Reserve a job's budget, if there is room for it"""
+        with self._lock:
+            cpus, memory = self._reserved
+            # A lone job is always admitted, like when running one job at a time
+            if cpus and not self._has_room(cpus, memory):
+                return False
+            self._reserved[0] = cpus + self.budget.cpus
+            self._reserved[1] = memory + self.budget.memory
+            return True
+
+    def acquire(self):
+        """Wait to reserve a job's budget; returns False if shutting down instead"""
+        while not self.shutdown.is_set():
+            if self.try_acquire():
+                return True
+            self.shutdown.wait(self.poll_time)
+        return False
+
+    def release(self):
+        """Give back a job's budget"""
+        with self._lock:
+            self._reserved[0] -= self.budget.cpus
+            self._reserved[1] -= self.budget.memory
+
+
+@contextmanager
+def job_log(log_file):
+    """Also log to `log_file` for the duration of a job"""
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%m/%d/%Y %I:%M:%S %p'))
+    log.addHandler(handler)
+    try:
+        yield
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+
+def _run_worker(index, admission, states, processor_args, processor_kwargs):
+    """Claim and process jobs, one at a time, whenever there's budget for them"""
+    # The parent decides when to stop: it terminates idle workers, and running jobs are always allowed to finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    name, proc_func = processor_args[:2]
+    if not admission.acquire():
+        return
+    states[index] = POLLING
+
+    def process_job(cfg, n):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        states[index] = RUNNING
+        base_workdir = cfg['workdir']
+        cfg['workdir'] = os.path.join(base_workdir, 'worker{}'.format(index))
+        os.makedirs(cfg['workdir'], exist_ok=True)
+        log_dir = os.path.join(base_workdir, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = os.path.join(log_dir, '{}_{}_{}.log'.format(name, cfg.get('granule', 'job'), os.getpid()))
+        try:
+            with job_log(log_file):
+                proc_func(cfg, n)
+        finally:
+            cfg['workdir'] = base_workdir
+            admission.release()
+            # Don't go back to claiming jobs until there's budget for another one
+            states[index] = WAITING
+            if not admission.acquire():
+                sys.exit(0)
+            states[index] = POLLING
+            signal.signal(signal.SIGTERM, terminate)
+
+    def terminate(signum, frame):
+        # Stopped by the parent while polling, i.e., not running a job
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        Processor(name, process_job, *processor_args[2:], **processor_kwargs).run()
+    finally:
+        if states[index] == POLLING:
+            admission.release()
+
+
+def run_workers(admission, max_jobs, *processor_args, **processor_kwargs):
+    """Run up to `max_jobs` processors at once, each with its own work directory and job logs
+
+    Workers are started on demand: a new one is only started once all the others are busy. On SIGINT or SIGTERM, no
+    more jobs are claimed, idle workers are stopped, and busy ones finish their job before exiting.
+    """
+    if max_jobs < 2:
+        Processor(*processor_args, **processor_kwargs).run()
+        return
+
+    def stop(signum, frame):
+        log.info('Received signal {}; finishing running jobs before exiting'.format(signum))
+        admission.shutdown.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    states = multiprocessing.Array('b', max_jobs)
+    workers = {}
+
+    def start_worker(index):
+        states[index] = WAITING
+        workers[index] = multiprocessing.Process(
+            target=_run_worker, args=(index, admission, states, processor_args, processor_kwargs)
+        )
+        workers[index].start()
+
+    log.info('Running up to {} jobs at once'.format(max_jobs))
+    start_worker(0)
+    exitcode = 0
+    while True:
+        time.sleep(1)
+        for index, worker in list(workers.items()):
+            if not worker.is_alive():
+                exitcode = exitcode or worker.exitcode
+                del workers[index]
+        if not workers:
+            break
+
+        if admission.shutdown.is_set():
+            # Workers waiting for budget exit on their own
+            for index, worker in workers.items():
+                if states[index] == POLLING:
+                    worker.terminate()
+        elif len(workers) < max_jobs and all(states[index] == RUNNING for index in workers):
+            start_worker(min(set(range(max_jobs)) - set(workers)))
+
+    if exitcode:
+        sys.exit(exitcode)
+
+
+def _run_job(job, workdir, name, proc_func, configure=None):
+    """Process a claimed job in its own work directory, with its own log
+
+    The exit code is 0 if the job succeeded, and 1 if it failed (i.e., `proc_func` returned False or raised).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    cfg = dict(job) if configure is None else configure(job)
+    cfg['workdir'] = os.path.join(workdir, 'job{}'.format(job['id']))
+    os.makedirs(cfg['workdir'], exist_ok=True)
+    log_dir = os.path.join(workdir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, '{}_{}_{}.log'.format(name, cfg.get('granule', 'job'), os.getpid()))
+    with job_log(log_file):
+        succeeded = proc_func(cfg, 1)
+    if succeeded is False:
+        sys.exit(1)
+
+
+def _finish_job(queue, job, exitcode):
+    """Record how a job's process ended in the job queue"""
+    if exitcode == 0:
+        queue.finish(job['id'], succeeded=True)
+    elif exitcode < 0 and exitcode != -signal.SIGKILL:
+        # Stopped from outside (e.g., the node is being shut down), so another worker can run it
+        log.warning('Job {} was stopped by signal {}; putting it back in the queue'.format(job['id'], -exitcode))
+        queue.requeue([job['id']])
+    else:
+        # NOTE: a job killed with SIGKILL (e.g., by the OOM killer) would most likely be killed again
+        log.error('Job {} failed with exit code {}'.format(job['id'], exitcode))
+        queue.finish(job['id'], succeeded=False)
+
+
+def run_intake(intake, admission, max_jobs, name, proc_func, workdir='.', configure=None):
+    """Process the jobs `intake` claims, up to `max_jobs` at once, each in its own process
+
+    A job is only taken from the intake once there's budget to start it. The budget is given back, and the job is
+    marked done or failed in the queue, when its process exits, however it exits. On SIGINT or SIGTERM, jobs that
+    were claimed but not started are put back in the queue, and running jobs finish before this returns.
+
+    Args:
+        configure: function making a job's `cfg` from its queue row (default the row itself)
+    """
+    def stop(signum, frame):
+        log.info('Received signal {}; finishing running jobs before exiting'.format(signum))
+        admission.shutdown.set()
+        intake.notify()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    running = {}
+
+    def reap(wait=False):
+        for process, job in list(running.items()):
+            if wait:
+                process.join()
+            if process.is_alive():
+                continue
+            process.join()
+            del running[process]
+            admission.release()
+            _finish_job(intake.queue, job, process.exitcode)
+
+    log.info('Running up to {} jobs at once, claiming up to {} at a time'.format(max_jobs, intake.batch_size))
+    try:
+        while not admission.shutdown.is_set():
+            reap()
+            if len(running) >= max_jobs or not admission.try_acquire():
+                admission.shutdown.wait(1)
+                continue
+
+            job = intake.next_job(stop=admission.shutdown)
+            if job is None:
+                admission.release()
+                break
+            process = multiprocessing.Process(target=_run_job, args=(job, workdir, name, proc_func, configure))
+            process.start()
+            running[process] = job
+    finally:
+        intake.close()
+        reap(wait=True)
@@ -52,6 +52,7 @@ setup(
     entry_points={'console_scripts': [
             'hyp3_geocode = hyp3_geocode.__main__:main',
             'geocode_sentinel.py = hyp3_geocode.sentinel:main',
+            'geocode_sentinel_batch.py = hyp3_geocode.batch:main',
         ]
     },
 
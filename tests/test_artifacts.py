@@ -0,0 +1,36 @@
+from hyp3_geocode import artifacts
+
+
+def test_classify():
+    assert artifacts.classify('S1A_IW_RT30_G_gpn_VV.tif', 30.0) == artifacts.Artifact(
+        'geotiff', 'S1A_IW_RT30_G_gpn_VV.tif', pol='vv', resolution='30m'
+    )
+    assert artifacts.classify('S1A_IW_RT30_G_gpn_vh.tif.xml').role == 'metadata'
+    assert artifacts.classify('S1A_IW_RT30_G_gpn_vh.tif.xml').pol == 'vh'
+    assert artifacts.classify('S1A_IW_RT30_G_gpn.png.aux.xml').role == 'aux'
+    assert artifacts.classify('S1A_IW_RT30_G_gpn_rgb_large.png') == artifacts.Artifact(
+        'rgb_browse', 'S1A_IW_RT30_G_gpn_rgb_large.png', resolution='medium'
+    )
+    assert artifacts.classify('S1A_IW_RT30_G_gpn.kmz').role == 'kmz'
+    assert artifacts.classify('S1A_IW_RT30_G_gpn_1234_log.txt').role == 'log'
+
+
+def test_manifest(tmp_path):
+    names = ['out_vv.tif', 'out_vh.tif', 'out.png', 'out_large.png', 'out_rgb.png', 'out_rgb_large.png',
+             'out_metrics.json']
+    for name in names:
+        (tmp_path / name).write_bytes(b'')
+    (tmp_path / 'subdir').mkdir()
+
+    manifest = artifacts.ArtifactManifest.from_directory(str(tmp_path), 10.0, exclude=['out_metrics.json'])
+    assert len(manifest.artifacts) == 6
+    assert [a.path for a in manifest.find('geotiff', pol='vh')] == ['out_vh.tif']
+    assert manifest.browse() == 'out_rgb.png'
+
+    manifest_file = str(tmp_path / 'out_artifacts.json')
+    manifest.write(manifest_file)
+    assert artifacts.ArtifactManifest.read(manifest_file).artifacts == manifest.artifacts
+
+    grayscale = artifacts.ArtifactManifest(manifest.find('browse'))
+    assert grayscale.browse() == 'out.png'
+    assert artifacts.ArtifactManifest().browse() is None
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from hyp3_geocode import batch
+
+
+def test_parse_items(tmp_path):
+    items = batch.parse_items([
+        '# reprocessing campaign\n',
+        'S1A_IW_GRDH_1SDV_A.zip out/S1A_IW_RT30_A -t 250 -g\n',
+        '\n',
+        'S1B_IW_GRDH_1SDV_B.zip S1B_IW_RT10_B -s 10 --resume\n',
+    ])
+    assert [item['outfile'] for item in items] == ['S1A_IW_RT30_A', 'S1B_IW_RT10_B']
+    assert items[0]['infile'] == os.path.abspath('S1A_IW_GRDH_1SDV_A.zip')
+    assert items[0]['height'] == 250.0
+    assert items[0]['gamma0_flag']
+    assert items[1]['pixel_size'] == 10.0
+    assert items[1]['resume']
+
+    with pytest.raises(batch.BatchItemError):
+        batch.parse_items(['S1A_IW_GRDH_1SDV_A.zip out -x'])
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    def geocode_sentinel(infile, outfile, **kwargs):
+        if 'bad' in infile:
+            raise RuntimeError('no bursts')
+        os.mkdir('PRODUCT')
+
+    monkeypatch.setattr(batch.sentinel, 'geocode_sentinel', geocode_sentinel)
+    items = batch.parse_items(['good.zip good_out', 'bad.zip bad_out'])
+    results = {result['outfile']: result for result in batch.run_batch(items, str(tmp_path))}
+
+    assert results['good_out']['status'] == 'succeeded'
+    assert os.path.isdir(tmp_path / 'good_out' / 'PRODUCT')
+    assert results['bad_out']['status'] == 'failed'
+    assert results['bad_out']['error'] == 'no bursts'
@@ -0,0 +1,40 @@
+import numpy as np
+
+from hyp3_geocode import browse
+
+
+def _two_sigma_cutoffs(data):
+    # The cutoffs of hyp3lib.byteSigmaScale.get2sigmacutoffs
+    data = data.astype(float)
+    data[data == 0] = np.nan
+    top = np.nanpercentile(data, 99)
+    data[data > top] = top
+    stddev = np.nanstd(data)
+    mean = np.nanmean(data)
+    return mean - 2 * stddev, mean + 2 * stddev
+
+
+def test_two_sigma_cutoffs():
+    rng = np.random.default_rng(11)
+    amplitude = rng.lognormal(-2.0, 1.0, (300, 200))
+    amplitude[:20] = 0
+
+    statistics = browse.AmplitudeStatistics()
+    for block in np.array_split(amplitude, 7):
+        statistics.update(block[block > 0])
+
+    assert np.allclose(statistics.two_sigma_cutoffs(), _two_sigma_cutoffs(amplitude), rtol=1e-3)
+    assert browse.AmplitudeStatistics().two_sigma_cutoffs() == (0.0, 0.0)
+
+
+def test_cell_means():
+    amplitude = np.array([
+        [1.0, 3.0, 0.0, 0.0, 5.0],
+        [0.0, 2.0, 0.0, 0.0, 0.0],
+        [4.0, 4.0, 1.0, 0.0, 7.0],
+    ])
+    assert np.array_equal(browse._cell_means(amplitude, 2), [
+        [2.0, 0.0, 5.0],
+        [4.0, 1.0, 7.0],
+    ])
+    assert np.array_equal(browse._cell_means(amplitude, 1), amplitude)
@@ -0,0 +1,76 @@
+from hyp3_geocode import checkpoint
+
+
+def _run(checkpoints, name, inputs, output, params=None):
+    with checkpoints.stage(name, inputs=inputs, outputs=[output], params=params) as stage:
+        if not stage.done:
+            with open(output, 'a') as f:
+                f.write('x')
+    return stage.done
+
+
+def test_checkpoints(tmp_path):
+    manifest = str(tmp_path / 'checkpoints.json')
+    infile, outfile = tmp_path / 'in.dat', tmp_path / 'out.dat'
+    infile.write_text('input')
+
+    assert not _run(checkpoint.Checkpoints(manifest), 'a', [str(infile)], str(outfile), {'height': 0})
+    assert outfile.read_text() == 'x'
+
+    resumed = checkpoint.Checkpoints(manifest, resume=True)
+    assert _run(resumed, 'a', [str(infile)], str(outfile), {'height': 0})
+    assert outfile.read_text() == 'x'
+
+    # different parameters
+    assert not resumed.valid('a', {'height': 100})
+
+    # changed inputs
+    infile.write_text('changed')
+    assert not resumed.valid('a', {'height': 0})
+
+    # consumed inputs don't invalidate the stage, but changed outputs do
+    infile.unlink()
+    assert resumed.valid('a', {'height': 0})
+    outfile.write_text('truncat')
+    assert not resumed.valid('a', {'height': 0})
+
+
+def test_checkpoints_without_resume(tmp_path):
+    manifest = tmp_path / 'checkpoints.json'
+    outfile = tmp_path / 'out.dat'
+    _run(checkpoint.Checkpoints(str(manifest)), 'a', [], str(outfile))
+    assert manifest.exists()
+
+    assert not _run(checkpoint.Checkpoints(str(manifest)), 'a', [], str(outfile))
+    assert outfile.read_text() == 'xx'
+
+    assert not _run(checkpoint.Checkpoints(None, resume=True), 'a', [], str(outfile))
+
+
+def test_checkpoints_not_recorded(tmp_path, monkeypatch):
+    def file_digest(path):
+        raise AssertionError('{} was digested'.format(path))
+    monkeypatch.setattr(checkpoint, 'file_digest', file_digest)
+
+    infile, outfile = tmp_path / 'in.dat', tmp_path / 'out.dat'
+    infile.write_text('input')
+    assert not _run(checkpoint.Checkpoints(None), 'a', [str(infile)], str(outfile))
+    assert outfile.read_text() == 'x'
+
+
+def test_file_digest(tmp_path):
+    big = tmp_path / 'big.dat'
+    big.write_bytes(b'\0' * (3 * 1024 * 1024))
+    digest = checkpoint.file_digest(str(big))
+
+    with open(big, 'r+b') as f:
+        f.seek(-1, 2)
+        f.write(b'\1')
+    assert checkpoint.file_digest(str(big)) != digest
+    digest = checkpoint.file_digest(str(big))
+
+    # e.g., blank_bad_data rewriting the middle of a file in place
+    with open(big, 'r+b') as f:
+        f.seek(1536 * 1024)
+        f.write(b'\1')
+    assert checkpoint.file_digest(str(big)) != digest
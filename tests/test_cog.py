@@ -0,0 +1,33 @@
+import numpy as np
+from osgeo import gdal, osr
+
+from hyp3_geocode import cog
+
+
+def _write_tif(filename, data):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32610)
+    raster = gdal.GetDriverByName('GTiff').Create(filename, data.shape[1], data.shape[0], 1, gdal.GDT_Float32)
+    raster.SetGeoTransform((500000.0, 30.0, 0, 4000000.0, 0, -30.0))
+    raster.SetProjection(srs.ExportToWkt())
+    raster.GetRasterBand(1).WriteArray(data)
+    raster = None
+
+
+def test_make_cog(tmp_path):
+    data = np.random.default_rng(5).random((1100, 1500), dtype=np.float32)
+    tif, cog_tif = str(tmp_path / 'strips.tif'), str(tmp_path / 'cog.tif')
+    _write_tif(tif, data)
+
+    cog.make_cog(tif, cog_tif, blocksize=256)
+
+    raster = gdal.Open(cog_tif)
+    band = raster.GetRasterBand(1)
+    assert band.GetBlockSize() == [256, 256]
+    assert band.GetOverviewCount() > 0
+    assert band.GetNoDataValue() == 0
+    assert raster.GetGeoTransform() == (500000.0, 30.0, 0, 4000000.0, 0, -30.0)
+    assert np.array_equal(band.ReadAsArray(), data)
+
+    assert cog.browse_band(band, 2048) is band
+    assert cog.browse_band(band, 500).XSize == 750
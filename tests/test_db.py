@@ -0,0 +1,109 @@
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+
+from hyp3_geocode import db
+
+
+def _pool(tmp_path, **kwargs):
+    database = str(tmp_path / 'hyp3.db')
+    conn = sqlite3.connect(database)
+    conn.execute('CREATE TABLE products (name TEXT)')
+    conn.commit()
+    conn.close()
+
+    connections = []
+
+    def connect():
+        connections.append(sqlite3.connect(database, check_same_thread=False))
+        return connections[-1]
+    return db.ConnectionPool(connect, **kwargs), connections, database
+
+
+def _names(database):
+    conn = sqlite3.connect(database)
+    names = [row[0] for row in conn.execute('SELECT name FROM products')]
+    conn.close()
+    return names
+
+
+def test_connection_pool_reuses_connections(tmp_path):
+    pool, connections, database = _pool(tmp_path)
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO products VALUES ('a')")
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO products VALUES ('b')")
+    assert len(connections) == 1
+    assert _names(database) == ['a', 'b']
+
+    pool.max_idle_time = 0
+    with pool.connection():
+        pass
+    assert len(connections) == 2
+
+
+def test_connection_pool_discards_on_error(tmp_path):
+    pool, connections, database = _pool(tmp_path)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO products VALUES ('a')")
+            raise ValueError('upload failed')
+    assert _names(database) == []
+
+    with pool.connection():
+        pass
+    assert len(connections) == 2
+
+
+def test_connection_pool_is_bounded(tmp_path):
+    pool, connections, _ = _pool(tmp_path, max_size=2, timeout=0.1)
+    with pool.connection(), pool.connection():
+        with pytest.raises(db.PoolTimeout):
+            with pool.connection():
+                pass
+    with pool.connection():
+        pass
+    pool.close()
+
+
+def _check_out(pool, result):
+    try:
+        with pool.connection():
+            result.value = 1
+    except db.PoolTimeout:
+        result.value = -1
+
+
+def test_connection_pool_closes_idle_connections(tmp_path):
+    pool, connections, _ = _pool(tmp_path, max_size=1, max_idle_time=0.5, timeout=0.1)
+    with pool.connection():
+        pass
+
+    # An idle connection still counts against the bound, for every process
+    result = multiprocessing.Value('i', 0)
+    child = multiprocessing.Process(target=_check_out, args=(pool, result))
+    child.start()
+    child.join()
+    assert result.value == -1
+
+    # It's closed in the background, without another checkout
+    time.sleep(1)
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute('SELECT 1')
+    child = multiprocessing.Process(target=_check_out, args=(pool, result))
+    child.start()
+    child.join()
+    assert result.value == 1
+
+
+def test_connection_pool_releases_exited_jobs(tmp_path):
+    pool, _, _ = _pool(tmp_path, max_size=2, timeout=2)
+    # More jobs than slots, each exiting with its connection still idle in the pool
+    for _ in range(3):
+        result = multiprocessing.Value('i', 0)
+        child = multiprocessing.Process(target=_check_out, args=(pool, result))
+        child.start()
+        child.join()
+        assert result.value == 1
@@ -1,3 +1,7 @@
+import subprocess
+import sys
+
+
 def test_hyp3_geocode(script_runner):
     ret = script_runner.run('hyp3_geocode', '-h')
     assert ret.success
@@ -6,3 +10,15 @@ def test_hyp3_geocode(script_runner):
 def test_proc_geocode(script_runner):
     ret = script_runner.run('geocode_sentinel.py', '-h')
     assert ret.success
+
+
+def test_geocode_sentinel_batch(script_runner):
+    ret = script_runner.run('geocode_sentinel_batch.py', '-h')
+    assert ret.success
+
+
+def test_startup_imports():
+    code = 'import sys, hyp3_geocode.sentinel, hyp3_geocode.batch, hyp3_geocode.__main__; print(" ".join(sys.modules))'
+    modules = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE).stdout.decode().split()
+    for heavy in ('numpy', 'osgeo', 'hyp3proclib', 'hyp3lib.asf_geometry', 'hyp3lib.ingest_S1_granule'):
+        assert heavy not in modules
@@ -0,0 +1,74 @@
+import os
+import zipfile
+
+import pytest
+
+from hyp3_geocode import granule_cache
+
+
+def _download(zip_file, size):
+    with open(zip_file, 'wb') as f:
+        f.write(b'PK' + b'\0' * size)
+
+
+def test_granule_cache(tmp_path):
+    cache = granule_cache.GranuleCache(str(tmp_path / 'cache'), max_bytes=250)
+
+    first = str(tmp_path / 'first.zip')
+    with cache.lookup('S1A_A', first) as hit:
+        assert not hit
+        _download(first, 98)
+    assert cache.cached('S1A_A')
+
+    second = str(tmp_path / 'second.zip')
+    with cache.lookup('S1A_A', second) as hit:
+        assert hit
+    assert os.path.samefile(first, second)
+    os.remove(second)
+    assert cache.cached('S1A_A')
+    assert not cache.cached('S1A_B')
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+    assert sorted(os.listdir(cache.cache_dir)) == ['S1A_A.lock', 'S1A_A.zip', 'stats.json', 'stats.lock']
+
+
+def test_granule_cache_eviction(tmp_path):
+    cache = granule_cache.GranuleCache(str(tmp_path / 'cache'), max_bytes=350)
+    for index, granule in enumerate(['S1A_A', 'S1A_B', 'S1A_C']):
+        zip_file = str(tmp_path / '{}.zip'.format(granule))
+        _download(zip_file, 98)
+        cache.store(granule, zip_file)
+        os.utime(os.path.join(cache.cache_dir, '{}.zip'.format(granule)), (index, index))
+
+    # Touch A, so B is the least recently used
+    assert cache.fetch('S1A_A', str(tmp_path / 'again.zip'))
+    _download(str(tmp_path / 'S1A_D.zip'), 98)
+    cache.store('S1A_D', str(tmp_path / 'S1A_D.zip'))
+
+    assert not cache.cached('S1A_B')
+    for granule in ['S1A_A', 'S1A_C', 'S1A_D']:
+        assert cache.cached(granule)
+
+
+def test_granule_cache_only_keeps_extracted_zips(tmp_path):
+    cache = granule_cache.GranuleCache(str(tmp_path / 'cache'))
+    zip_file = str(tmp_path / 'S1A_A.zip')
+
+    # Not cached if extracting the download fails
+    with pytest.raises(zipfile.BadZipFile):
+        with cache.lookup('S1A_A', zip_file) as hit:
+            assert not hit
+            _download(zip_file, 98)
+            zipfile.ZipFile(zip_file)
+    assert not cache.cached('S1A_A')
+
+    with cache.lookup('S1A_A', zip_file) as hit:
+        assert not hit
+        _download(zip_file, 98)
+    os.remove(zip_file)
+
+    # Evicted if extracting the cached zip fails
+    with pytest.raises(zipfile.BadZipFile):
+        with cache.lookup('S1A_A', zip_file) as hit:
+            assert hit
+            zipfile.ZipFile(zip_file)
+    assert not cache.cached('S1A_A')
@@ -0,0 +1,187 @@
+import os
+import signal
+import sqlite3
+import threading
+import time
+
+from hyp3_geocode import intake, worker
+
+
+def _job_queue(tmp_path, jobs):
+    db = str(tmp_path / 'hyp3.db')
+    conn = sqlite3.connect(db)
+    conn.execute('CREATE TABLE local_queue (id INTEGER PRIMARY KEY, status TEXT, processor TEXT, priority INTEGER, '
+                 'granule TEXT)')
+    conn.executemany('INSERT INTO local_queue (status, processor, priority, granule) VALUES (?, ?, ?, ?)', jobs)
+    conn.commit()
+    conn.close()
+    return intake.JobQueue(lambda: sqlite3.connect(db), 'geocode_gamma', dialect='sqlite')
+
+
+def _statuses(queue):
+    conn = queue.connect()
+    statuses = dict(conn.execute('SELECT id, status FROM local_queue').fetchall())
+    conn.close()
+    return statuses
+
+
+def test_job_queue(tmp_path):
+    queue = _job_queue(tmp_path, [
+        ('QUEUED', 'geocode_gamma', 0, 'a'),
+        ('QUEUED', 'geocode_gamma', 5, 'b'),
+        ('QUEUED', 'other', 9, 'c'),
+        ('COMPLETE', 'geocode_gamma', 9, 'd'),
+        ('QUEUED', 'geocode_gamma', 0, 'e'),
+    ])
+
+    jobs = queue.claim(2)
+    assert [job['granule'] for job in jobs] == ['b', 'a']
+    assert jobs[0]['status'] == 'PROCESSING'
+    assert [job['granule'] for job in queue.claim(2)] == ['e']
+    assert queue.claim(2) == []
+
+    queue.requeue([jobs[1]['id']])
+    assert _statuses(queue) == {1: 'QUEUED', 2: 'PROCESSING', 3: 'QUEUED', 4: 'COMPLETE', 5: 'PROCESSING'}
+
+    queue.finish(2, succeeded=True)
+    queue.finish(5, succeeded=False)
+    assert _statuses(queue) == {1: 'QUEUED', 2: 'COMPLETE', 3: 'QUEUED', 4: 'COMPLETE', 5: 'FAILED'}
+
+
+class FakeCursor:
+    description = [('id',), ('status',), ('processor',), ('priority',), ('granule',)]
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def close(self):
+        pass
+
+
+def test_job_queue_postgres_order():
+    # UPDATE ... RETURNING gives back the claimed rows in no particular order
+    cursor = FakeCursor([
+        (4, 'PROCESSING', 'geocode_gamma', 0, 'd'),
+        (7, 'PROCESSING', 'geocode_gamma', 5, 'g'),
+        (2, 'PROCESSING', 'geocode_gamma', 0, 'b'),
+        (9, 'PROCESSING', 'geocode_gamma', 5, 'i'),
+    ])
+    conn = FakeConnection(cursor)
+    queue = intake.JobQueue(lambda: conn, 'geocode_gamma')
+
+    jobs = queue.claim(4)
+    assert [job['granule'] for job in jobs] == ['g', 'i', 'b', 'd']
+    assert 'FOR UPDATE SKIP LOCKED' in cursor.statements[0]
+    assert conn.committed
+
+    cursor.rows = []
+    assert queue.claim(4) == []
+
+
+class FakeQueue:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.requeued = []
+
+    def claim(self, limit):
+        return self.batches.pop(0) if self.batches else []
+
+    def requeue(self, ids):
+        self.requeued.extend(ids)
+
+
+def test_intake_prefetches_batches():
+    queue = FakeQueue([[{'id': 1}, {'id': 2}], [{'id': 3}]])
+    jobs = intake.Intake(queue, batch_size=2, min_wait=0.01)
+    assert [jobs.next_job()['id'] for _ in range(3)] == [1, 2, 3]
+    assert jobs.claims == 2
+
+
+def test_intake_backs_off_and_wakes_up():
+    queue = FakeQueue([])
+    jobs = intake.Intake(queue, min_wait=0.01, max_wait=0.04)
+    stop = threading.Event()
+    threading.Timer(0.3, stop.set).start()
+    assert jobs.next_job(stop) is None
+    assert jobs.wait == 0.04
+    # waited longer and longer instead of claiming every min_wait
+    assert jobs.claims < 15
+
+    jobs = intake.Intake(queue, min_wait=10.0, max_wait=10.0)
+    threading.Timer(0.1, lambda: queue.batches.append([{'id': 7}])).start()
+    threading.Timer(0.2, jobs.notify).start()
+    start = time.perf_counter()
+    assert jobs.next_job()['id'] == 7
+    assert time.perf_counter() - start < 5
+
+
+def test_intake_close():
+    queue = FakeQueue([[{'id': 1}, {'id': 2}, {'id': 3}]])
+    jobs = intake.Intake(queue, batch_size=3)
+    assert jobs.next_job()['id'] == 1
+    jobs.close()
+    assert queue.requeued == [2, 3]
+
+
+def _process_job(cfg, n):
+    with open(os.path.join(cfg['workdir'], 'processed'), 'w') as f:
+        f.write(cfg['granule'])
+    if cfg['granule'] == 'failed':
+        return False
+    if cfg['granule'] == 'raised':
+        raise RuntimeError('Processing failed')
+    if cfg['granule'] == 'killed':
+        os.kill(os.getpid(), signal.SIGKILL)
+    if cfg['granule'] == 'stopped':
+        os.kill(os.getpid(), signal.SIGUSR1)
+
+
+def _run_intake(tmp_path, granules, **kwargs):
+    queue = _job_queue(tmp_path, [('QUEUED', 'geocode_gamma', 0, granule) for granule in granules])
+    jobs = intake.Intake(queue, batch_size=2, min_wait=0.05, max_wait=0.1)
+    admission = worker.Admission(worker.JobBudget(cpus=1, memory=1, disk=0), scratch_dir=str(tmp_path), cpus=2,
+                                 memory=64 * worker.GB, poll_time=0.1)
+
+    def stop():
+        admission.shutdown.set()
+        jobs.notify()
+    threading.Timer(2, stop).start()
+    worker.run_intake(jobs, admission, 2, 'geocode_gamma', _process_job, workdir=str(tmp_path), **kwargs)
+    assert list(admission._reserved) == [0, 0]
+    return _statuses(queue)
+
+
+def test_run_intake(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, 'available_memory', lambda: 64 * worker.GB)
+    statuses = _run_intake(tmp_path, 'abc', configure=lambda job: dict(job, granule=job['granule'].upper()))
+
+    for id_, granule in enumerate('ABC', start=1):
+        assert (tmp_path / 'job{}'.format(id_) / 'processed').read_text() == granule
+    assert len(list((tmp_path / 'logs').iterdir())) == 3
+    assert set(statuses.values()) == {'COMPLETE'}
+
+
+def test_run_intake_records_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, 'available_memory', lambda: 64 * worker.GB)
+    statuses = _run_intake(tmp_path, ['ok', 'failed', 'raised', 'killed', 'stopped'])
+
+    assert statuses == {1: 'COMPLETE', 2: 'FAILED', 3: 'FAILED', 4: 'FAILED', 5: 'QUEUED'}
@@ -0,0 +1,92 @@
+import os
+
+from hyp3_geocode import lookup_table
+
+
+def _write_lookup_table(small_map, size):
+    with open(f'{small_map}.par', 'w') as f:
+        f.write('width: 10\n')
+    with open(f'{small_map}.utm_to_rdc', 'wb') as f:
+        f.write(b'\0' * size)
+
+
+MLI_PAR = '''Gamma Interferometric SAR Processor (ISP) - Image Parameter File
+
+title:     s1a-iw-grd-{pol}-20200101t000000-20200101t000025-030000-036000-001
+sensor:    S1A IW {POL}
+date:      2020 1 1 0 0 0.0000
+start_time:               1.000000   s
+center_time:             13.500000   s
+end_time:                26.000000   s
+azimuth_line_time:     1.5000000e-03   s
+line_header_size:                  0
+range_samples:                 {samples}
+azimuth_lines:                  8333
+range_looks:                       3
+azimuth_looks:                     3
+image_format:                  FLOAT
+image_geometry:          GROUND_RANGE
+range_pixel_spacing:       30.000000   m
+azimuth_pixel_spacing:     30.000000   m
+near_range_slc:         799887.4532  m
+receiver_gain:               {gain}   dB
+calibration_gain:            {gain}   dB
+sar_to_earth_center:             7071357.0871   m
+earth_radius_below_sensor:       6367953.5720   m
+number_of_state_vectors:          2
+time_of_first_state_vector:     0.000000   s
+state_vector_interval:         10.000000   s
+state_vector_position_1:  -2307221.1860   -5440236.7650    3941556.0350   m   m   m
+state_vector_velocity_1:     -4179.6180        -2290.0030       -5588.1290   m/s m/s m/s
+state_vector_position_2:  -2349002.6410   -5462998.2880    3885664.5450   m   m   m
+state_vector_velocity_2:     -4176.1210        -2262.4740       -5590.1080   m/s m/s m/s
+'''
+
+
+def test_lookup_table_key(tmp_path):
+    vv_par = tmp_path / 'vv.mgrd.par'
+    vv_par.write_text(MLI_PAR.format(pol='vv', POL='VV', samples=8424, gain=0.0))
+    vh_par = tmp_path / 'vh.mgrd.par'
+    vh_par.write_text(MLI_PAR.format(pol='vh', POL='VH', samples=8424, gain=-1.5))
+    area_map = tmp_path / 'area_map.par'
+    area_map.write_text('width: 10\n')
+
+    # Co-pol and cross-pol MLIs differ in their title, sensor, and gains, but not in their geometry
+    vv_key = lookup_table.lookup_table_key(str(vv_par), str(area_map), 0)
+    assert vv_key == lookup_table.lookup_table_key(str(vh_par), str(area_map), 0.0)
+    assert vv_key != lookup_table.lookup_table_key(str(vv_par), str(area_map), 100)
+
+    vh_par.write_text(MLI_PAR.format(pol='vh', POL='VH', samples=8425, gain=-1.5))
+    assert vv_key != lookup_table.lookup_table_key(str(vh_par), str(area_map), 0)
+
+    orbit = MLI_PAR.format(pol='vh', POL='VH', samples=8424, gain=-1.5).replace('-2307221.1860', '-2307221.2000')
+    vh_par.write_text(orbit)
+    assert vv_key != lookup_table.lookup_table_key(str(vh_par), str(area_map), 0)
+
+    area_map.write_text('width: 11\n')
+    assert vv_key != lookup_table.lookup_table_key(str(vv_par), str(area_map), 0)
+
+
+def test_lookup_table_cache(tmp_path):
+    cache = lookup_table.LookupTableCache(str(tmp_path / 'cache'), max_bytes=250)
+
+    first = str(tmp_path / 'first_small_map')
+    with cache.lookup('a', first) as hit:
+        assert not hit
+        _write_lookup_table(first, 100)
+
+    second = str(tmp_path / 'second_small_map')
+    with cache.lookup('a', second) as hit:
+        assert hit
+    assert os.path.getsize(f'{second}.utm_to_rdc') == 100
+
+    with cache.lookup('b', first) as hit:
+        assert not hit
+    assert os.path.isdir(os.path.join(cache.cache_dir, 'a'))
+
+    # over budget, so the least recently used lookup table is evicted
+    with cache.lookup('c', first) as hit:
+        assert not hit
+    assert not os.path.isdir(os.path.join(cache.cache_dir, 'a'))
+    assert os.path.isdir(os.path.join(cache.cache_dir, 'b'))
+    assert os.path.isdir(os.path.join(cache.cache_dir, 'c'))
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+
+from hyp3_geocode import metrics
+
+
+def test_stage(tmp_path):
+    metrics.reset()
+    with metrics.stage('gec_map', pol='vv'):
+        subprocess.run(['true'])
+
+    record, = metrics.records()
+    assert record['stage'] == 'gec_map'
+    assert record['pol'] == 'vv'
+    assert record['wall_time'] >= 0
+    assert record['peak_rss'] > 0
+    for key in ('cpu_time', 'children_user_time', 'children_system_time', 'read_bytes', 'write_bytes'):
+        assert key in record
+
+    metrics_file = str(tmp_path / 'metrics.json')
+    metrics.write_metrics(metrics_file)
+    metrics.reset()
+    assert metrics.records() == []
+
+    metrics.add_records(metrics.read_metrics(metrics_file))
+    assert metrics.records() == [record]
+
+
+def test_stage_peak_rss():
+    metrics.reset()
+    with metrics.stage('big'):
+        data = bytearray(200 * 1024 * 1024)
+        data[::4096] = b'\1' * len(data[::4096])
+        subprocess.run([sys.executable, '-c', 'bytearray(100 * 1024 * 1024)'])
+        del data
+    with metrics.stage('small'):
+        subprocess.run(['true'])
+
+    big, small = metrics.records()
+    assert big['children_peak_rss'] >= 100 * 1024 * 1024
+    # The earlier stage's peaks aren't carried over
+    assert small['children_peak_rss'] is None
+    if small['peak_rss'] is not None:
+        assert small['peak_rss'] < big['peak_rss'] - 100 * 1024 * 1024
@@ -0,0 +1,111 @@
+import os
+import shutil
+import struct
+import subprocess
+import zipfile
+
+import numpy as np
+import pytest
+
+from hyp3_geocode import packaging
+
+
+def _write_tiff(tiff_file, compression, endian='<'):
+    # A classic TIFF with just a Compression tag in its first IFD
+    byte_order = b'II' if endian == '<' else b'MM'
+    with open(tiff_file, 'wb') as f:
+        f.write(byte_order + struct.pack(endian + 'HI', 42, 8))
+        f.write(struct.pack(endian + 'H', 1))
+        f.write(struct.pack(endian + 'HHIHH', 259, 3, 1, compression, 0))
+        f.write(struct.pack(endian + 'I', 0))
+
+
+def test_tiff_is_compressed(tmp_path):
+    for endian in '<>':
+        tiff_file = str(tmp_path / 'image.tif')
+        _write_tiff(tiff_file, 1, endian)
+        assert not packaging.tiff_is_compressed(tiff_file)
+        _write_tiff(tiff_file, 5, endian)
+        assert packaging.tiff_is_compressed(tiff_file)
+
+    (tmp_path / 'not_a.tif').write_bytes(b'garbage')
+    assert not packaging.tiff_is_compressed(str(tmp_path / 'not_a.tif'))
+
+
+def test_zip_product(tmp_path):
+    product = tmp_path / 'S1A_IW_RT30_20200101T000000_G_gpn'
+    (product / 'sub').mkdir(parents=True)
+    data = np.random.default_rng(0).integers(0, 4, 300000, dtype=np.uint8).tobytes()
+    (product / 'S1A_IW_RT30_20200101T000000_G_gpn_VV.tif').write_bytes(data)
+    (product / 'S1A_IW_RT30_20200101T000000_G_gpn.png').write_bytes(data[:1000])
+    (product / 'sub' / 'empty.txt').write_bytes(b'')
+    _write_tiff(str(product / 'compressed.tif'), 8)
+
+    zip_file = str(tmp_path / 'product.zip')
+    packaging.zip_product(str(product), zip_file, jobs=3, chunk_size=64 * 1024)
+
+    with zipfile.ZipFile(zip_file) as zf:
+        assert zf.testzip() is None
+        infos = {info.filename: info for info in zf.infolist()}
+        prefix = 'S1A_IW_RT30_20200101T000000_G_gpn/'
+        assert sorted(infos) == sorted(prefix + name for name in (
+            'S1A_IW_RT30_20200101T000000_G_gpn_VV.tif', 'S1A_IW_RT30_20200101T000000_G_gpn.png',
+            'compressed.tif', 'sub/empty.txt'
+        ))
+        assert zf.read(prefix + 'S1A_IW_RT30_20200101T000000_G_gpn_VV.tif') == data
+        assert infos[prefix + 'S1A_IW_RT30_20200101T000000_G_gpn_VV.tif'].compress_type == zipfile.ZIP_DEFLATED
+        assert infos[prefix + 'S1A_IW_RT30_20200101T000000_G_gpn.png'].compress_type == zipfile.ZIP_STORED
+        assert infos[prefix + 'compressed.tif'].compress_type == zipfile.ZIP_STORED
+        assert zf.read(prefix + 'sub/empty.txt') == b''
+    assert os.path.getsize(zip_file) < len(data)
+
+
+def _product(tmp_path, data):
+    product = tmp_path / 'product'
+    (product / 'sub').mkdir(parents=True)
+    (product / 'image.tif').write_bytes(data)
+    (product / 'browse.png').write_bytes(data[:5000])
+    (product / 'sub' / 'empty.txt').write_bytes(b'')
+    return product
+
+
+def _check_archive(zip_file, product):
+    with zipfile.ZipFile(zip_file) as zf:
+        assert zf.testzip() is None
+        for name in ('image.tif', 'browse.png', 'sub/empty.txt'):
+            assert zf.read('product/' + name) == (product / name).read_bytes()
+    if shutil.which('unzip'):
+        subprocess.run(['unzip', '-tq', zip_file], check=True, stdout=subprocess.DEVNULL)
+
+
+@pytest.mark.parametrize('chunk_size', [1024, 64 * 1024])
+def test_zip_product_round_trip(tmp_path, chunk_size):
+    # Random data doesn't compress, so deflating it makes it grow
+    data = np.random.default_rng(1).integers(0, 256, 300000, dtype=np.uint8).tobytes()
+    product = _product(tmp_path, data)
+    zip_file = str(tmp_path / 'product.zip')
+    packaging.zip_product(str(product), zip_file, jobs=2, chunk_size=chunk_size)
+
+    _check_archive(zip_file, product)
+    with zipfile.ZipFile(zip_file) as zf:
+        info = zf.getinfo('product/image.tif')
+        assert len(data) < info.compress_size <= packaging._deflate_bound(len(data), chunk_size)
+
+
+def test_zip_product_zip64(tmp_path, monkeypatch):
+    # Small enough that the large member's sizes and the later offsets all need ZIP64 records
+    monkeypatch.setattr(packaging, '_ZIP64_LIMIT', 50000)
+    data = np.random.default_rng(2).integers(0, 4, 300000, dtype=np.uint8).tobytes()
+    product = _product(tmp_path, data)
+    # Its local header reserves ZIP64 sizes, but it ends up small enough not to need them
+    (product / 'sub' / 'zeros.tif').write_bytes(b'\0' * 45000)
+    zip_file = str(tmp_path / 'product.zip')
+    packaging.zip_product(str(product), zip_file, jobs=2, chunk_size=64 * 1024)
+
+    _check_archive(zip_file, product)
+    with zipfile.ZipFile(zip_file) as zf:
+        assert zf.read('product/sub/zeros.tif') == b'\0' * 45000
+    with open(zip_file, 'rb') as f:
+        archive = f.read()
+    assert struct.pack('<I', 0x06064b50) in archive  # the ZIP64 end of central directory record
+    assert struct.pack('<HH', 0x0001, 16) in archive  # a ZIP64 local header extra field
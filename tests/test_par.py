@@ -0,0 +1,86 @@
+import pytest
+
+from hyp3_geocode import par
+
+# Written by GAMMA's create_dem_par for a 30 m area map in UTM zone 11
+GAMMA_DEM_PAR = '''Gamma DIFF&GEO DEM/MAP parameter file
+title:  S1A_IW_RT30_20200101T000000_G_gpn_area_map
+DEM_projection:     UTM
+data_format:        REAL*4
+DEM_hgt_offset:          0.00000
+DEM_scale:               1.00000
+width:                  9342
+nlines:                 7008
+corner_north:  4031790.000  m
+corner_east:    227220.000  m
+post_north:    -30.0000000  m
+post_east:      30.0000000  m
+
+ellipsoid_name: WGS 84
+ellipsoid_ra:        6378137.000   m
+ellipsoid_reciprocal_flattening:  298.2572236
+
+datum_name: WGS 1984
+datum_shift_dx:              0.000   m
+datum_shift_dy:              0.000   m
+datum_shift_dz:              0.000   m
+datum_scale_m:         0.00000e+00
+datum_rotation_alpha:  0.00000e+00   arc-sec
+datum_rotation_beta:   0.00000e+00   arc-sec
+datum_rotation_gamma:  0.00000e+00   arc-sec
+datum_country_list Global Definition, WGS84, World
+
+projection_name: UTM
+projection_zone:                 11
+false_easting:           500000.000   m
+false_northing:               0.000   m
+projection_k0:            0.9996000
+center_longitude:     -117.0000000   decimal degrees
+center_latitude:         0.0000000   decimal degrees
+
+'''
+
+
+def test_parameters():
+    params = par.Parameters.parse(GAMMA_DEM_PAR)
+    assert params.header == par.DEM_PAR_HEADER
+    assert params.text('data_format') == 'REAL*4'
+    assert params.integer('width') == 9342
+    assert params.number('corner_north') == 4031790.0
+    assert params.numbers('post_north') == [-30.0]
+    assert params['ellipsoid_name'] == 'WGS 84'
+    assert 'datum_country_list' not in params
+
+    with pytest.raises(par.ParameterError):
+        params['range_samples']
+    with pytest.raises(ValueError):
+        params.number('DEM_projection')
+
+    assert par.Parameters.parse(params.dumps()).values == params.values
+
+
+def test_utm_dem_par_matches_create_dem_par():
+    expected = par.Parameters.parse(GAMMA_DEM_PAR)
+    params = par.utm_dem_par('S1A_IW_RT30_20200101T000000_G_gpn_area_map', 'REAL*4', 9342, 7008,
+                             4031790.0, 227220.0, 30.0, 11, 0)
+
+    assert list(params.values) == [key for key in expected.values]
+    for key in expected.values:
+        if expected.numbers(key):
+            assert params.numbers(key) == pytest.approx(expected.numbers(key)), key
+        else:
+            assert params[key] == expected[key], key
+
+
+def test_read_par_cache(tmp_path):
+    par_file = str(tmp_path / 'area_map.par')
+    with open(par_file, 'w') as f:
+        f.write(GAMMA_DEM_PAR)
+
+    params = par.read_par(par_file)
+    assert par.read_par(par_file) is params
+
+    changed = par.Parameters.parse(GAMMA_DEM_PAR)
+    changed.values['width'] = '10000'
+    changed.write(par_file)
+    assert par.read_par(par_file).integer('width') == 10000
@@ -0,0 +1,95 @@
+import os
+
+import hyp3_geocode
+from hyp3_geocode import product_cache
+from hyp3_geocode.artifacts import ArtifactManifest
+
+
+def _make_product(product_dir, name, size):
+    os.makedirs(product_dir)
+    with open(os.path.join(product_dir, '{}_VV.tif'.format(name)), 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_product_key(monkeypatch):
+    parameters = product_cache.product_parameters('S1A_A', 30, '0', post=30, cog=False)
+    key = product_cache.product_key(parameters)
+    assert key == product_cache.product_key(
+        product_cache.product_parameters('S1A_A', 30.0, 0, cog=False, post=30)
+    )
+    assert key != product_cache.product_key(product_cache.product_parameters('S1A_A', 30, '100'))
+    assert key != product_cache.product_key(
+        product_cache.product_parameters('S1A_A', 30, '0', gamma0=True, post=30, cog=False)
+    )
+
+    monkeypatch.setattr(hyp3_geocode, '__version__', '99.0.0')
+    assert key != product_cache.product_key(
+        product_cache.product_parameters('S1A_A', 30, '0', post=30, cog=False)
+    )
+
+
+def test_product_cache(tmp_path, monkeypatch):
+    cache = product_cache.ProductCache(str(tmp_path / 'cache'))
+
+    first = str(tmp_path / 'first' / 'PRODUCT')
+    with cache.lookup('a', first, 'S1A_RT30_A', parameters={'granule': 'S1A_A'}) as hit:
+        assert not hit
+        _make_product(first, 'S1A_RT30_A', 100)
+
+    second = str(tmp_path / 'second' / 'PRODUCT')
+    with cache.lookup('a', second, 'S1A_RT30_A') as hit:
+        assert hit
+    fetched = os.path.join(second, 'S1A_RT30_A_VV.tif')
+    assert os.path.getsize(fetched) == 100
+
+    # Fetched products are clipped in place, which mustn't change the cached copy
+    with open(fetched, 'wb') as f:
+        f.write(b'\1' * 10)
+    third = str(tmp_path / 'third' / 'PRODUCT')
+    assert cache.fetch('a', third, 'S1A_RT30_A')
+    assert os.path.getsize(os.path.join(third, 'S1A_RT30_A_VV.tif')) == 100
+
+    # Products made by another version are dropped the next time one is stored
+    monkeypatch.setattr(hyp3_geocode, '__version__', '99.0.0')
+    fourth = str(tmp_path / 'fourth' / 'PRODUCT')
+    _make_product(fourth, 'S1A_RT30_B', 100)
+    cache.store('b', fourth, 'S1A_RT30_B')
+    assert not cache.fetch('a', str(tmp_path / 'fifth' / 'PRODUCT'), 'S1A_RT30_A')
+    assert cache.fetch('b', str(tmp_path / 'fifth' / 'PRODUCT'), 'S1A_RT30_B')
+
+
+def test_product_cache_eviction(tmp_path):
+    cache = product_cache.ProductCache(str(tmp_path / 'cache'), max_bytes=2500)
+    for index, key in enumerate(['a', 'b']):
+        product_dir = str(tmp_path / key / 'PRODUCT')
+        _make_product(product_dir, key, 1000)
+        cache.store(key, product_dir, key)
+        os.utime(os.path.join(cache.cache_dir, key), (index, index))
+
+    assert cache.fetch('a', str(tmp_path / 'again' / 'PRODUCT'), 'a')
+    product_dir = str(tmp_path / 'c' / 'PRODUCT')
+    _make_product(product_dir, 'c', 1000)
+    cache.store('c', product_dir, 'c')
+
+    assert not os.path.isdir(os.path.join(cache.cache_dir, 'b'))
+    for key in ['a', 'c']:
+        assert os.path.isdir(os.path.join(cache.cache_dir, key))
+
+
+def test_product_cache_renames(tmp_path):
+    cache = product_cache.ProductCache(str(tmp_path / 'cache'))
+    # Subscriptions with different output names (e.g., suffixes) make the same request
+    key = product_cache.product_key(product_cache.product_parameters('S1A_A', 30, 0, post=30, cog=False))
+
+    first = str(tmp_path / 'first' / 'PRODUCT')
+    with cache.lookup(key, first, 'S1A_RT30_A_sub1') as hit:
+        assert not hit
+        _make_product(first, 'S1A_RT30_A_sub1', 100)
+        ArtifactManifest.from_directory(first, 30).write(os.path.join(first, 'S1A_RT30_A_sub1_artifacts.json'))
+
+    second = str(tmp_path / 'second' / 'PRODUCT')
+    with cache.lookup(key, second, 'S1A_RT30_A_sub2') as hit:
+        assert hit
+    assert sorted(os.listdir(second)) == ['S1A_RT30_A_sub2_VV.tif', 'S1A_RT30_A_sub2_artifacts.json']
+    manifest = ArtifactManifest.read(os.path.join(second, 'S1A_RT30_A_sub2_artifacts.json'))
+    assert [artifact.path for artifact in manifest.find('geotiff', pol='vv')] == ['S1A_RT30_A_sub2_VV.tif']
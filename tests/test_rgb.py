@@ -0,0 +1,34 @@
+import numpy as np
+from hyp3lib.rtc2color import rtc2color
+from osgeo import gdal, osr
+
+from hyp3_geocode import rgb
+
+
+def _write_tif(filename, data):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32610)
+    raster = gdal.GetDriverByName('GTiff').Create(filename, data.shape[1], data.shape[0], 1, gdal.GDT_Float32)
+    raster.SetGeoTransform((500000.0, 30.0, 0, 4000000.0, 0, -30.0))
+    raster.SetProjection(srs.ExportToWkt())
+    raster.GetRasterBand(1).WriteArray(data)
+    raster = None
+
+
+def test_rgb_decomposition(tmp_path):
+    rng = np.random.default_rng(7)
+    copol = rng.random((37, 23), dtype=np.float32)
+    crosspol = rng.random((37, 23), dtype=np.float32) * 0.2
+    crosspol[:3] = 0.0
+    copol_tif, crosspol_tif = str(tmp_path / 'copol.tif'), str(tmp_path / 'crosspol.tif')
+    _write_tif(copol_tif, copol)
+    _write_tif(crosspol_tif, crosspol)
+
+    expected_tif, out_tif = str(tmp_path / 'expected.tif'), str(tmp_path / 'out.tif')
+    rtc2color(copol_tif, crosspol_tif, -24, expected_tif, amp=True, cleanup=True)
+    rgb.rgb_decomposition(copol_tif, crosspol_tif, -24, out_tif, amp=True, cleanup=True, block_rows=5)
+
+    expected, out = gdal.Open(expected_tif), gdal.Open(out_tif)
+    assert out.GetGeoTransform() == expected.GetGeoTransform()
+    for band in (1, 2, 3):
+        assert np.array_equal(out.GetRasterBand(band).ReadAsArray(), expected.GetRasterBand(band).ReadAsArray())
@@ -0,0 +1,56 @@
+import os
+import zipfile
+
+from hyp3_geocode import safe
+
+GRANULE = 'S1A_IW_GRDH_1SDV_20200101T000000_20200101T000025_030000_037000_ABCD'
+
+
+def _members(pols):
+    safe_dir = f'{GRANULE}.SAFE'
+    members = [f'{safe_dir}/manifest.safe', f'{safe_dir}/preview/quick-look.png', f'{safe_dir}/support/s1-object.xsd']
+    for pol in pols:
+        name = f's1a-iw-grd-{pol}-20200101t000000-20200101t000025-030000-037000-001'
+        members += [
+            f'{safe_dir}/measurement/{name}.tiff',
+            f'{safe_dir}/annotation/{name}.xml',
+            f'{safe_dir}/annotation/calibration/calibration-{name}.xml',
+            f'{safe_dir}/annotation/calibration/noise-{name}.xml',
+        ]
+    return members
+
+
+def test_processed_polarizations():
+    assert safe.processed_polarizations({'vv', 'vh'}) == ['vv', 'vh']
+    assert safe.processed_polarizations({'hh'}) == ['hh']
+    assert safe.processed_polarizations({'vh'}) == []
+
+
+def test_safe_members():
+    names = _members(['vv', 'vh'])
+    assert safe.safe_members(names) == [name for name in names if '/preview/' not in name and '/support/' not in name]
+
+    selected = safe.safe_members(names, polarizations=['vv'])
+    assert f'{GRANULE}.SAFE/manifest.safe' in selected
+    assert all('-vh-' not in name for name in selected)
+    assert len(selected) == 5
+
+
+def test_extract_safe(tmp_path):
+    zip_file = str(tmp_path / f'{GRANULE}.zip')
+    with zipfile.ZipFile(zip_file, 'w') as zf:
+        for name in _members(['vv', 'vh']):
+            zf.writestr(name, name)
+
+    dest = tmp_path / 'work'
+    safe_dir = safe.extract_safe(zip_file, str(dest))
+    assert safe_dir == str(dest / f'{GRANULE}.SAFE')
+    assert os.path.isfile(os.path.join(safe_dir, 'manifest.safe'))
+    assert len(os.listdir(os.path.join(safe_dir, 'measurement'))) == 2
+    assert not os.path.exists(os.path.join(safe_dir, 'preview'))
+
+    tiff = os.path.join(safe_dir, 'measurement', os.listdir(os.path.join(safe_dir, 'measurement'))[0])
+    mtime = os.path.getmtime(tiff)
+    os.utime(tiff, (mtime - 100, mtime - 100))
+    safe.extract_safe(zip_file, str(dest))
+    assert os.path.getmtime(tiff) == mtime - 100
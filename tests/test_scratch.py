@@ -0,0 +1,46 @@
+from hyp3_geocode import scratch
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\1' * size)
+
+
+def test_scratch_dir(tmp_path):
+    scratch_dir = scratch.ScratchDir(str(tmp_path / 'job_scratch'))
+    mgrd, utm = scratch_dir.path('job.vv.mgrd'), scratch_dir.path('job.vv.utm')
+    _write(mgrd, 64 * 1024)
+    _write(utm, 32 * 1024)
+
+    scratch_dir.release(mgrd)
+    assert scratch_dir.peak >= 96 * 1024
+    assert not (tmp_path / 'job_scratch' / 'job.vv.mgrd').exists()
+    assert (tmp_path / 'job_scratch' / 'job.vv.utm').exists()
+
+    # already released
+    scratch_dir.release(mgrd)
+
+    scratch_dir.remove()
+    assert not (tmp_path / 'job_scratch').exists()
+    assert scratch_dir.peak >= 96 * 1024
+
+
+def test_scratch_dir_keep(tmp_path):
+    scratch_dir = scratch.ScratchDir(str(tmp_path / 'job_scratch'), keep=True)
+    safe = tmp_path / 'job_scratch' / 'granule.SAFE' / 'measurement'
+    safe.mkdir(parents=True)
+    _write(str(safe / 'vv.tiff'), 16 * 1024)
+
+    scratch_dir.release(str(safe.parent))
+    scratch_dir.remove()
+    assert (safe / 'vv.tiff').exists()
+
+
+def test_scratch_dir_monitor(tmp_path):
+    scratch_dir = scratch.ScratchDir(str(tmp_path))
+    with scratch_dir.monitor(interval=0.01):
+        _write(str(tmp_path / 'big'), 128 * 1024)
+        (tmp_path / 'big').unlink()
+        _write(str(tmp_path / 'small'), 8 * 1024)
+    assert scratch_dir.peak >= 8 * 1024
+    assert scratch.disk_usage(str(tmp_path)) < 128 * 1024
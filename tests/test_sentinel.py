@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+from hyp3lib import asf_geometry
+
+from hyp3_geocode import radiometry, sentinel
+from hyp3_geocode.par import read_par
+
+
+def _blank_bad_data_loop(data, left, right):
+    data = data.copy()
+    y, x = data.shape
+    for i in range(y):
+        for j in range(x):
+            if data[i, j] != 0:
+                data[i, :j + left] = 0
+                break
+        for j in range(x - 1, 0, -1):
+            if data[i, j] != 0:
+                data[i, j - right:] = 0
+                break
+    return data
+
+
+def test_blank_bad_data(tmp_path):
+    rng = np.random.default_rng(42)
+    y, x = 50, 64
+    data = rng.random((y, x), dtype=np.float32) + 0.5
+    for i in range(y):
+        start, stop = sorted(rng.integers(0, x + 1, 2))
+        data[i, :start] = 0
+        data[i, stop:] = 0
+    data[3] = 0
+    data[4, 1:] = 0
+    data[5, 7] = -0.0
+
+    raw_file = tmp_path / 'test.mgrd'
+    data.astype('>f4').tofile(raw_file)
+
+    sentinel.blank_bad_data(str(raw_file), x, y, left=5, right=5, block_rows=7)
+
+    expected = _blank_bad_data_loop(data, 5, 5).astype('>f4')
+    assert raw_file.read_bytes() == expected.tobytes()
+
+
+def test_create_dem_par_roi(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    granule = (10, 0, 4000005.0, 4200005.0, 500005.0, 700005.0)
+    monkeypatch.setattr(asf_geometry, 'geometry_geo2proj', lambda *bounds: granule)
+    monkeypatch.setattr(sentinel, '_project_bounds', lambda epsg, *roi: (4100012.0, 4150012.0, 400000.0, 550012.0))
+
+    full = read_par(sentinel.create_dem_par('full', 'float', 10.0, 38.0, 36.0, -115.0, -117.0, 30.0))
+    roi = read_par(sentinel.create_dem_par(
+        'roi', 'float', 10.0, 38.0, 36.0, -115.0, -117.0, 30.0, roi=(37.5, 37.0, -116.0, -118.0)
+    ))
+    assert (full.number('corner_north'), full.number('corner_east')) == (4200030.0, 499980.0)
+    assert (full.integer('width'), full.integer('nlines')) == (20004, 20004)
+
+    # The region's corner is on the same 30 m grid as the full granule's, and it's clipped to the granule
+    assert (roi.number('corner_north'), roi.number('corner_east')) == (4150020.0, 499980.0)
+    assert (roi.integer('width'), roi.integer('nlines')) == (5004, 5001)
+    assert roi.integer('projection_zone') == 10
+
+
+def _fake_gamma(monkeypatch, calls):
+    from hyp3lib import ingest_S1_granule
+
+    def ingest(infile, pol, look_fact, mgrd, orbit_file=None):
+        calls.append('ingest')
+        with open(mgrd, 'wb') as f:
+            f.write(b'\0' * 4 * 40 * 10)
+        with open(f'{mgrd}.par', 'w') as f:
+            f.write('range_samples: 40\nazimuth_lines: 10\n')
+
+    def gec_map(mli_par, offset, area_map, height, small_map, cache=None):
+        calls.append('gec_map')
+        with open(f'{small_map}.par', 'w') as f:
+            f.write('width: 20\n')
+        with open(f'{small_map}.utm_to_rdc', 'wb') as f:
+            f.write(b'\1' * 100)
+
+    def execute(command, uselogging=False):
+        program, *args = command.split()
+        calls.append(program)
+        with open(args[3], 'wb') as f:
+            f.write(program.encode('utf-8'))
+
+    monkeypatch.setattr(ingest_S1_granule, 'ingest_S1_granule', ingest)
+    monkeypatch.setattr(sentinel, 'gec_map', gec_map)
+    monkeypatch.setattr(sentinel, 'execute', execute)
+    monkeypatch.setattr(radiometry, 'execute', execute)
+
+
+def test_process_pol_resume(tmp_path, monkeypatch):
+    calls = []
+    _fake_gamma(monkeypatch, calls)
+    monkeypatch.chdir(tmp_path)
+    manifest = str(tmp_path / 'out_checkpoints.json')
+
+    def process_pol(resume, height=0, gamma0_flag=False):
+        scratch = sentinel.ScratchDir(str(tmp_path / 'scratch'))
+        sentinel.process_pol('vv', 'GRD', 'in.SAFE', 'out', 30.0, height, gamma0_flag=gamma0_flag, scratch=scratch,
+                             checkpoints=sentinel.Checkpoints(manifest, resume=resume))
+
+    process_pol(resume=False)
+    assert calls == ['ingest', 'gec_map', 'geocode_back', 'data2geotiff']
+    assert os.listdir(tmp_path / 'scratch') == []
+
+    # The intermediates were released, but the GeoTIFF they made is still valid
+    del calls[:]
+    process_pol(resume=True)
+    assert calls == []
+
+    # Interrupted after geocode_back: only the GeoTIFF is made again
+    os.remove('out_vv.tif')
+    scratch = sentinel.ScratchDir(str(tmp_path / 'scratch'), keep=True)
+    sentinel.process_pol('vv', 'GRD', 'in.SAFE', 'out', 30.0, 0, scratch=scratch,
+                         checkpoints=sentinel.Checkpoints(manifest))
+    os.remove('out_vv.tif')
+    del calls[:]
+    process_pol(resume=True)
+    assert calls == ['data2geotiff']
+
+    # Different upstream parameters make the stages that depend on them again, even once the intermediates are gone
+    del calls[:]
+    process_pol(resume=True, height=500)
+    assert calls == ['gec_map', 'geocode_back', 'data2geotiff']
+    del calls[:]
+    process_pol(resume=True, height=500, gamma0_flag=True)
+    assert calls == ['ingest', 'radcal_MLI', 'radcal_MLI', 'gec_map', 'geocode_back', 'data2geotiff']
+    del calls[:]
+    process_pol(resume=True, height=500, gamma0_flag=True)
+    assert calls == []
+
+
+def test_move_products(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    names = ['out_vv.tif', 'out.png', 'out.png.aux.xml', 'out.kmz', 'out_1234_log.txt']
+    for name in names + ['out.vv.mgrd', '.hidden.tif']:
+        (tmp_path / name).write_bytes(b'')
+
+    assert sentinel.move_products() == sorted(names)
+    assert sorted(os.listdir('PRODUCT')) == sorted(names)
+    assert sentinel.move_products() == []
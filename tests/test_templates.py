@@ -0,0 +1,16 @@
+from hyp3_geocode import templates
+
+
+def test_render(tmp_path):
+    template_file = tmp_path / 'template.xml'
+    template_file.write_bytes(b'<a>[DATE]</a><b>[DATETIME]</b><c>[UNKNOWN]</c>')
+
+    template = templates.compile_template(str(template_file))
+    rendered = templates.render(template, {'DATE': b'20200101', 'DATETIME': b'2020-01-01T00:00:00'})
+    assert rendered == b'<a>20200101</a><b>2020-01-01T00:00:00</b><c>[UNKNOWN]</c>\n'
+
+
+def test_get_template():
+    template = templates.get_template('GeocodingTemplate.xml')
+    assert 'THUMBNAIL_BINARY_STRING' in template
+    assert templates.get_template('GeocodingTemplate.xml') is template
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from hyp3_geocode import worker
+
+
+def test_job_budget_from_environment():
+    budget = worker.JobBudget.from_environment({'GEOCODE_JOB_CPUS': '4', 'GEOCODE_JOB_MEMORY_GB': '0.5'})
+    assert budget.cpus == 4
+    assert budget.memory == worker.GB // 2
+    assert budget.disk == worker.JobBudget().disk
+
+
+def test_admission(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, 'available_memory', lambda: 64 * worker.GB)
+    budget = worker.JobBudget(cpus=2, memory=10 * worker.GB, disk=0)
+    admission = worker.Admission(budget, scratch_dir=str(tmp_path), cpus=5, memory=64 * worker.GB)
+    assert admission.max_jobs() == 2
+
+    assert admission.try_acquire()
+    assert admission.try_acquire()
+    assert not admission.try_acquire()
+    admission.release()
+    assert admission.try_acquire()
+
+    # not enough memory is actually free
+    admission.release()
+    monkeypatch.setattr(worker, 'available_memory', lambda: 8 * worker.GB)
+    assert not admission.try_acquire()
+
+
+def test_admission_lone_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, 'available_memory', lambda: 0)
+    admission = worker.Admission(worker.JobBudget(cpus=64), scratch_dir=str(tmp_path), cpus=2)
+    assert admission.max_jobs() == 1
+    assert admission.try_acquire()
+    assert not admission.try_acquire()
+
+    admission.shutdown.set()
+    assert not admission.acquire()
+
+
+class FakeProcessor:
+    """Runs the one queued job, then polls for more forever"""
+    queued = None
+
+    def __init__(self, name, process_job, *args, **kwargs):
+        self.process_job = process_job
+
+    def run(self):
+        while True:
+            with self.queued.get_lock():
+                job = self.queued.value
+                self.queued.value = 0
+            if job:
+                self.process_job({'workdir': self.workdir, 'granule': 'S1A_A'}, 1)
+            time.sleep(0.1)
+
+
+def _slow_job(cfg, n):
+    time.sleep(3)
+    with open(os.path.join(cfg['workdir'], 'done'), 'w'):
+        pass
+
+
+def test_run_workers_shutdown(tmp_path, monkeypatch):
+    FakeProcessor.queued = multiprocessing.Value('i', 1)
+    FakeProcessor.workdir = str(tmp_path)
+    monkeypatch.setattr(worker, 'Processor', FakeProcessor)
+    admission = worker.Admission(worker.JobBudget(cpus=1, memory=1, disk=0), scratch_dir=str(tmp_path), cpus=4,
+                                 memory=4)
+
+    node = multiprocessing.Process(target=worker.run_workers, args=(admission, 2, 'geocode_gamma', _slow_job))
+    node.start()
+    # The first worker is running the job, so a second one is started to poll for the next
+    time.sleep(2.5)
+    os.kill(node.pid, signal.SIGTERM)
+    node.join(15)
+
+    assert not node.is_alive()
+    assert node.exitcode == 0
+    # The running job finished before the node shut down
+    assert os.path.isfile(tmp_path / 'worker0' / 'done')